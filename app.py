@@ -3,16 +3,30 @@ Flask Database Maintenance Tool - Web-based Interface
 Check, Repair, and Optimize MySQL Tables
 Auto-opens browser on startup
 """
-from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+import time
+APP_LOAD_STARTED = time.time()  # taken before the imports below, for the startup metrics
+
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, url_for
+import io
+import zlib
+import re
 import json
+import hashlib
+import struct
+from array import array
+from collections import Counter
 from datetime import datetime
+from xml.sax.saxutils import escape as xml_escape
 import os
 import sys
-import subprocess
-import webbrowser
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Timer
-import pymysql
-from pymysql import Error as PyMySQLError
+from contextlib import contextmanager, nullcontext
+# pymysql, csv, zipfile, tempfile, mmap, subprocess and webbrowser are imported where they are used,
+# so the packaged exe starts serving before paying for them
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'nagagold-db-maintenance-2026'
@@ -21,8 +35,78 @@ app.config['SECRET_KEY'] = 'nagagold-db-maintenance-2026'
 MYSQL_AVAILABLE = True
 MYSQL_DRIVER = 'pymysql'
 
+
+class StatusList(list):
+    """results/deferred list of a MaintenanceStatus; appends bump the status version"""
+    
+    def __init__(self, values, owner):
+        super().__init__(values)
+        self.owner = owner
+    
+    def append(self, value):
+        super().append(value)
+        self.owner.touch()
+    
+    def extend(self, values):
+        super().extend(values)
+        self.owner.touch()
+
+
+class MaintenanceStatus(dict):
+    """maintenance_status with a change counter, so clients can wait for changes and fetch only new results.
+    
+    version grows on every change and never goes back; epoch grows when a new run replaces the status,
+    so a results cursor from an older run is recognised as stale.
+    """
+    
+    def __init__(self, values):
+        super().__init__()
+        self.version = 0
+        self.epoch = 0
+        self.changed = threading.Condition()
+        self.reset(values)
+    
+    def __setitem__(self, key, value):
+        if isinstance(value, list) and not isinstance(value, StatusList):
+            value = StatusList(value, self)
+        elif key in self and self[key] == value:
+            return
+        super().__setitem__(key, value)
+        self.touch()
+    
+    def touch(self):
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+    
+    def reset(self, values):
+        """Replace the whole status for a new run"""
+        with self.changed:
+            self.epoch += 1
+            self.clear()
+            for key, value in values.items():
+                super().__setitem__(key, StatusList(value, self) if isinstance(value, list) else value)
+            self.touch()
+    
+    def wait(self, version, timeout):
+        """Block until the version differs from version (or timeout); returns the current version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+    
+    def snapshot(self, since=None, epoch=None):
+        """JSON-ready copy; with a results cursor from the same epoch only results[since:] are included"""
+        with self.changed:
+            body = {key: list(value) if isinstance(value, list) else value for key, value in self.items()}
+            start = since if since is not None and epoch == self.epoch and 0 <= since <= len(body['results']) else 0
+            body['results'] = body['results'][start:]
+            body.update(version=self.version, epoch=self.epoch, results_from=start,
+                        results_total=start + len(body['results']))
+            return body
+
+
 # Global variables for progress tracking
-maintenance_status = {
+maintenance_status = MaintenanceStatus({
     'is_running': False,
     'current': 0,
     'total': 0,
@@ -30,14 +114,28 @@ maintenance_status = {
     'message': '',
     'completed': False,
     'error': None,
-    'results': []
-}
+    'results': [],
+    'paused': False,
+    'load': None,
+    'deferred': []
+})
 
 check_results = []
 
+# CHECK TABLE options from cheapest to most thorough
+CHECK_MODES = ('FAST', 'CHANGED', 'QUICK', 'MEDIUM', 'EXTENDED')
+CHEAP_CHECK_MODES = ('FAST', 'CHANGED', 'QUICK')
+
 
-def connect_to_mysql(host, user, password, database):
-    """Establish connection to MySQL database"""
+def connect_to_mysql(host, user, password, database, local_infile=False):
+    """Establish connection to MySQL database (host may carry a port: 'localhost:3307')"""
+    import pymysql
+    
+    port = 3306
+    if ':' in (host or ''):
+        host, port = host.rsplit(':', 1)
+        port = int(port)
+    
     try:
         print(f"[LOG] Attempting to connect to MySQL database...")
         print(f"[LOG] Host: {host}")
@@ -46,21 +144,19 @@ def connect_to_mysql(host, user, password, database):
         
         connection = pymysql.connect(
             host=host,
-            port=3306,
+            port=port,
             user=user,
             password=password,
             database=database,
             charset='utf8',
             connect_timeout=10,
+            local_infile=local_infile,
             cursorclass=pymysql.cursors.DictCursor
         )
         
         if connection.open:
-            cursor = connection.cursor()
-            cursor.execute("SELECT VERSION()")
-            db_info = cursor.fetchone()
-            version = list(db_info.values())[0] if db_info else "Unknown"
-            cursor.close()
+            # Version comes with the handshake, no extra round trip
+            version = connection.get_server_info() or "Unknown"
             
             print(f"[LOG] ✓ Connection successful!")
             print(f"[LOG] MySQL Server version: {version}")
@@ -72,11 +168,11 @@ def connect_to_mysql(host, user, password, database):
         raise e
 
 
-def check_table(connection, table_name):
-    """Check table for errors"""
+def check_table(connection, table_name, mode=None):
+    """Check table for errors; mode is one of CHECK_MODES (None = server default, MEDIUM)"""
     try:
         cursor = connection.cursor()
-        cursor.execute(f"CHECK TABLE `{table_name}`")
+        cursor.execute(f"CHECK TABLE `{table_name}` {mode if mode in CHECK_MODES else ''}")
         result = cursor.fetchall()
         cursor.close()
         return result
@@ -111,6 +207,188 @@ def optimize_table(connection, table_name):
         return [{'Msg_type': 'error', 'Msg_text': str(e)}]
 
 
+def analyze_table(connection, table_name):
+    """Refresh index statistics (cheap, does not rebuild the table)"""
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"ANALYZE TABLE `{table_name}`")
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+    except Exception as e:
+        print(f"[LOG] Error analyzing table {table_name}: {str(e)}")
+        return [{'Msg_type': 'error', 'Msg_text': str(e)}]
+
+
+def rebuild_table_online(connection, table_name):
+    """Rebuild an InnoDB table in place without blocking DML (MySQL 5.6+ online DDL)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"ALTER TABLE `{table_name}` ENGINE=InnoDB, ALGORITHM=INPLACE, LOCK=NONE")
+    finally:
+        cursor.close()
+
+
+# Action and result shown for each optimize strategy (an online rebuild defragments like OPTIMIZE)
+STRATEGY_LABELS = {
+    'ONLINE REBUILD': ('OPTIMIZE', 'Optimized'),
+    'OPTIMIZE': ('OPTIMIZE', 'Optimized'),
+    'ANALYZE': ('ANALYZE', 'Analyzed')
+}
+
+
+def optimize_table_for_engine(connection, table_name, engine=None, capabilities=None, rebuild_mode='online',
+                              unkillable=None, interrupted=None):
+    """Reclaim space / defragment using the cheapest non-blocking strategy the server allows.
+    
+    InnoDB on 5.6+: online rebuild (ALTER ... ALGORITHM=INPLACE, LOCK=NONE), falling back to ANALYZE
+    when the table cannot be rebuilt online. Everything else (MyISAM, old servers, rebuild_mode
+    'classic', unknown engine): plain OPTIMIZE TABLE, run inside unkillable() when given.
+    A rebuild killed by the watchdog or a cancel (interrupted() returns a reason) is not followed by ANALYZE.
+    Returns (strategy, result rows).
+    """
+    if (rebuild_mode == 'online' and (engine or '').lower() == 'innodb'
+            and capabilities and capabilities.get('supports_online_ddl')):
+        try:
+            print(f"[LOG] Online rebuild (ALGORITHM=INPLACE, LOCK=NONE)...")
+            rebuild_table_online(connection, table_name)
+            return 'ONLINE REBUILD', [{'Msg_type': 'status', 'Msg_text': 'OK'}]
+        except Exception as e:
+            if interrupted and interrupted():
+                print(f"[LOG] Online rebuild killed ({str(e)}), no ANALYZE fallback")
+                return 'ONLINE REBUILD', [{'Msg_type': 'error', 'Msg_text': str(e)}]
+            # e.g. FULLTEXT index or ROW_FORMAT that does not allow LOCK=NONE
+            print(f"[LOG] Online rebuild not possible ({str(e)}), falling back to ANALYZE")
+            return 'ANALYZE', analyze_table(connection, table_name)
+    
+    with (unkillable or nullcontext)():
+        return 'OPTIMIZE', optimize_table(connection, table_name)
+
+
+def check_has_error(check_result):
+    """First problem message of a CHECK TABLE result, or None when the table is healthy"""
+    for check_row in check_result:
+        msg_type = check_row.get('Msg_type', '').lower()
+        msg_text = check_row.get('Msg_text', '')
+        
+        if msg_type in ['error', 'warning'] or 'corrupt' in msg_text.lower():
+            return msg_text
+    return None
+
+
+def maintain_table(connection, table_name, engine=None, capabilities=None, rebuild_mode='online', check_mode=None,
+                   interrupted=None, unkillable=None):
+    """CHECK a table, REPAIR it when needed, then OPTIMIZE; returns the result entry with timings.
+    
+    interrupted is an optional callable returning a reason (e.g. 'TIMEOUT') once the current statement
+    was killed; the table is then reported with that status instead of being repaired on the error.
+    'DEFERRED' means a REPAIR/OPTIMIZE ran past the time limit unkilled; the remaining steps are skipped.
+    unkillable is a context manager factory wrapped around REPAIR and classic OPTIMIZE.
+    """
+    started = time.time()
+    check_seconds = 0
+    optimize_seconds = 0
+    strategy = None
+    
+    def result_entry(table_status, action_taken, final_result):
+        return {
+            'table': table_name,
+            'status': table_status,
+            'action': action_taken,
+            'result': final_result,
+            'engine': engine,
+            'check_mode': check_mode or 'MEDIUM',
+            'strategy': strategy,
+            'check_seconds': round(check_seconds, 3),
+            'optimize_seconds': round(optimize_seconds, 3),
+            'seconds': round(time.time() - started, 3)
+        }
+    
+    def interrupted_entry(action_taken, step):
+        reason = interrupted() if interrupted else None
+        if reason == 'DEFERRED':
+            print(f"[LOG] ✗ {step} finished past the table timeout, remaining steps deferred")
+            return result_entry(reason, action_taken, f'{step} done, rest deferred')
+        if reason:
+            print(f"[LOG] ✗ {step} interrupted ({reason})")
+            return result_entry(reason, action_taken, f'{step} interrupted')
+        return None
+    
+    # 1. CHECK TABLE (a cheap check that finds a problem is confirmed with MEDIUM before repairing)
+    print(f"[LOG] Step 1: Checking table structure{f' ({check_mode})' if check_mode else ''}...")
+    check_result = check_table(connection, table_name, check_mode)
+    if check_mode in CHEAP_CHECK_MODES and check_has_error(check_result) and not (interrupted and interrupted()):
+        print(f"[LOG] {check_mode} check found a problem, escalating to MEDIUM...")
+        check_mode = 'MEDIUM'
+        check_result = check_table(connection, table_name, check_mode)
+    check_seconds = time.time() - started
+    stopped = interrupted_entry("None", "CHECK")
+    if stopped:
+        return stopped
+    
+    table_status = "OK"
+    action_taken = "None"
+    final_result = "Healthy"
+    
+    # Check if table has issues
+    problem = check_has_error(check_result)
+    has_error = problem is not None
+    if has_error:
+        table_status = "ERROR"
+        print(f"[LOG] ✗ Issue found: {problem}")
+    
+    if has_error:
+        # 2. REPAIR TABLE if needed
+        print(f"[LOG] Step 2: Repairing table...")
+        with (unkillable or nullcontext)():
+            repair_result = repair_table(connection, table_name)
+        action_taken = "REPAIR"
+        stopped = interrupted_entry(action_taken, "REPAIR")
+        if stopped:
+            return stopped
+        
+        repair_success = False
+        for repair_row in repair_result:
+            msg_type = repair_row.get('Msg_type', '').lower()
+            msg_text = repair_row.get('Msg_text', '')
+            
+            if msg_type == 'status' and 'ok' in msg_text.lower():
+                repair_success = True
+                print(f"[LOG] ✓ Repair successful")
+                break
+        
+        if repair_success:
+            # 3. OPTIMIZE TABLE after repair
+            print(f"[LOG] Step 3: Optimizing table...")
+            optimize_started = time.time()
+            strategy, optimize_result = optimize_table_for_engine(connection, table_name, engine, capabilities, rebuild_mode,
+                                                                  unkillable, interrupted)
+            optimize_seconds = time.time() - optimize_started
+            action, done = STRATEGY_LABELS[strategy]
+            action_taken = f"REPAIR + {action}"
+            final_result = f"Repaired & {done}"
+            print(f"[LOG] ✓ {strategy} complete")
+        else:
+            final_result = "Repair Failed"
+            print(f"[LOG] ✗ Repair failed")
+    else:
+        # Table is OK, just optimize
+        print(f"[LOG] ✓ Table is healthy")
+        print(f"[LOG] Step 2: Optimizing table...")
+        optimize_started = time.time()
+        strategy, optimize_result = optimize_table_for_engine(connection, table_name, engine, capabilities, rebuild_mode,
+                                                              unkillable, interrupted)
+        optimize_seconds = time.time() - optimize_started
+        action_taken, final_result = STRATEGY_LABELS[strategy]
+        print(f"[LOG] ✓ {strategy} complete")
+    
+    stopped = interrupted_entry(action_taken, strategy or "OPTIMIZE")
+    if stopped:
+        return stopped
+    
+    return result_entry(table_status, action_taken, final_result)
+
+
 def get_table_status(connection, table_name):
     """Get table status information"""
     try:
@@ -124,17 +402,35 @@ def get_table_status(connection, table_name):
         return None
 
 
+def safe_file_part(name):
+    """A database/host name reduced to characters that are safe in a file name"""
+    return re.sub(r'[^A-Za-z0-9_\-]', '_', name or '') or 'unknown'
+
+
+def create_log_file(prefix, database_name, folder="data"):
+    """Create a new log file <prefix>_<timestamp>_<database>[_n].txt; never reuses a name, so fleet stores
+    finishing in the same second (often with the same database name) each keep their own log.
+    Returns (path, open handle)."""
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    safe_database = safe_file_part(database_name)
+    suffix = 0
+    while True:
+        path = os.path.join(folder, f"{prefix}_{timestamp}_{safe_database}{f'_{suffix}' if suffix else ''}.txt")
+        try:
+            return path, open(path, 'x', encoding='utf-8')
+        except FileExistsError:
+            suffix += 1
+
+
 def save_maintenance_log(results, database_name):
     """Save maintenance log file"""
     try:
-        data_folder = "data"
-        if not os.path.exists(data_folder):
-            os.makedirs(data_folder)
-        
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        log_file = os.path.join(data_folder, f"maintenance_log_{timestamp}.txt")
+        log_file, log_handle = create_log_file("maintenance_log", database_name)
         
-        with open(log_file, 'w', encoding='utf-8') as f:
+        with log_handle as f:
             f.write("=" * 100 + "\n")
             f.write("DATABASE MAINTENANCE LOG\n")
             f.write("=" * 100 + "\n")
@@ -142,17 +438,23 @@ def save_maintenance_log(results, database_name):
             f.write(f"Database: {database_name}\n")
             f.write("=" * 100 + "\n\n")
             
-            f.write(f"{'Table Name':<30} {'Status':<15} {'Action':<20} {'Result':<30}\n")
+            f.write(f"{'Table Name':<30} {'Status':<10} {'Action':<20} {'Result':<22} {'Strategy':<15} {'Time (s)':>9}\n")
             f.write("-" * 100 + "\n")
             
             for result in results:
-                f.write(f"{result['table']:<30} {result['status']:<15} {result['action']:<20} {result['result']:<30}\n")
+                f.write(f"{result['table']:<30} {result['status']:<10} {result['action']:<20} {result['result']:<22} "
+                        f"{result.get('strategy') or '-':<15} {result.get('seconds', 0):>9.2f}\n")
             
             f.write("-" * 100 + "\n")
             f.write(f"Total tables checked: {len(results)}\n")
             f.write(f"Tables with issues: {sum(1 for r in results if r['action'] != 'None')}\n")
             f.write(f"Tables repaired: {sum(1 for r in results if 'REPAIR' in r['action'])}\n")
             f.write(f"Tables optimized: {sum(1 for r in results if 'OPTIMIZE' in r['action'])}\n")
+            f.write(f"Tables analyzed only: {sum(1 for r in results if 'ANALYZE' in r['action'])}\n")
+            for strategy in ('ONLINE REBUILD', 'ANALYZE', 'OPTIMIZE'):
+                timed = [r['optimize_seconds'] for r in results if r.get('strategy') == strategy]
+                if timed:
+                    f.write(f"{strategy}: {len(timed)} tables, {sum(timed):.1f}s total, {sum(timed) / len(timed):.2f}s avg\n")
             f.write("=" * 100 + "\n")
         
         print(f"\n[LOG] Maintenance log saved to: {log_file}")
@@ -164,14 +466,9 @@ def save_maintenance_log(results, database_name):
 def save_saldo_checker_log(operation, database_name, check_date, monthly_table, result_data):
     """Save TH Barang Saldo Checker log file"""
     try:
-        data_folder = "data"
-        if not os.path.exists(data_folder):
-            os.makedirs(data_folder)
-        
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        log_file = os.path.join(data_folder, f"saldo_checker_log_{timestamp}.txt")
+        log_file, log_handle = create_log_file("saldo_checker_log", database_name)
         
-        with open(log_file, 'w', encoding='utf-8') as f:
+        with log_handle as f:
             f.write("=" * 100 + "\n")
             f.write("TH BARANG SALDO CHECKER LOG\n")
             f.write("=" * 100 + "\n")
@@ -192,7 +489,24 @@ def save_saldo_checker_log(operation, database_name, check_date, monthly_table,
             elif operation == "FIX_SALDO":
                 f.write(f"Inserted Count: {result_data.get('insertedCount', 0):,}\n")
                 f.write(f"Deleted Count: {result_data.get('deletedCount', 0):,}\n")
+                f.write(f"Mode: {result_data.get('mode', 'COPY + DELETE')}\n")
+                if result_data.get('verification'):
+                    f.write(f"Verified: {result_data['verification']['match']} ({result_data['verification']['rows_target']:,} rows hashed)\n")
                 f.write(f"Result: Data moved successfully\n")
+            elif operation == "COMPRESS":
+                f.write(f"Format: {result_data.get('format')}\n")
+                f.write(f"Size: {result_data.get('before_mb', 0):,} MB -> {result_data.get('after_mb', 0):,} MB\n")
+                f.write(f"Full Scan: {result_data.get('scan_seconds_before')}s -> {result_data.get('scan_seconds_after')}s\n")
+                f.write(f"Result: Archive table compressed\n")
+            elif operation == "OFFLOAD":
+                f.write(f"Archive Server: {result_data.get('target')}\n")
+                f.write(f"Rows: {result_data.get('rows', 0):,} ({result_data.get('method')}, {result_data.get('copy_seconds')}s)\n")
+                f.write(f"Verified: {result_data.get('verified')} ({(result_data.get('verification') or {}).get('chunks', 0)} chunks)\n")
+                f.write(f"Source Dropped: {result_data.get('source_dropped')}\n")
+            elif operation == "PARTITION":
+                f.write(f"Partitioned Months: {' .. '.join(result_data.get('months', []))}\n")
+                f.write(f"Duration: {result_data.get('seconds', 0)}s\n")
+                f.write(f"Result: Table partitioned by month\n")
             
             f.write("\n" + "=" * 100 + "\n\n")
         
@@ -205,14 +519,9 @@ def save_saldo_checker_log(operation, database_name, check_date, monthly_table,
 def save_audit_log(database_name, summary_data, total_issues, issues_phase1, issues_phase2):
     """Save Smart Audit Toko log file"""
     try:
-        data_folder = "data"
-        if not os.path.exists(data_folder):
-            os.makedirs(data_folder)
-        
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        log_file = os.path.join(data_folder, f"smart_audit_log_{timestamp}.txt")
+        log_file, log_handle = create_log_file("smart_audit_log", database_name)
         
-        with open(log_file, 'w', encoding='utf-8') as f:
+        with log_handle as f:
             f.write("=" * 100 + "\n")
             f.write("SMART AUDIT TOKO LOG\n")
             f.write("=" * 100 + "\n")
@@ -279,14 +588,9 @@ def save_audit_log(database_name, summary_data, total_issues, issues_phase1, iss
 def save_smart_audit_fixing_log(database_name, fixing_result):
     """Save Smart Audit Fixing log file"""
     try:
-        data_folder = "data"
-        if not os.path.exists(data_folder):
-            os.makedirs(data_folder)
-        
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        log_file = os.path.join(data_folder, f"smart_audit_fixing_{timestamp}.txt")
+        log_file, log_handle = create_log_file("smart_audit_fixing", database_name)
         
-        with open(log_file, 'w', encoding='utf-8') as f:
+        with log_handle as f:
             f.write("=" * 100 + "\n")
             f.write("SMART AUDIT TOKO - FIXING LOG\n")
             f.write("=" * 100 + "\n")
@@ -333,284 +637,4633 @@ def save_smart_audit_fixing_log(database_name, fixing_result):
 
 
 
-@app.route('/')
-def index():
-    """Main page"""
-    return render_template('index.html')
-
-
-@app.route('/get-tables', methods=['POST'])
-def get_tables():
-    """Get list of all tables in database"""
-    try:
-        data = request.get_json()
-        host = data.get('host', '').strip()
-        user = data.get('user', '').strip()
-        password = data.get('password', '').strip()
-        database = data.get('database', '').strip()
+def check_saldo_period(connection, database, check_date, monthly_table):
+    """Check one saldo period: monthly table exists/has data, else rows waiting in th_barang_saldo (closes the connection)"""
+    cursor = connection.cursor()
+    
+    # Check if monthly table exists
+    cursor.execute(f"SHOW TABLES LIKE '{monthly_table}'")
+    table_exists = cursor.fetchone() is not None
+    
+    if not table_exists:
+        cursor.close()
+        connection.close()
+        return {
+            'success': True,
+            'needsFixing': False,
+            'needsCreating': True,
+            'message': f'⚠ Table {monthly_table} does not exist in database. You can create it now.',
+            'monthlyTable': monthly_table,
+            'checkDate': check_date
+        }
+    
+    # Check if monthly table has data
+    cursor.execute(f"SELECT COUNT(*) as count FROM `{monthly_table}`")
+    monthly_count = cursor.fetchone()['count']
+    
+    if monthly_count > 0:
+        cursor.close()
+        connection.close()
         
-        if not all([host, user, database]):
-            return jsonify({
-                'success': False,
-                'message': 'Please fill in Host, User, and Database fields!'
-            })
+        # Log the check result
+        result_data = {'monthlyCount': monthly_count, 'mainCount': 0, 'needsFixing': False, 'needsCreating': False}
+        save_saldo_checker_log("CHECK", database, check_date, monthly_table, result_data)
         
-        connection = connect_to_mysql(host, user, password, database)
+        return {
+            'success': True,
+            'needsFixing': False,
+            'message': f'✓ Table {monthly_table} exists and has {monthly_count:,} records. Data is OK!',
+            'monthlyTable': monthly_table,
+            'monthlyCount': monthly_count
+        }
+    
+    # Monthly table is empty, check main table
+    cursor.execute(f"""
+        SELECT COUNT(*) as count 
+        FROM th_barang_saldo 
+        WHERE LEFT(tanggal, 7) = '{check_date}'
+    """)
+    main_count = cursor.fetchone()['count']
+    
+    cursor.close()
+    connection.close()
+    
+    if main_count > 0:
+        # Log the check result
+        result_data = {'monthlyCount': 0, 'mainCount': main_count, 'needsFixing': True, 'needsCreating': False}
+        save_saldo_checker_log("CHECK", database, check_date, monthly_table, result_data)
         
-        if connection:
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-            
-            table_list = []
-            for table_row in tables:
-                table_name = list(table_row.values())[0]
-                
-                # Get table info
-                status = get_table_status(connection, table_name)
-                rows = status.get('Rows', 0) if status else 0
-                size = status.get('Data_length', 0) if status else 0
-                
-                # Format size
-                if size > 1024 * 1024:
-                    size_str = f"{size / (1024 * 1024):.2f} MB"
-                elif size > 1024:
-                    size_str = f"{size / 1024:.2f} KB"
-                else:
-                    size_str = f"{size} B"
-                
-                table_list.append({
-                    'name': table_name,
-                    'rows': rows,
-                    'size': size_str
-                })
-            
-            cursor.close()
-            connection.close()
-            
-            return jsonify({
-                'success': True,
-                'tables': table_list
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'Connection failed. Please check your credentials.'
-            })
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error: {str(e)}'
-        })
+        return {
+            'success': True,
+            'needsFixing': True,
+            'message': f'⚠ Table {monthly_table} is EMPTY, but found {main_count:,} records in th_barang_saldo for period {check_date}. Ready to fix!',
+            'monthlyTable': monthly_table,
+            'monthlyCount': 0,
+            'mainCount': main_count,
+            'checkDate': check_date
+        }
+    else:
+        # Log the check result
+        result_data = {'monthlyCount': 0, 'mainCount': 0, 'needsFixing': False, 'needsCreating': False}
+        save_saldo_checker_log("CHECK", database, check_date, monthly_table, result_data)
+        
+        return {
+            'success': True,
+            'needsFixing': False,
+            'message': f'ℹ Table {monthly_table} is empty and no data found in th_barang_saldo for period {check_date}.',
+            'monthlyTable': monthly_table,
+            'monthlyCount': 0,
+            'mainCount': 0
+        }
 
 
-@app.route('/test-connection', methods=['POST'])
-def test_connection():
-    """Test MySQL connection"""
+# ============================================================
+# CONNECTION PROFILES & SERVER CAPABILITY CACHE
+# ============================================================
+PROFILES_FILE = os.path.join("data", "connection_profiles.json")
+CAPABILITIES_FILE = os.path.join("data", "server_capabilities.json")
+CAPABILITIES_TTL_SECONDS = 24 * 60 * 60
+CAPABILITIES_PROBE_VERSION = 3  # bump when probe_server_capabilities changes, cached records are re-probed
+CAPABILITY_INDEX_TABLES = ('tm_barang', 'tt_barang_saldo', 'th_barang_saldo')
+
+settings_lock = threading.Lock()
+
+
+def load_json_file(path, default):
+    """Load a local JSON settings file, returning default when missing or unreadable"""
     try:
-        data = request.get_json()
-        host = data.get('host', '').strip()
-        user = data.get('user', '').strip()
-        password = data.get('password', '').strip()
-        database = data.get('database', '').strip()
-        
-        if not all([host, user, database]):
-            return jsonify({
-                'success': False,
-                'message': 'Please fill in Host, User, and Database fields!'
-            })
-        
-        connection = connect_to_mysql(host, user, password, database)
-        
-        if connection:
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-            table_count = len(tables)
-            
-            cursor.execute("SELECT VERSION()")
-            version_data = cursor.fetchone()
-            version = list(version_data.values())[0] if version_data else "Unknown"
-            
-            cursor.close()
-            connection.close()
-            
-            return jsonify({
-                'success': True,
-                'message': f'✓ Connected successfully!\nMySQL: {version}\nTables: {table_count}'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'Connection failed. Please check your credentials.'
-            })
-            
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error: {str(e)}'
-        })
+        print(f"[LOG] Error reading {path}: {str(e)}")
+    return default
 
 
-@app.route('/start-maintenance', methods=['POST'])
-def start_maintenance():
-    """Start table check/repair/optimize process"""
-    global maintenance_status, check_results
+def save_json_file(path, content):
+    """Atomically save a local JSON settings file"""
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(content, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def load_connection_profiles():
+    """Load named connection profiles"""
+    return load_json_file(PROFILES_FILE, {})
+
+
+def get_connection_params(data):
+    """Get host/user/password/database from a request body, filling blanks from a named profile"""
+    profile = {}
+    profile_name = (data.get('profile') or '').strip()
+    if profile_name:
+        profile = load_connection_profiles().get(profile_name)
+        if profile is None:
+            raise ValueError(f"Connection profile '{profile_name}' not found")
+    
+    def value(key):
+        return (data.get(key) or profile.get(key) or '').strip()
+    
+    return value('host'), value('user'), value('password'), value('database')
+
+
+def parse_mysql_version(version):
+    """Version string like '5.0.51b-community-nt-log' to a comparable tuple (5, 0, 51)"""
+    numbers = re.findall(r'\d+', (version or '').split('-')[0])[:3]
+    return tuple(int(n) for n in numbers) + (0,) * (3 - len(numbers))
+
+
+def probe_server_capabilities(connection):
+    """Probe what the server supports; one round of cheap metadata queries"""
+    cursor = connection.cursor()
+    version = connection.get_server_info()
+    version_tuple = parse_mysql_version(version)
+    
+    cursor.execute("""
+        SELECT ENGINE, COUNT(*) as tables, SUM(DATA_LENGTH + INDEX_LENGTH) as bytes
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+        GROUP BY ENGINE
+    """)
+    engines_in_use = {row['ENGINE']: {'tables': int(row['tables']), 'bytes': int(row['bytes'] or 0)} for row in cursor.fetchall()}
+    
+    cursor.execute("SHOW ENGINES")
+    available_engines = [row['Engine'] for row in cursor.fetchall() if row.get('Support') in ('YES', 'DEFAULT')]
+    
+    cursor.execute("""
+        SHOW VARIABLES WHERE Variable_name IN
+        ('max_allowed_packet', 'have_partitioning', 'innodb_file_per_table', 'innodb_file_format', 'local_infile',
+         'information_schema_stats_expiry')
+    """)
+    variables = {row['Variable_name']: row['Value'] for row in cursor.fetchall()}
+    
+    # 8.0 has no have_partitioning and no 'partition' plugin: partitioning is built into InnoDB
+    supports_partitioning = variables.get('have_partitioning') == 'YES' or version_tuple >= (8, 0, 0)
+    if not supports_partitioning and version_tuple >= (5, 1, 0):
+        try:
+            cursor.execute("SELECT PLUGIN_STATUS FROM information_schema.PLUGINS WHERE PLUGIN_NAME = 'partition'")
+            row = cursor.fetchone()
+            supports_partitioning = bool(row and row['PLUGIN_STATUS'] == 'ACTIVE')
+        except Exception:
+            supports_partitioning = False
     
     try:
-        data = request.get_json()
-        host = data.get('host', '').strip()
-        user = data.get('user', '').strip()
-        password = data.get('password', '').strip()
-        database = data.get('database', '').strip()
-        selected_tables = data.get('tables', [])
-        
-        if not all([host, user, database]):
-            return jsonify({
-                'success': False,
-                'message': 'Please fill in all required fields!'
-            })
-        
-        if not selected_tables:
-            return jsonify({
-                'success': False,
-                'message': 'Please select at least one table to check!'
-            })
-        
-        # Reset status
-        maintenance_status = {
-            'is_running': True,
-            'current': 0,
-            'total': len(selected_tables),
-            'percentage': 0,
-            'message': 'Connecting to database...',
-            'completed': False,
-            'error': None,
-            'results': []
-        }
-        check_results = []
-        
-        # Connect to database
-        connection = connect_to_mysql(host, user, password, database)
-        
-        if not connection:
-            maintenance_status['error'] = 'Connection failed'
-            maintenance_status['is_running'] = False
-            return jsonify({
-                'success': False,
-                'message': 'Failed to connect to database'
-            })
-        
-        # Process each table
-        for i, table_name in enumerate(selected_tables):
-            # Update progress
-            maintenance_status['current'] = i + 1
-            maintenance_status['percentage'] = int(((i + 1) / len(selected_tables)) * 100)
-            maintenance_status['message'] = f'Checking: {table_name}'
-            
-            print(f"\n[LOG] ====== Processing Table: {table_name} ======")
-            
-            # 1. CHECK TABLE
-            print(f"[LOG] Step 1: Checking table structure...")
-            check_result = check_table(connection, table_name)
-            
-            table_status = "OK"
-            action_taken = "None"
-            final_result = "Healthy"
-            
-            # Check if table has issues
-            has_error = False
-            for check_row in check_result:
-                msg_type = check_row.get('Msg_type', '').lower()
-                msg_text = check_row.get('Msg_text', '')
-                
-                if msg_type in ['error', 'warning'] or 'corrupt' in msg_text.lower():
-                    has_error = True
-                    table_status = "ERROR"
-                    print(f"[LOG] ✗ Issue found: {msg_text}")
-                    break
-            
-            if has_error:
-                # 2. REPAIR TABLE if needed
-                print(f"[LOG] Step 2: Repairing table...")
-                repair_result = repair_table(connection, table_name)
-                action_taken = "REPAIR"
-                
-                repair_success = False
-                for repair_row in repair_result:
-                    msg_type = repair_row.get('Msg_type', '').lower()
-                    msg_text = repair_row.get('Msg_text', '')
+        cursor.execute("SELECT COUNT(*) as count FROM information_schema.INNODB_TRX")
+        has_innodb_trx = True
+    except Exception:
+        has_innodb_trx = False
+    
+    indexes = {}
+    for table_name in CAPABILITY_INDEX_TABLES:
+        try:
+            cursor.execute(f"SHOW INDEX FROM `{table_name}`")
+            table_indexes = {}
+            for row in cursor.fetchall():
+                table_indexes.setdefault(row['Key_name'], []).append(row['Column_name'])
+            indexes[table_name] = table_indexes
+        except Exception:
+            indexes[table_name] = None  # table does not exist
+    
+    cursor.execute("SHOW TABLES")
+    table_count = len(cursor.fetchall())
+    cursor.close()
+    
+    return {
+        'version': version,
+        'version_tuple': list(version_tuple),
+        'engines_in_use': engines_in_use,
+        'available_engines': available_engines,
+        'table_count': table_count,
+        'supports_check_quick': True,
+        'supports_multi_table_optimize': version_tuple >= (4, 1, 0),
+        'supports_online_ddl': version_tuple >= (5, 6, 0),
+        'supports_explain_json': version_tuple >= (5, 6, 5),
+        'supports_partitioning': supports_partitioning,
+        'supports_exchange_partition': supports_partitioning and version_tuple >= (5, 6, 0),
+        'has_innodb_trx': has_innodb_trx,
+        'innodb_file_per_table': variables.get('innodb_file_per_table') in ('ON', '1'),
+        'innodb_file_format': variables.get('innodb_file_format'),
+        'local_infile': variables.get('local_infile') in ('ON', '1'),
+        # 8.0.3+: SHOW TABLE STATUS serves cached statistics for this many seconds
+        'stats_expiry': int(variables['information_schema_stats_expiry']) if 'information_schema_stats_expiry' in variables else None,
+        'max_allowed_packet': int(variables.get('max_allowed_packet') or 1024 * 1024),
+        'indexes': indexes,
+        'probe_version': CAPABILITIES_PROBE_VERSION,
+        'probed_at': time.time()
+    }
+
+
+def get_server_capabilities(connection, host, database, refresh=False):
+    """Get the cached capability record for host/database, probing only when missing, stale or refresh"""
+    key = f"{host}|{database}"
+    with settings_lock:
+        cache = load_json_file(CAPABILITIES_FILE, {})
+        record = cache.get(key)
+    
+    if (record and not refresh and record.get('probe_version') == CAPABILITIES_PROBE_VERSION
+            and time.time() - record.get('probed_at', 0) < CAPABILITIES_TTL_SECONDS):
+        return record
+    
+    record = probe_server_capabilities(connection)
+    with settings_lock:
+        cache = load_json_file(CAPABILITIES_FILE, {})
+        cache[key] = record
+        save_json_file(CAPABILITIES_FILE, cache)
+    print(f"[LOG] Server capabilities cached for {key} (MySQL {record['version']})")
+    return record
+
+
+# ============================================================
+# MAINTENANCE SCHEDULER - LOAD GUARD & MAINTENANCE WINDOWS
+# ============================================================
+MAINTENANCE_SETTINGS_FILE = os.path.join("data", "maintenance_settings.json")
+DEFERRED_TABLES_FILE = os.path.join("data", "maintenance_deferred.json")
+CHECK_STATE_FILE = os.path.join("data", "check_state.json")
+CHECK_DATA_FREE_RATIO = 0.5  # MyISAM Data_free above this share of Data_length looks suspicious
+
+DEFAULT_MAINTENANCE_SETTINGS = {
+    'max_threads_running': 8,       # pause while more statements than this are executing
+    'max_lock_waits': 2,            # pause while more transactions than this wait for a lock
+    'max_replica_lag': 30,          # seconds behind master, ignored when the server is not a replica
+    'large_table_mb': 256,          # tables above this size are deferred instead of run under load
+    'pause_seconds': 5,             # wait between load checks while paused
+    'max_pause_seconds': 120,       # give up waiting after this long (large table -> deferred)
+    'throttle_factor': 0.5,         # under elevated load, sleep this fraction of the last table's run time
+    'smart_check': True,            # choose the CHECK TABLE mode per table (FAST/CHANGED/QUICK, MEDIUM/EXTENDED on anomalies)
+    'table_timeout_seconds': 3600,  # KILL QUERY a table's statement after this long (0 = no limit)
+    'rebuild_mode': 'online',       # 'online': InnoDB rebuilt with ALGORITHM=INPLACE, LOCK=NONE on 5.6+; 'classic': always OPTIMIZE
+    'plan_guard': 'warn',           # EXPLAIN before audit/fix/fix saldo: 'off', 'warn', or 'refuse' runs over plan_max_rows
+    'plan_max_rows': 20000000,      # estimated rows examined budget for one operation (0 = no budget)
+    'archive_quiet_days': 7,        # closed th_barang_saldo_yyyyMM tables are compressed once unwritten this long
+    'archive_key_block_size': 8,    # KEY_BLOCK_SIZE (KB) for ROW_FORMAT=COMPRESSED archives
+    'verify_moves': True,           # fix saldo: hash-compare the copied month before deleting it from th_barang_saldo
+    'verify_after_fix': True,       # fix smart audit: chunk-hash re-check of the audit keys after the fixes
+    'window_start': None,           # hour 0-23; None means no window (run any time)
+    'window_end': None              # hour 0-23, exclusive; may wrap past midnight (e.g. 22 -> 6)
+}
+
+
+def load_maintenance_settings():
+    """Scheduler settings merged over the defaults"""
+    settings = dict(DEFAULT_MAINTENANCE_SETTINGS)
+    settings.update(load_json_file(MAINTENANCE_SETTINGS_FILE, {}))
+    return settings
+
+
+def in_maintenance_window(settings, now=None):
+    """True when now falls inside the configured maintenance window (always True without a window)"""
+    start, end = settings.get('window_start'), settings.get('window_end')
+    if start is None or end is None:
+        return True
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def get_all_table_status(connection):
+    """SHOW TABLE STATUS for every table in one round trip, keyed by table name"""
+    cursor = connection.cursor()
+    cursor.execute("SHOW TABLE STATUS")
+    status = {row['Name']: row for row in cursor.fetchall()}
+    cursor.close()
+    return status
+
+
+def get_server_load(connection, has_innodb_trx):
+    """Current load: running threads, lock waits and replication lag (None when not a replica)"""
+    cursor = connection.cursor()
+    
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Threads_running'")
+    row = cursor.fetchone()
+    threads_running = int(row['Value']) if row else 0
+    
+    if has_innodb_trx:
+        cursor.execute("SELECT COUNT(*) as count FROM information_schema.INNODB_TRX WHERE trx_state = 'LOCK WAIT'")
+        lock_waits = int(cursor.fetchone()['count'])
+    else:
+        # Old servers: count sessions waiting on a table lock
+        cursor.execute("SHOW PROCESSLIST")
+        lock_waits = sum(1 for row in cursor.fetchall() if 'lock' in (row.get('State') or '').lower())
+    
+    replica_lag = None
+    try:
+        cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        if row and row.get('Seconds_Behind_Master') is not None:
+            replica_lag = int(row['Seconds_Behind_Master'])
+    except Exception:
+        pass  # no REPLICATION CLIENT privilege
+    
+    cursor.close()
+    return {'threads_running': threads_running, 'lock_waits': lock_waits, 'replica_lag': replica_lag}
+
+
+def get_load_violations(load, settings, factor=1.0):
+    """Thresholds exceeded by the current load; factor < 1 checks against a fraction of each threshold"""
+    violations = []
+    if load['threads_running'] > settings['max_threads_running'] * factor:
+        violations.append(f"Threads_running {load['threads_running']}")
+    if load['lock_waits'] > settings['max_lock_waits'] * factor:
+        violations.append(f"lock waits {load['lock_waits']}")
+    if load['replica_lag'] is not None and load['replica_lag'] > settings['max_replica_lag'] * factor:
+        violations.append(f"replica lag {load['replica_lag']}s")
+    return violations
+
+
+def load_deferred_tables(host, database):
+    """Tables queued for the next maintenance window of host/database"""
+    with settings_lock:
+        return load_json_file(DEFERRED_TABLES_FILE, {}).get(f"{host}|{database}", [])
+
+
+def save_deferred_tables(host, database, deferred):
+    """Replace the deferred queue of host/database"""
+    key = f"{host}|{database}"
+    with settings_lock:
+        queue_map = load_json_file(DEFERRED_TABLES_FILE, {})
+        if deferred:
+            queue_map[key] = deferred
+        else:
+            queue_map.pop(key, None)
+        save_json_file(DEFERRED_TABLES_FILE, queue_map)
+
+
+def load_check_state(host, database):
+    """Per-table state of the last CHECK TABLE runs on host/database"""
+    with settings_lock:
+        return load_json_file(CHECK_STATE_FILE, {}).get(f"{host}|{database}", {})
+
+
+def save_check_state(host, database, state):
+    """Replace the check state of host/database"""
+    with settings_lock:
+        all_state = load_json_file(CHECK_STATE_FILE, {})
+        all_state[f"{host}|{database}"] = state
+        save_json_file(CHECK_STATE_FILE, all_state)
+
+
+def choose_check_mode(info, entry):
+    """Pick the cheapest CHECK TABLE mode that is still safe for a table.
+    
+    EXTENDED: the table is marked as crashed, or the last check found a problem.
+    MEDIUM: Data_free / Check_time anomalies (MyISAM with lots of free space or never checked).
+    FAST: MyISAM not modified since our last clean check (only verifies it was closed properly).
+    CHANGED: MyISAM the server has checked before but we have no local state for.
+    QUICK: routine check (no row scan for incorrect links); InnoDB ignores FAST/CHANGED.
+    """
+    engine = (info.get('Engine') or '').lower()
+    comment = (info.get('Comment') or '').lower()
+    
+    if 'crashed' in comment or (entry or {}).get('problem'):
+        return 'EXTENDED'
+    
+    if engine == 'myisam':
+        data_length = info.get('Data_length') or 0
+        data_free = info.get('Data_free') or 0
+        if data_length and data_free > data_length * CHECK_DATA_FREE_RATIO:
+            return 'MEDIUM'
+        if info.get('Check_time') is None and (info.get('Rows') or 0) > 0:
+            return 'MEDIUM'
+        if entry and entry.get('update_time') == str(info.get('Update_time')):
+            return 'FAST'
+        if not entry:
+            return 'CHANGED'
+    
+    return 'QUICK'
+
+
+@contextmanager
+def unkillable_table_statement(watchdog, operation_id):
+    """REPAIR/OPTIMIZE guard: neither the table watchdog nor /cancel kills the statement"""
+    with watchdog.unkillable(), operation_unkillable(operation_id):
+        yield
+
+
+def run_scheduled_maintenance(connection, host, user, password, database, tables, status, settings=None, run_id=None,
+                              operation_id=None):
+    """Maintain tables one by one under the load guard and maintenance window.
+    
+    Between tables the server load is checked: under elevated load the scheduler slows down,
+    when a threshold is exceeded it pauses, and a large table that still cannot run is deferred.
+    Tables left when the window closes are deferred too. Deferred tables are queued for the next
+    run of host/database. Each table runs under a statement watchdog (table_timeout_seconds), and
+    with a run_id every finished or deferred table is journaled as it happens. A cancelled operation
+    stops after the current statement; the interrupted table stays unfinished in the journal.
+    status is updated in place (maintenance_status shape). Returns (results, deferred).
+    """
+    settings = settings or load_maintenance_settings()
+    capabilities = get_server_capabilities(connection, host, database)
+    connection_id = get_connection_id(connection)
+    table_status = get_all_table_status(connection)
+    check_state = load_check_state(host, database)
+    large_bytes = settings['large_table_mb'] * 1024 * 1024
+    
+    results = []
+    deferred = []
+    last_duration = 0
+    done_before = len(status['results'])  # tables finished before a resume
+    total = max(status.get('total') or len(tables), 1)
+    
+    def defer(table_name, reason):
+        print(f"[SCHEDULER] Deferred {table_name}: {reason}")
+        deferred.append({'table': table_name, 'reason': reason, 'deferred_at': datetime.now().isoformat(timespec='seconds')})
+        append_run_journal(run_id, 'table_deferred', table=table_name, reason=reason)
+    
+    for i, table_name in enumerate(tables):
+        if is_cancelled(operation_id):
+            break
+        
+        status['current'] = done_before + i + 1
+        status['percentage'] = int((status['current'] / total) * 100)
+        
+        if not in_maintenance_window(settings):
+            defer(table_name, 'outside maintenance window')
+            continue
+        
+        info = table_status.get(table_name) or {}
+        size = (info.get('Data_length') or 0) + (info.get('Index_length') or 0)
+        is_large = size >= large_bytes
+        
+        # Pause while the server is overloaded
+        load = get_server_load(connection, capabilities['has_innodb_trx'])
+        violations = get_load_violations(load, settings)
+        paused_for = 0
+        while violations and paused_for < settings['max_pause_seconds']:
+            status['paused'] = True
+            status['message'] = f"Paused before {table_name}: {', '.join(violations)}"
+            print(f"[SCHEDULER] {status['message']}")
+            time.sleep(settings['pause_seconds'])
+            paused_for += settings['pause_seconds']
+            load = get_server_load(connection, capabilities['has_innodb_trx'])
+            violations = get_load_violations(load, settings)
+        status['paused'] = False
+        status['load'] = load
+        
+        if violations and is_large:
+            defer(table_name, f"server busy ({', '.join(violations)})")
+            continue
+        
+        # Slow down under elevated (but not excessive) load
+        if get_load_violations(load, settings, factor=0.5) and last_duration:
+            throttle = last_duration * settings['throttle_factor']
+            status['message'] = f'Throttling {throttle:.1f}s before {table_name} (elevated load)'
+            time.sleep(throttle)
+        
+        status['message'] = f'Checking: {table_name}'
+        print(f"\n[LOG] ====== Processing Table: {table_name} ======")
+        
+        append_run_journal(run_id, 'table_start', table=table_name)
+        started = time.time()
+        check_mode = choose_check_mode(info, check_state.get(table_name)) if settings['smart_check'] else None
+        with StatementWatchdog(host, user, password, database, connection_id, settings['table_timeout_seconds']) as watchdog:
+            result_entry = maintain_table(connection, table_name, info.get('Engine'), capabilities, settings['rebuild_mode'],
+                                          check_mode, interrupted=lambda: watchdog.fired or ('CANCELLED' if is_cancelled(operation_id) else None),
+                                          unkillable=lambda: unkillable_table_statement(watchdog, operation_id))
+        last_duration = time.time() - started
+        
+        if result_entry['status'] == 'CANCELLED':
+            print(f"[LOG] ====== Cancelled: {table_name} ======\n")
+            break
+        
+        # REPAIR/OPTIMIZE are never killed (MyISAM); past the timeout the rest of the table waits for the next run
+        if result_entry['status'] == 'DEFERRED':
+            defer(table_name, f"table timeout reached during {result_entry['action']}")
+        
+        # Remember the post-maintenance state, so an untouched table gets a FAST check next time
+        if result_entry['status'] in ('OK', 'ERROR'):
+            after = get_table_status(connection, table_name) or {}
+            check_state[table_name] = {
+                'checked_at': datetime.now().isoformat(timespec='seconds'),
+                'mode': result_entry['check_mode'],
+                'problem': result_entry['status'] == 'ERROR',  # verified with EXTENDED on the next run
+                'update_time': str(after.get('Update_time')),
+                'data_free': after.get('Data_free')
+            }
+        results.append(result_entry)
+        status['results'].append(result_entry)
+        append_run_journal(run_id, 'table_done', table=table_name, result=result_entry)
+        
+        print(f"[LOG] ====== Completed: {table_name} ({last_duration:.1f}s) ======\n")
+    
+    # Keep queue entries this run did not touch (e.g. deferred before a resume)
+    untouched = [entry for entry in load_deferred_tables(host, database) if entry['table'] not in tables]
+    save_deferred_tables(host, database, untouched + deferred)
+    save_check_state(host, database, check_state)
+    status['deferred'] = deferred
+    return results, deferred
+
+
+# ============================================================
+# MAINTENANCE RUN JOURNAL & STATEMENT WATCHDOG
+# ============================================================
+MAINTENANCE_RUNS_FOLDER = os.path.join("data", "maintenance_runs")
+
+
+def get_connection_id(connection):
+    """Server thread id of a connection, the target for KILL QUERY"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT CONNECTION_ID() as id")
+    connection_id = int(cursor.fetchone()['id'])
+    cursor.close()
+    return connection_id
+
+
+def kill_query(host, user, password, database, connection_id):
+    """Abort the statement running on connection_id from a separate connection (the connection stays open)"""
+    side = connect_to_mysql(host, user, password, database)
+    try:
+        cursor = side.cursor()
+        cursor.execute(f"KILL QUERY {int(connection_id)}")
+        cursor.close()
+        print(f"[LOG] KILL QUERY {connection_id} sent")
+    finally:
+        side.close()
+
+
+class StatementWatchdog:
+    """Kill the statement running on a connection when it takes longer than timeout seconds.
+    
+    Used as a context manager around one unit of work (one table); fired holds 'TIMEOUT' once it struck.
+    Statements inside unkillable() (MyISAM REPAIR/OPTIMIZE, which a kill can leave corrupted) are never
+    killed: a timeout during them is held back and fired becomes 'DEFERRED' once they finish.
+    """
+    
+    def __init__(self, host, user, password, database, connection_id, timeout):
+        self.credentials = (host, user, password, database)
+        self.connection_id = connection_id
+        self.timeout = timeout
+        self.fired = None
+        self.timer = None
+        self.protected = 0
+        self.overdue = False
+        self.lock = threading.Lock()
+    
+    @contextmanager
+    def unkillable(self):
+        with self.lock:
+            self.protected += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.protected -= 1
+                if self.overdue and not self.protected:
+                    self.fired = 'DEFERRED'
+    
+    def _fire(self):
+        with self.lock:
+            if self.protected:
+                self.overdue = True
+                print(f"[LOG] Watchdog: timeout reached during REPAIR/OPTIMIZE, letting it finish")
+                return
+            self.fired = 'TIMEOUT'
+        try:
+            kill_query(*self.credentials, self.connection_id)
+        except Exception as e:
+            print(f"[LOG] Watchdog could not kill query {self.connection_id}: {str(e)}")
+    
+    def __enter__(self):
+        if self.timeout:
+            self.timer = Timer(self.timeout, self._fire)
+            self.timer.daemon = True
+            self.timer.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.timer:
+            self.timer.cancel()
+        return False
+
+
+def get_run_journal_path(run_id):
+    """Journal file of a maintenance run, rejecting ids that could escape MAINTENANCE_RUNS_FOLDER"""
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', run_id or ''):
+        raise ValueError(f"Invalid run id: {run_id}")
+    return os.path.join(MAINTENANCE_RUNS_FOLDER, f"{run_id}.jsonl")
+
+
+def append_run_journal(run_id, event, **fields):
+    """Append one event to the run journal and force it to disk, so a crash loses at most the current table"""
+    if not run_id:
+        return
+    path = get_run_journal_path(run_id)
+    if not os.path.exists(MAINTENANCE_RUNS_FOLDER):
+        os.makedirs(MAINTENANCE_RUNS_FOLDER)
+    
+    entry = {'event': event, 'at': datetime.now().isoformat(timespec='seconds')} | fields
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_run_journal(run_id):
+    """Replay a run journal: start record, finished table results, remaining tables, finished flag"""
+    run = {'run_id': run_id, 'start': None, 'results': [], 'handled': set(), 'finished': False}
+    
+    with open(get_run_journal_path(run_id), 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            
+            if entry['event'] == 'start':
+                run['start'] = entry
+            elif entry['event'] == 'table_done':
+                run['results'].append(entry['result'])
+                run['handled'].add(entry['table'])
+            elif entry['event'] == 'table_deferred':
+                run['handled'].add(entry['table'])  # already in the deferred queue
+            elif entry['event'] == 'finish':
+                run['finished'] = True
+    
+    if not run['start']:
+        raise ValueError(f"Run {run_id} has no start record")
+    run['remaining'] = [table for table in run['start']['tables'] if table not in run['handled']]
+    return run
+
+
+def list_maintenance_runs():
+    """Summary of every journaled run, newest first"""
+    runs = []
+    if not os.path.exists(MAINTENANCE_RUNS_FOLDER):
+        return runs
+    
+    for file_name in sorted(os.listdir(MAINTENANCE_RUNS_FOLDER), reverse=True):
+        if not file_name.endswith('.jsonl'):
+            continue
+        try:
+            run = read_run_journal(file_name[:-len('.jsonl')])
+        except Exception as e:
+            print(f"[LOG] Skipping journal {file_name}: {str(e)}")
+            continue
+        runs.append({
+            'run_id': run['run_id'],
+            'host': run['start'].get('host'),
+            'database': run['start'].get('database'),
+            'started_at': run['start']['at'],
+            'tables': len(run['start']['tables']),
+            'done': len(run['results']),
+            'remaining': len(run['remaining']),
+            'finished': run['finished']
+        })
+    return runs
+
+
+# ============================================================
+# OPERATION REGISTRY & CANCELLATION
+# ============================================================
+# Long-running operations register the MySQL connections they work on, so /cancel can KILL QUERY them
+running_operations = {}
+operations_lock = threading.Lock()
+
+
+class OperationCancelled(Exception):
+    """Raised inside an operation that was cancelled through /cancel"""
+
+
+def register_operation(operation_id, kind, host, user, password, database):
+    """Register a running operation; operation_id comes from the client (so it can cancel early) or is generated.
+    
+    An id that is already running gets a generated one instead, so the running operation keeps its cancel handle.
+    """
+    if not re.fullmatch(r'[A-Za-z0-9_\-]{1,64}', operation_id or ''):
+        operation_id = new_job_id(kind)
+    with operations_lock:
+        if operation_id in running_operations:
+            print(f"[LOG] Operation id {operation_id} is already running, using a new id")
+            operation_id = new_job_id(kind)
+            while operation_id in running_operations:
+                operation_id = new_job_id(kind)
+        running_operations[operation_id] = {
+            'kind': kind,
+            'credentials': (host, user, password, database),
+            'database': database,
+            'connection_ids': set(),
+            'cancelled': False,
+            'protected': 0,
+            'started_at': datetime.now().isoformat(timespec='seconds')
+        }
+    return operation_id
+
+
+def attach_connection(operation_id, connection):
+    """Add a connection to an operation; returns its connection id (None without an operation)"""
+    if not operation_id:
+        return None
+    connection_id = get_connection_id(connection)
+    with operations_lock:
+        operation = running_operations.get(operation_id)
+        if operation:
+            operation['connection_ids'].add(connection_id)
+    return connection_id
+
+
+def detach_connection(operation_id, connection_id):
+    """Remove a connection before it is closed or reused, so a recycled thread id is never killed"""
+    with operations_lock:
+        operation = running_operations.get(operation_id)
+        if operation:
+            operation['connection_ids'].discard(connection_id)
+
+
+def unregister_operation(operation_id):
+    """Forget a finished operation"""
+    with operations_lock:
+        running_operations.pop(operation_id, None)
+
+
+def is_cancelled(operation_id):
+    """True once /cancel was called for operation_id"""
+    with operations_lock:
+        operation = running_operations.get(operation_id)
+        return bool(operation and operation['cancelled'])
+
+
+def check_cancelled(operation_id):
+    """Raise OperationCancelled between steps of a cancelled operation"""
+    if is_cancelled(operation_id):
+        raise OperationCancelled(f"Operation {operation_id} cancelled")
+
+
+@contextmanager
+def operation_unkillable(operation_id):
+    """Mark a statement of an operation as not safe to kill (MyISAM REPAIR/OPTIMIZE); /cancel then waits for it"""
+    with operations_lock:
+        operation = running_operations.get(operation_id)
+        if operation:
+            operation['protected'] += 1
+    try:
+        yield
+    finally:
+        with operations_lock:
+            operation = running_operations.get(operation_id)
+            if operation:
+                operation['protected'] -= 1
+
+
+def cancel_operation(operation_id):
+    """Mark an operation cancelled and KILL QUERY every statement it is running; returns (found, killed, postponed).
+    
+    While an unkillable statement runs nothing is killed (postponed=True): the operation stops after it.
+    """
+    with operations_lock:
+        operation = running_operations.get(operation_id)
+        if not operation:
+            return False, 0, False
+        operation['cancelled'] = True
+        if operation['protected']:
+            print(f"[LOG] Operation {operation_id} cancelled, stopping after the running REPAIR/OPTIMIZE")
+            return True, 0, True
+        connection_ids = list(operation['connection_ids'])
+        credentials = operation['credentials']
+    
+    killed = 0
+    for connection_id in connection_ids:
+        try:
+            kill_query(*credentials, connection_id)
+            killed += 1
+        except Exception as e:
+            print(f"[LOG] Could not kill query {connection_id}: {str(e)}")
+    print(f"[LOG] Operation {operation_id} cancelled ({killed} statement(s) killed)")
+    return True, killed, False
+
+
+# ============================================================
+# SALDO ARCHIVE PARTITIONING (EXCHANGE PARTITION)
+# ============================================================
+SALDO_TABLE = 'th_barang_saldo'
+SALDO_PARTITION_COLUMN = 'tanggal'
+SALDO_PARTITION_COLUMN_TYPES = ('date', 'datetime', 'char', 'varchar')  # RANGE COLUMNS accepts these
+SALDO_FUTURE_PARTITIONS = 3     # months kept ready ahead of the current month
+SALDO_MAX_HISTORY_MONTHS = 120  # older rows go to the p_before partition
+
+
+def month_partition_name(month):
+    """'2026-09' -> 'p202609'"""
+    return 'p' + month.replace('-', '')
+
+
+def add_months(month, count):
+    """'2026-11' + 3 -> '2027-02'"""
+    year, month_number = (int(part) for part in month.split('-'))
+    index = year * 12 + month_number - 1 + count
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def month_partition_clause(month):
+    """Partition definition holding exactly one month"""
+    return f"PARTITION {month_partition_name(month)} VALUES LESS THAN ('{add_months(month, 1)}-01')"
+
+
+def get_table_partitions(connection, table_name):
+    """Partitions of a table in order (name, upper bound, estimated rows); [] when it is not partitioned"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (table_name,))
+        return [{'name': row['PARTITION_NAME'], 'description': row['PARTITION_DESCRIPTION'],
+                 'rows': int(row['TABLE_ROWS'] or 0)} for row in cursor.fetchall()]
+    except Exception:
+        return []  # 5.0: no information_schema.PARTITIONS, nothing is partitioned
+    finally:
+        cursor.close()
+
+
+def inspect_saldo_partitioning(connection, capabilities):
+    """Can th_barang_saldo be converted to monthly RANGE partitions? Returns blockers, layout and the DDL"""
+    blockers = []
+    if not capabilities.get('supports_exchange_partition'):
+        blockers.append(f"MySQL {capabilities.get('version')} has no EXCHANGE PARTITION (needs 5.6+ with partitioning)")
+    
+    partitions = get_table_partitions(connection, SALDO_TABLE)
+    result = {'partitioned': bool(partitions), 'partitions': partitions, 'blockers': blockers, 'ddl': None}
+    if partitions or blockers:
+        return result
+    
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT DATA_TYPE FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """, (SALDO_TABLE, SALDO_PARTITION_COLUMN))
+        row = cursor.fetchone()
+        if not row:
+            blockers.append(f"{SALDO_TABLE}.{SALDO_PARTITION_COLUMN} not found")
+        elif row['DATA_TYPE'].lower() not in SALDO_PARTITION_COLUMN_TYPES:
+            blockers.append(f"{SALDO_PARTITION_COLUMN} is {row['DATA_TYPE']}, RANGE COLUMNS needs one of {', '.join(SALDO_PARTITION_COLUMN_TYPES)}")
+        
+        # Every unique key of a partitioned table must contain the partitioning column
+        indexes = get_table_indexes(connection, SALDO_TABLE) or {}
+        cursor.execute(f"SHOW INDEX FROM `{SALDO_TABLE}` WHERE Non_unique = 0")
+        unique_keys = {row['Key_name'] for row in cursor.fetchall()}
+        for key_name in sorted(unique_keys):
+            if SALDO_PARTITION_COLUMN not in indexes.get(key_name, []):
+                blockers.append(f"Unique key {key_name} ({', '.join(indexes.get(key_name, []))}) does not include {SALDO_PARTITION_COLUMN}")
+        
+        cursor.execute("""
+            SELECT COUNT(*) as count FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+            AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+        """, (SALDO_TABLE, SALDO_TABLE))
+        if cursor.fetchone()['count']:
+            blockers.append("Partitioned tables cannot have foreign keys")
+        
+        # 8.0 partitions only InnoDB (native partitioning); 5.x also accepts MyISAM
+        engine = (get_table_status(connection, SALDO_TABLE) or {}).get('Engine') or ''
+        if tuple(capabilities.get('version_tuple') or ()) >= (8, 0, 0) and engine.lower() != 'innodb':
+            blockers.append(f"MySQL {capabilities.get('version')} only partitions InnoDB tables, {SALDO_TABLE} is {engine}")
+        
+        cursor.execute(f"SELECT MIN({SALDO_PARTITION_COLUMN}) as first FROM `{SALDO_TABLE}`")
+        first = str(cursor.fetchone()['first'] or '')
+    finally:
+        cursor.close()
+    
+    current_month = datetime.now().strftime('%Y-%m')
+    oldest_month = add_months(current_month, -SALDO_MAX_HISTORY_MONTHS)
+    first_month = first[:7] if re.fullmatch(r'\d{4}-\d{2}', first[:7]) else current_month
+    first_month = min(max(first_month, oldest_month), current_month)
+    
+    months = [first_month]
+    while months[-1] < add_months(current_month, SALDO_FUTURE_PARTITIONS):
+        months.append(add_months(months[-1], 1))
+    
+    # p_before catches older, NULL and malformed dates; pmax anything past the prepared months
+    clauses = [f"PARTITION p_before VALUES LESS THAN ('{first_month}-01')"]
+    clauses += [month_partition_clause(month) for month in months]
+    clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    
+    # Repartitioning always copies the table (ALGORITHM=COPY: readable, writes wait until it finishes)
+    result['months'] = [months[0], months[-1]]
+    result['ddl'] = (f"ALTER TABLE `{SALDO_TABLE}` PARTITION BY RANGE COLUMNS({SALDO_PARTITION_COLUMN}) (\n    "
+                     + ",\n    ".join(clauses) + "\n)")
+    return result
+
+
+def ensure_future_saldo_partitions(connection, partitions=None):
+    """Split pmax so the next SALDO_FUTURE_PARTITIONS months have their own partition; returns months added"""
+    partitions = partitions if partitions is not None else get_table_partitions(connection, SALDO_TABLE)
+    names = {partition['name'] for partition in partitions}
+    if 'pmax' not in names:
+        return []
+    
+    monthly = sorted(name for name in names if re.fullmatch(r'p\d{6}', name))
+    next_month = f"{monthly[-1][1:5]}-{monthly[-1][5:7]}" if monthly else datetime.now().strftime('%Y-%m')
+    last_month = add_months(datetime.now().strftime('%Y-%m'), SALDO_FUTURE_PARTITIONS)
+    
+    months = []
+    while next_month < last_month:
+        next_month = add_months(next_month, 1)
+        months.append(next_month)
+    if not months:
+        return []
+    
+    # pmax is (nearly) empty, so the reorganize only copies the few rows already dated that far ahead
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"ALTER TABLE `{SALDO_TABLE}` REORGANIZE PARTITION pmax INTO ("
+                       + ", ".join(month_partition_clause(month) for month in months)
+                       + ", PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+    finally:
+        cursor.close()
+    print(f"[SALDO] Added partitions {', '.join(month_partition_name(m) for m in months)}")
+    return months
+
+
+def remove_partitioning(connection, table_name):
+    """Make a (monthly) table plain again; CREATE TABLE ... LIKE copies the partitioning of th_barang_saldo"""
+    if not get_table_partitions(connection, table_name):
+        return False
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"ALTER TABLE `{table_name}` REMOVE PARTITIONING")
+    finally:
+        cursor.close()
+    return True
+
+
+def find_exchange_partition(connection, capabilities, check_date):
+    """Partition holding exactly the month check_date, or None (not partitioned / no exchange support)"""
+    if not capabilities or not capabilities.get('supports_exchange_partition'):
+        return None
+    name = month_partition_name(check_date)
+    for partition in get_table_partitions(connection, SALDO_TABLE):
+        if partition['name'] == name:
+            return partition
+    return None
+
+
+def exchange_saldo_partition(connection, monthly_table, partition):
+    """Swap a month's partition with the empty monthly table: metadata only, whatever the row count.
+    
+    Returns the exact number of rows moved (counted in the monthly table after the swap).
+    """
+    remove_partitioning(connection, monthly_table)
+    
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT 1 FROM `{monthly_table}` LIMIT 1")
+        if cursor.fetchone():
+            raise ValueError(f"{monthly_table} is not empty, cannot exchange partition {partition['name']}")
+        
+        cursor.execute(f"ALTER TABLE `{SALDO_TABLE}` EXCHANGE PARTITION {partition['name']} WITH TABLE `{monthly_table}`")
+        
+        # information_schema TABLE_ROWS is only an estimate: count what actually moved
+        cursor.execute(f"SELECT COUNT(*) as count FROM `{monthly_table}`")
+        moved_count = int(cursor.fetchone()['count'])
+    finally:
+        cursor.close()
+    print(f"[SALDO] Exchanged partition {partition['name']} with {monthly_table} ({moved_count:,} rows)")
+    
+    try:
+        ensure_future_saldo_partitions(connection)
+    except Exception as e:
+        print(f"[SALDO] Could not add future partitions: {str(e)}")
+    return moved_count
+
+
+# ============================================================
+# CLOSED ARCHIVE COMPRESSION
+# ============================================================
+ARCHIVE_TABLE_PATTERN = re.compile(r'th_barang_saldo_(\d{4})(\d{2})')
+COMPACT_ROW_FORMATS = ('compressed',)
+
+
+def get_closed_archive_month(table_name, quiet_days, now=None):
+    """'th_barang_saldo_202608' -> '2026-08' when the month ended more than quiet_days ago, else None"""
+    match = ARCHIVE_TABLE_PATTERN.fullmatch(table_name)
+    if not match:
+        return None
+    month = f"{match.group(1)}-{match.group(2)}"
+    closed_on = datetime.strptime(add_months(month, 1) + '-01', '%Y-%m-%d')
+    if ((now or datetime.now()) - closed_on).days < quiet_days:
+        return None
+    return month
+
+
+def choose_archive_format(status, capabilities):
+    """(format, ALTER clause) for a closed archive table, or (None, reason) when it cannot or need not be compacted"""
+    engine = (status.get('Engine') or '').lower()
+    row_format = (status.get('Row_format') or '').lower()
+    if engine == 'archive' or row_format in COMPACT_ROW_FORMATS:
+        return None, f"already compact ({status.get('Engine')} {status.get('Row_format')})"
+    
+    version = tuple(capabilities.get('version_tuple') or (0, 0, 0))
+    file_format = (capabilities.get('innodb_file_format') or '').lower()
+    innodb_compressed = (version >= (5, 5, 0) and 'InnoDB' in capabilities.get('available_engines', [])
+                         and capabilities.get('innodb_file_per_table') and file_format in ('barracuda', ''))
+    key_block_size = load_maintenance_settings()['archive_key_block_size']
+    
+    # MyISAM is moved to compressed InnoDB too: it keeps every index, unlike the ARCHIVE engine
+    if innodb_compressed and engine in ('innodb', 'myisam'):
+        return 'INNODB COMPRESSED', f"ENGINE=InnoDB, ROW_FORMAT=COMPRESSED, KEY_BLOCK_SIZE={key_block_size}"
+    if engine == 'myisam' and 'ARCHIVE' in capabilities.get('available_engines', []):
+        return 'ARCHIVE', "ENGINE=ARCHIVE"
+    if engine == 'myisam':
+        return None, "no compressed InnoDB or ARCHIVE engine; pack with myisampack on the server"
+    return None, "ROW_FORMAT=COMPRESSED needs MySQL 5.5+, innodb_file_per_table and Barracuda"
+
+
+def find_closed_archives(connection, capabilities, quiet_days, all_status=None):
+    """Closed monthly archive tables with the planned conversion or the reason they are skipped"""
+    all_status = all_status if all_status is not None else get_all_table_status(connection)
+    now = datetime.now()
+    candidates = []
+    for table_name, status in sorted(all_status.items()):
+        match = ARCHIVE_TABLE_PATTERN.fullmatch(table_name)
+        if not match:
+            continue
+        month = get_closed_archive_month(table_name, quiet_days, now)
+        
+        entry = {
+            'table': table_name,
+            'month': f"{match.group(1)}-{match.group(2)}",
+            'engine': status.get('Engine'),
+            'row_format': status.get('Row_format'),
+            'rows': int(status.get('Rows') or 0),
+            'size_mb': round(((status.get('Data_length') or 0) + (status.get('Index_length') or 0)) / (1024 * 1024), 2),
+            'format': None,
+            'reason': None
+        }
+        update_time = status.get('Update_time')
+        if not month:
+            entry['reason'] = f"month not closed for {quiet_days} days yet"
+        elif isinstance(update_time, datetime) and (now - update_time).days < quiet_days:
+            entry['reason'] = f"written recently ({update_time:%Y-%m-%d %H:%M})"
+        else:
+            entry['format'], detail = choose_archive_format(status, capabilities)
+            if entry['format']:
+                entry['alter'] = detail
+            else:
+                entry['reason'] = detail
+        candidates.append(entry)
+    return candidates
+
+
+def time_full_scan(connection, table_name):
+    """Seconds for a full read of the table (CHECKSUM TABLE ... EXTENDED reads every row on every engine)"""
+    cursor = connection.cursor()
+    try:
+        started = time.time()
+        cursor.execute(f"CHECKSUM TABLE `{table_name}` EXTENDED")
+        cursor.fetchall()
+        return round(time.time() - started, 3)
+    finally:
+        cursor.close()
+
+
+def archive_engine_alter(connection, table_name, alter):
+    """ENGINE=ARCHIVE only allows one index, on the AUTO_INCREMENT column: drop every other index (PRIMARY too)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SHOW COLUMNS FROM `{table_name}`")
+        auto_column = next((row['Field'] for row in cursor.fetchall() if 'auto_increment' in (row['Extra'] or '').lower()), None)
+    finally:
+        cursor.close()
+    
+    indexes = get_table_indexes(connection, table_name) or {}
+    kept = None
+    if auto_column:
+        single = [name for name, columns in indexes.items() if columns == [auto_column.lower()]]
+        kept = 'PRIMARY' if 'PRIMARY' in single else next(iter(single), None)
+    
+    clauses = ["DROP PRIMARY KEY" if name == 'PRIMARY' else f"DROP INDEX `{name}`" for name in indexes if name != kept]
+    if auto_column and not kept:
+        # The AUTO_INCREMENT column must stay indexed
+        clauses.append(f"ADD INDEX (`{auto_column}`)")
+    return ', '.join(clauses + [alter])
+
+
+def compress_archive_table(connection, table_name, candidate, capabilities):
+    """Convert one closed archive table; measures size and full-scan time before and after"""
+    # The statement is settled before the (long) timing scan, so a table that cannot convert fails fast
+    alter = candidate['alter']
+    if candidate['format'] == 'ARCHIVE':
+        alter = archive_engine_alter(connection, table_name, alter)
+    elif capabilities.get('supports_online_ddl') and (candidate['engine'] or '').lower() == 'innodb':
+        alter += ", ALGORITHM=INPLACE, LOCK=NONE"
+    
+    before_scan = time_full_scan(connection, table_name)
+    before_mb = candidate['size_mb']
+    
+    started = time.time()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"ALTER TABLE `{table_name}` {alter}")
+    finally:
+        cursor.close()
+    convert_seconds = round(time.time() - started, 1)
+    
+    status = get_table_status(connection, table_name) or {}
+    after_mb = round(((status.get('Data_length') or 0) + (status.get('Index_length') or 0)) / (1024 * 1024), 2)
+    after_scan = time_full_scan(connection, table_name)
+    
+    return {
+        'table': table_name,
+        'format': candidate['format'],
+        'status': 'CONVERTED',
+        'before_mb': before_mb,
+        'after_mb': after_mb,
+        'saved_mb': round(before_mb - after_mb, 2),
+        'ratio': round(after_mb / before_mb, 3) if before_mb else None,
+        'scan_seconds_before': before_scan,
+        'scan_seconds_after': after_scan,
+        'convert_seconds': convert_seconds
+    }
+
+
+# ============================================================
+# ARCHIVE OFFLOAD TO ANOTHER SERVER
+# ============================================================
+OFFLOAD_CHUNK_ROWS = 5000
+OFFLOAD_PACKET_SHARE = 0.8  # multi-row INSERTs stay below this share of the target's max_allowed_packet
+LOAD_DATA_ESCAPES = {b'\\': b'\\\\', b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r', b'\x00': b'\\0'}
+
+
+def get_table_columns(connection, table_name):
+    """Column names of a table in definition order"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SHOW COLUMNS FROM `{table_name}`")
+        return [row['Field'] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def row_hash_expression(columns):
+    """Per-row CRC32 over every column; NULL is hashed distinctly from the empty string"""
+    values = ', '.join(f"COALESCE(CAST(`{column}` AS CHAR), '\\\\N')" for column in columns)
+    return f"CRC32(CONCAT_WS('#', {values}))"
+
+
+def get_table_hash(connection, table_name, columns, where='', params=None):
+    """Order-independent content hash computed on the server: row count, BIT_XOR and SUM of the row CRC32s"""
+    row_hash = row_hash_expression(columns)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT COUNT(*) as row_count, BIT_XOR({row_hash}) as hash_xor, SUM({row_hash}) as hash_sum
+            FROM `{table_name}` {where}
+        """, params)
+        row = cursor.fetchone()
+        return {'rows': int(row['row_count']), 'xor': int(row['hash_xor'] or 0), 'sum': int(row['hash_sum'] or 0)}
+    finally:
+        cursor.close()
+
+
+def load_data_field(value):
+    """One LOAD DATA field: \\N for NULL, tab/newline/backslash escaped"""
+    if value is None:
+        return b'\\N'
+    if isinstance(value, (bytes, bytearray)):
+        raw = bytes(value)
+    else:
+        raw = str(value).encode('utf-8')
+    for char, escaped in LOAD_DATA_ESCAPES.items():
+        raw = raw.replace(char, escaped)
+    return raw
+
+
+def load_rows_with_load_data(target, table_name, columns, rows):
+    """Bulk load one chunk with LOAD DATA LOCAL INFILE from a temporary file"""
+    import tempfile
+    
+    handle, path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            for row in rows:
+                f.write(b'\t'.join(load_data_field(value) for value in row) + b'\n')
+        cursor = target.cursor()
+        try:
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE `{table_name}` CHARACTER SET utf8
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'
+                ({', '.join(f'`{c}`' for c in columns)})
+            """, (path,))
+            return cursor.rowcount
+        finally:
+            cursor.close()
+    finally:
+        os.remove(path)
+
+
+def load_rows_with_insert(target, table_name, columns, rows, max_packet):
+    """Load one chunk as multi-row INSERTs, each statement sized to fit max_packet bytes"""
+    header = f"INSERT INTO `{table_name}` ({', '.join(f'`{c}`' for c in columns)}) VALUES "
+    budget = int(max_packet * OFFLOAD_PACKET_SHARE) - len(header)
+    loaded = 0
+    cursor = target.cursor()
+    try:
+        batch, batch_size = [], 0
+        for row in rows:
+            values = '(' + ', '.join(target.escape(value) for value in row) + ')'
+            if batch and batch_size + len(values) + 2 > budget:
+                cursor.execute(header + ', '.join(batch))
+                loaded += cursor.rowcount
+                batch, batch_size = [], 0
+            batch.append(values)
+            batch_size += len(values) + 2
+        if batch:
+            cursor.execute(header + ', '.join(batch))
+            loaded += cursor.rowcount
+        return loaded
+    finally:
+        cursor.close()
+
+
+def offload_archive_events(source, target, table_name, source_capabilities, target_capabilities, method='auto',
+                           drop_source=False, operation_id=None, verify_pools=None):
+    """Copy a closed archive table to the archive server in chunks, verify it, optionally drop the source.
+    
+    verify_pools: (source pool, target pool) to hash-verify chunks in parallel; without it the verification
+    runs chunk by chunk on the two connections. Yields progress events; the last one is 'complete'.
+    Raises on failure (the source is never dropped then); the partial copy on the target is removed first.
+    """
+    cursor = source.cursor()
+    cursor.execute(f"SHOW CREATE TABLE `{table_name}`")
+    create_sql = list(cursor.fetchone().values())[1]
+    cursor.close()
+    columns = get_table_columns(source, table_name)
+    
+    # Target table: created from the source DDL, or an empty leftover of an earlier attempt
+    cursor = target.cursor()
+    cursor.execute("SHOW TABLES LIKE %s", (table_name,))
+    if cursor.fetchone():
+        cursor.execute(f"SELECT COUNT(*) as count FROM `{table_name}`")
+        existing = cursor.fetchone()['count']
+        if existing:
+            cursor.close()
+            raise ValueError(f"{table_name} already exists on the archive server with {existing:,} rows")
+        created = False
+    else:
+        cursor.execute(create_sql)
+        created = True
+    cursor.close()
+    
+    result = {}
+    try:
+        yield from copy_and_verify_archive(source, target, table_name, columns, target_capabilities, method,
+                                           operation_id, verify_pools, result)
+        check_cancelled(operation_id)
+    except BaseException:
+        # Failed, cancelled or abandoned: never leave a half-filled table on the archive server
+        discard_offload_target(target, table_name, created)
+        raise
+    
+    dropped = False
+    if drop_source:
+        cursor = source.cursor()
+        cursor.execute(f"DROP TABLE `{table_name}`")
+        cursor.close()
+        dropped = True
+    
+    yield {
+        'type': 'complete',
+        'success': True,
+        'table': table_name,
+        'method': result['method'],
+        'rows': result['copied'],
+        'copy_seconds': result['copy_seconds'],
+        'verified': result['verified'],
+        'verification': result['verification'],
+        'source_dropped': dropped,
+        'message': f"✓ {table_name}: {result['copied']:,} rows offloaded and verified" + (", source table dropped" if dropped else "")
+    }
+
+
+def discard_offload_target(target, table_name, created):
+    """Remove what an unfinished offload wrote: drop the table it created, empty a leftover it reused"""
+    try:
+        target.rollback()
+        cursor = target.cursor()
+        try:
+            cursor.execute(f"{'DROP TABLE' if created else 'TRUNCATE TABLE'} `{table_name}`")
+        finally:
+            cursor.close()
+        print(f"[OFFLOAD] Partial copy of {table_name} on the archive server {'dropped' if created else 'truncated'}")
+    except Exception as e:
+        print(f"[OFFLOAD] Could not remove the partial copy of {table_name}: {str(e)}")
+
+
+def copy_and_verify_archive(source, target, table_name, columns, target_capabilities, method, operation_id,
+                            verify_pools, result):
+    """Stream the rows into the target table and chunk-verify the copy; fills result, yields progress events"""
+    import pymysql.cursors
+    
+    if method == 'auto':
+        method = 'load_data' if target_capabilities.get('local_infile') else 'insert'
+    max_packet = target_capabilities.get('max_allowed_packet') or 1024 * 1024
+    total_estimate = int((get_table_status(source, table_name) or {}).get('Rows') or 0)
+    yield {'type': 'progress', 'step': 'copy', 'current': 0, 'total': total_estimate,
+           'message': f'Copying {table_name} (~{total_estimate:,} rows, {method})...'}
+    
+    # Unbuffered server-side cursor: rows stream in, only one chunk is held in memory
+    started = time.time()
+    copied = 0
+    stream = source.cursor(pymysql.cursors.SSCursor)
+    try:
+        stream.execute(f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM `{table_name}`")
+        while True:
+            rows = stream.fetchmany(OFFLOAD_CHUNK_ROWS)
+            if not rows:
+                break
+            check_cancelled(operation_id)
+            if method == 'load_data':
+                load_rows_with_load_data(target, table_name, columns, rows)
+            else:
+                load_rows_with_insert(target, table_name, columns, rows, max_packet)
+            target.commit()
+            copied += len(rows)
+            yield {'type': 'progress', 'step': 'copy', 'current': copied, 'total': max(total_estimate, copied),
+                   'message': f'Copied {copied:,} rows ({copied / max(time.time() - started, 0.001):,.0f} rows/s)'}
+    finally:
+        stream.close()
+    copy_seconds = round(time.time() - started, 1)
+    
+    yield {'type': 'progress', 'step': 'verify', 'message': 'Verifying row counts and chunk checksums...'}
+    if verify_pools:
+        source_pool, target_pool = verify_pools
+        workers = VERIFY_WORKERS
+    else:
+        source_pool, target_pool = SharedConnectionPool(source), SharedConnectionPool(target)
+        workers = 1
+    side = {'table': table_name, 'where': '', 'params': ()}
+    verification = verify_table_chunks(source_pool, target_pool, side, side, columns,
+                                       chunk_column=choose_chunk_column(source, table_name, columns), workers=workers)
+    verified = verification['match']
+    if not verified:
+        raise ValueError(f"Verification failed: {verification['mismatched_chunks']} of {verification['chunks']} chunks differ, "
+                         f"{verification['missing_in_target']:,} rows missing and {verification['extra_in_target']:,} extra "
+                         f"on the archive server. Source table kept.")
+    
+    result.update({'method': method, 'copied': copied, 'copy_seconds': copy_seconds, 'verified': verified,
+                   'verification': verification})
+
+
+# ============================================================
+# CHUNK-HASH VERIFICATION
+# ============================================================
+VERIFY_CHUNK_ROWS = 10000
+VERIFY_WORKERS = 4
+VERIFY_MAX_FETCH_ROWS = 200000  # mismatching chunks larger than this report counts only
+VERIFY_MAX_REPORTED_ROWS = 100
+
+# Key projection the Smart Audit compares: tm_barang TOKO items vs tt_barang_saldo TOKO rows
+AUDIT_KEY_VERIFY_SIDES = (
+    {'table': 'tm_barang', 'where': "kode_lokasi_gudang = 'TOKO' AND stock_on_hand*1 > 0", 'params': ()},
+    {'table': 'tt_barang_saldo', 'where': "kode_lokasi_gudang = 'TOKO' AND stock_akhir*1 > 0", 'params': ()}
+)
+
+
+class SharedConnectionPool:
+    """Pool interface over one connection, for verifying inside an open transaction (one worker)"""
+    
+    def __init__(self, connection):
+        self.connection = connection
+    
+    def get(self):
+        return self.connection
+    
+    def put(self, connection):
+        pass
+    
+    def close_all(self):
+        pass
+
+
+def choose_chunk_column(connection, table_name, columns):
+    """Leading column of the primary key, else of any index, else the first column"""
+    indexes = get_table_indexes(connection, table_name) or {}
+    key_columns = indexes.get('PRIMARY') or next(iter(indexes.values()), None)
+    if key_columns and key_columns[0] in [c.lower() for c in columns]:
+        return columns[[c.lower() for c in columns].index(key_columns[0])]
+    return columns[0]
+
+
+def plan_verify_chunks(connection, side, chunk_column, chunk_rows=VERIFY_CHUNK_ROWS):
+    """Ranges of chunk_column holding about chunk_rows rows each (keyset walk on the source), plus a NULL chunk"""
+    if not chunk_column:
+        return [{'low': None, 'high': None, 'all': True}]
+    
+    base = f"({side['where']})" if side.get('where') else "1=1"
+    cursor = connection.cursor()
+    boundaries = []
+    try:
+        low = None
+        while True:
+            if low is None:
+                clause, params = f"`{chunk_column}` IS NOT NULL", ()
+            else:
+                clause, params = f"`{chunk_column}` >= %s", (low,)
+            cursor.execute(f"""
+                SELECT `{chunk_column}` as boundary FROM `{side['table']}`
+                WHERE {base} AND {clause} ORDER BY `{chunk_column}` LIMIT 1 OFFSET {int(chunk_rows)}
+            """, tuple(side.get('params') or ()) + params)
+            row = cursor.fetchone()
+            if not row:
+                break
+            value = row['boundary']
+            if low is not None and value == low:
+                # More than chunk_rows rows share this value: the next chunk starts at the next distinct value
+                cursor.execute(f"""
+                    SELECT MIN(`{chunk_column}`) as boundary FROM `{side['table']}` WHERE {base} AND `{chunk_column}` > %s
+                """, tuple(side.get('params') or ()) + (low,))
+                value = cursor.fetchone()['boundary']
+                if value is None:
+                    break
+            boundaries.append(value)
+            low = value
+    finally:
+        cursor.close()
+    
+    edges = [None] + boundaries + [None]
+    chunks = [{'low': edges[i], 'high': edges[i + 1]} for i in range(len(edges) - 1)]
+    chunks.append({'null': True})
+    return chunks
+
+
+def chunk_where(side, chunk, chunk_column):
+    """WHERE clause + params selecting one chunk of one side"""
+    clauses = [f"({side['where']})"] if side.get('where') else []
+    params = list(side.get('params') or ())
+    if chunk.get('null'):
+        clauses.append(f"`{chunk_column}` IS NULL")
+    elif not chunk.get('all'):
+        clauses.append(f"`{chunk_column}` IS NOT NULL")
+        if chunk['low'] is not None:
+            clauses.append(f"`{chunk_column}` >= %s")
+            params.append(chunk['low'])
+        if chunk['high'] is not None:
+            clauses.append(f"`{chunk_column}` < %s")
+            params.append(chunk['high'])
+    return ("WHERE " + " AND ".join(clauses)) if clauses else '', (tuple(params) or None)
+
+
+def fetch_chunk_rows(connection, side, chunk, chunk_column, columns):
+    """Rows of one chunk as value tuples"""
+    import pymysql.cursors
+    
+    where, params = chunk_where(side, chunk, chunk_column)
+    cursor = connection.cursor(pymysql.cursors.Cursor)
+    try:
+        cursor.execute(f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM `{side['table']}` {where}", params)
+        return list(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def verify_table_chunks(source_pool, target_pool, source, target, columns, chunk_column=None,
+                        chunk_rows=VERIFY_CHUNK_ROWS, workers=VERIFY_WORKERS, normalize=None):
+    """Compare two tables (or filtered subsets, possibly on different servers) chunk by chunk.
+    
+    Each chunk is hashed on both servers (COUNT, BIT_XOR/SUM of row CRC32s); only mismatching chunks
+    are fetched and diffed row by row. normalize(row) -> comparable tuple for that diff.
+    """
+    normalize = normalize or (lambda row: tuple('' if value is None else str(value) for value in row))
+    started = time.time()
+    
+    planner = source_pool.get()
+    try:
+        chunks = plan_verify_chunks(planner, source, chunk_column, chunk_rows)
+    finally:
+        source_pool.put(planner)
+    
+    def hash_chunk(chunk):
+        hashes = []
+        for pool, side in ((source_pool, source), (target_pool, target)):
+            connection = pool.get()
+            try:
+                where, params = chunk_where(side, chunk, chunk_column)
+                hashes.append(get_table_hash(connection, side['table'], columns, where, params))
+            finally:
+                pool.put(connection)
+        return chunk, hashes[0], hashes[1]
+    
+    if workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashed = list(executor.map(hash_chunk, chunks))
+    else:
+        hashed = [hash_chunk(chunk) for chunk in chunks]
+    
+    rows_source = sum(source_hash['rows'] for _, source_hash, _ in hashed)
+    rows_target = sum(target_hash['rows'] for _, _, target_hash in hashed)
+    mismatched = [(chunk, source_hash, target_hash) for chunk, source_hash, target_hash in hashed if source_hash != target_hash]
+    
+    missing, extra = Counter(), Counter()
+    detail_skipped = 0
+    for chunk, source_hash, target_hash in mismatched:
+        if max(source_hash['rows'], target_hash['rows']) > VERIFY_MAX_FETCH_ROWS:
+            detail_skipped += 1
+            continue
+        fetched = []
+        for pool, side in ((source_pool, source), (target_pool, target)):
+            connection = pool.get()
+            try:
+                fetched.append(Counter(normalize(row) for row in fetch_chunk_rows(connection, side, chunk, chunk_column, columns)))
+            finally:
+                pool.put(connection)
+        missing += fetched[0] - fetched[1]
+        extra += fetched[1] - fetched[0]
+    
+    return {
+        'match': not missing and not extra and not detail_skipped and rows_source == rows_target,
+        'chunk_column': chunk_column,
+        'chunks': len(chunks),
+        'mismatched_chunks': len(mismatched),
+        'detail_skipped_chunks': detail_skipped,
+        'rows_source': rows_source,
+        'rows_target': rows_target,
+        'missing_in_target': sum(missing.values()),
+        'extra_in_target': sum(extra.values()),
+        'missing_sample': [list(row) for row in list(missing.elements())[:VERIFY_MAX_REPORTED_ROWS]],
+        'extra_sample': [list(row) for row in list(extra.elements())[:VERIFY_MAX_REPORTED_ROWS]],
+        'seconds': round(time.time() - started, 2)
+    }
+
+
+def verify_audit_keys(host, user, password, database, workers=VERIFY_WORKERS):
+    """Fast re-audit after fixes: tm_barang vs tt_barang_saldo TOKO keys, chunked by kode_barang"""
+    pool = MySQLConnectionPool(host, user, password, database, size=workers * 2)
+    try:
+        source, target = AUDIT_KEY_VERIFY_SIDES
+        return verify_table_chunks(pool, pool, source, target, ['kode_barang', 'kode_lokasi_toko'],
+                                   chunk_column='kode_barang', workers=workers,
+                                   normalize=lambda row: audit_key(row[0], row[1]))
+    finally:
+        pool.close_all()
+
+
+# ============================================================
+# SMART AUDIT - SNAPSHOT EXTRACTION & OFFLINE COMPARE
+# ============================================================
+AUDIT_TM_QUERY = """
+    SELECT kode_barang, kode_lokasi_toko, stock_on_hand*1 as stock
+    FROM tm_barang 
+    WHERE kode_lokasi_gudang = 'TOKO' 
+    AND stock_on_hand*1 > 0
+    {key_range}
+    ORDER BY kode_barang
+"""
+
+AUDIT_TT_QUERY = """
+    SELECT kode_barang, kode_lokasi_toko, kode_lokasi_gudang, stock_akhir*1 as stock
+    FROM tt_barang_saldo
+    WHERE stock_akhir*1 > 0
+    {key_range}
+    ORDER BY kode_barang
+"""
+
+AUDIT_MAX_SHARDS = 8
+
+# Columns and predicates (of the queries above) hashed to key the local snapshot cache
+AUDIT_FINGERPRINT_SIDES = {
+    'tm_barang': (['kode_barang', 'kode_lokasi_toko', 'stock_on_hand'], "kode_lokasi_gudang = 'TOKO' AND stock_on_hand*1 > 0"),
+    'tt_barang_saldo': (['kode_barang', 'kode_lokasi_toko', 'kode_lokasi_gudang', 'stock_akhir'], "stock_akhir*1 > 0")
+}
+
+
+def audit_key(kode_barang, kode_lokasi):
+    """Normalize a (kode_barang, kode_lokasi) pair the way MySQL compares it (case-insensitive, trailing spaces ignored)"""
+    return (str(kode_barang or '').rstrip().upper(), str(kode_lokasi or '').rstrip().upper())
+
+
+def get_table_engines(connection, table_names):
+    """Get storage engine per table from information_schema"""
+    try:
+        cursor = connection.cursor()
+        placeholders = ', '.join(['%s'] * len(table_names))
+        cursor.execute(f"""
+            SELECT TABLE_NAME, ENGINE
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME IN ({placeholders})
+        """, tuple(table_names))
+        engines = {row['TABLE_NAME']: row['ENGINE'] for row in cursor.fetchall()}
+        cursor.close()
+        return engines
+    except Exception as e:
+        print(f"[LOG] Error getting table engines: {str(e)}")
+        return {}
+
+
+def begin_audit_snapshot(connection):
+    """Open a consistent read view so both audit phases see the same point in time"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        return True
+    except Exception as e:
+        print(f"[AUDIT] Consistent snapshot not available: {str(e)}")
+        return False
+    finally:
+        cursor.close()
+
+
+def get_key_range_clause(key_range):
+    """SQL predicate + params for a (low, high) kode_barang range, None means unbounded"""
+    if not key_range:
+        return '', ()
+    low, high = key_range
+    clauses = []
+    params = []
+    if low is not None:
+        clauses.append("AND kode_barang >= %s")
+        params.append(low)
+    if high is not None:
+        clauses.append("AND kode_barang < %s")
+        params.append(high)
+    return ' '.join(clauses), tuple(params)
+
+
+def fetch_audit_inputs(connection, key_range=None):
+    """Read the audit columns of tm_barang and tt_barang_saldo once, as plain tuples"""
+    import pymysql.cursors
+    
+    cursor = connection.cursor(pymysql.cursors.Cursor)
+    range_clause, range_params = get_key_range_clause(key_range)
+    
+    cursor.execute(AUDIT_TM_QUERY.format(key_range=range_clause), range_params)
+    tm_rows = list(cursor.fetchall())  # (kode_barang, kode_lokasi_toko, stock)
+    
+    cursor.execute(AUDIT_TT_QUERY.format(key_range=range_clause), range_params)
+    tt_rows = list(cursor.fetchall())  # (kode_barang, kode_lokasi_toko, kode_lokasi_gudang, stock)
+    
+    cursor.close()
+    return tm_rows, tt_rows
+
+
+# Issue type -> description; {count} is the duplicate count
+AUDIT_ISSUE_TEXT = {
+    'TM_NOT_IN_TT': '[TM→TT] Not found in tt_barang_saldo',
+    'TM_DUPLICATE_IN_TT': '[TM→TT] Duplicate in tt! Found {count} records',
+    'TT_NOT_IN_TM': '[TT→TM] Not found in tm_barang',
+    'TT_DUPLICATE_IN_TM': '[TT→TM] Duplicate in tm! Found {count} records'
+}
+
+
+def audit_issue_text(issue_type, count):
+    """Human readable description of an audit issue"""
+    return AUDIT_ISSUE_TEXT.get(issue_type, issue_type).format(count=count)
+
+
+def new_audit_counters():
+    """Running match / not found / duplicate counters of both phases"""
+    return {
+        'phase1': {'total_tm_barang': 0, 'match_tm_to_tt': 0, 'not_found': 0, 'duplicate': 0, 'issues': 0},
+        'phase2': {'total_tt_barang': 0, 'match_tt_to_tm': 0, 'not_found': 0, 'duplicate': 0, 'issues': 0}
+    }
+
+
+def classify_phase1_rows(tm_rows, tt_counts, counters):
+    """PHASE 1 for a batch of tm_barang rows: every item must have exactly one tt_barang_saldo row"""
+    phase1 = counters['phase1']
+    issues = []
+    for kode_barang, kode_lokasi, stock in tm_rows:
+        phase1['total_tm_barang'] += 1
+        tt_count = tt_counts.get(audit_key(kode_barang, kode_lokasi), 0)
+        
+        if tt_count == 0:
+            phase1['not_found'] += 1
+            issues.append({
+                'kode_barang': kode_barang,
+                'kode_lokasi': kode_lokasi,
+                'count_tt': 0,
+                'issue': 'TM_NOT_IN_TT',
+                'issue_text': audit_issue_text('TM_NOT_IN_TT', 0)
+            })
+        elif tt_count == 1:
+            phase1['match_tm_to_tt'] += 1
+        else:
+            phase1['duplicate'] += 1
+            issues.append({
+                'kode_barang': kode_barang,
+                'kode_lokasi': kode_lokasi,
+                'count_tt': tt_count,
+                'issue': 'TM_DUPLICATE_IN_TT',
+                'issue_text': audit_issue_text('TM_DUPLICATE_IN_TT', tt_count)
+            })
+    phase1['issues'] += len(issues)
+    return issues
+
+
+def classify_phase2_rows(tt_rows, tm_counts, counters):
+    """PHASE 2 for a batch of tt_barang_saldo rows: every TOKO row must have exactly one tm_barang item"""
+    phase2 = counters['phase2']
+    issues = []
+    for kode_barang, kode_lokasi, kode_lokasi_gudang, stock in tt_rows:
+        if str(kode_lokasi_gudang or '').rstrip().upper() != 'TOKO':
+            continue
+        phase2['total_tt_barang'] += 1
+        tm_count = tm_counts.get(audit_key(kode_barang, kode_lokasi), 0)
+        
+        if tm_count == 0:
+            phase2['not_found'] += 1
+            issues.append({
+                'kode_barang': kode_barang,
+                'kode_lokasi': kode_lokasi,
+                'count_tm': 0,
+                'issue': 'TT_NOT_IN_TM',
+                'issue_text': audit_issue_text('TT_NOT_IN_TM', 0)
+            })
+        elif tm_count == 1:
+            phase2['match_tt_to_tm'] += 1
+        else:
+            phase2['duplicate'] += 1
+            issues.append({
+                'kode_barang': kode_barang,
+                'kode_lokasi': kode_lokasi,
+                'count_tm': tm_count,
+                'issue': 'TT_DUPLICATE_IN_TM',
+                'issue_text': audit_issue_text('TT_DUPLICATE_IN_TM', tm_count)
+            })
+    phase2['issues'] += len(issues)
+    return issues
+
+
+def compare_audit_inputs(tm_rows, tt_rows):
+    """Cross check tm_barang and tt_barang_saldo rows in memory (no database access)"""
+    tt_counts = Counter(audit_key(row[0], row[1]) for row in tt_rows)
+    tm_counts = Counter(audit_key(row[0], row[1]) for row in tm_rows)
+    
+    summary_data = new_audit_counters()
+    issues_phase1 = classify_phase1_rows(tm_rows, tt_counts, summary_data)
+    issues_phase2 = classify_phase2_rows(tt_rows, tm_counts, summary_data)
+    
+    return summary_data, issues_phase1, issues_phase2
+
+
+class MySQLConnectionPool:
+    """Small thread-safe pool of MySQL connections for parallel work"""
+    
+    def __init__(self, host, user, password, database, size=4):
+        self.params = (host, user, password, database)
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+    
+    def get(self):
+        """Get an idle connection, opening a new one while under size"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+        if can_create:
+            try:
+                return connect_to_mysql(*self.params)
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+        return self.idle.get()
+    
+    def put(self, connection):
+        """Return a connection to the pool, dropping it if it was closed"""
+        if connection.open:
+            self.idle.put(connection)
+        else:
+            with self.lock:
+                self.created -= 1
+    
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+AUDIT_KEY_SCAN_BATCH_ROWS = 10000
+AUDIT_KEY_SAMPLES_PER_SHARD = 16
+
+
+def find_audit_key_ranges(connection, shard_count):
+    """Split the kode_barang key space into contiguous ranges, from one ordered pass over the keys.
+    
+    Evenly spaced keys of the streamed, sorted kode_barang column are sampled (the spacing starts at
+    every key and doubles whenever too many are held, so memory stays bounded without a row estimate);
+    once the exact count is known, the samples nearest the quantiles become boundaries. A range never starts with a key
+    equal (under MySQL's comparison, see audit_key) to the start of the previous one, so none is empty.
+    """
+    import pymysql.cursors
+    
+    sample_step = 1
+    samples = []
+    position = 0
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute("SELECT kode_barang FROM tm_barang WHERE kode_barang IS NOT NULL ORDER BY kode_barang")
+        while True:
+            rows = cursor.fetchmany(AUDIT_KEY_SCAN_BATCH_ROWS)
+            if not rows:
+                break
+            for (kode_barang,) in rows:
+                if position % sample_step == 0:
+                    samples.append((position, kode_barang))
+                    if len(samples) > 2 * shard_count * AUDIT_KEY_SAMPLES_PER_SHARD:
+                        samples = samples[::2]
+                        sample_step *= 2
+                position += 1
+    finally:
+        cursor.close()
+    
+    boundaries = []
+    range_start = audit_key(samples[0][1], '') if samples else None
+    for sample_position, kode_barang in samples[1:]:
+        if len(boundaries) == shard_count - 1:
+            break
+        key = audit_key(kode_barang, '')
+        if sample_position >= position * (len(boundaries) + 1) / shard_count and key != range_start:
+            boundaries.append(kode_barang)
+            range_start = key
+    
+    edges = [None] + boundaries + [None]
+    return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1)]
+
+
+def run_audit_shard(pool, shard_index, key_range, use_snapshot, progress_queue, operation_id=None, fingerprint=False):
+    """Extract and compare one kode_barang range on its own pooled connection (and hash it, for the cache)"""
+    progress_queue.put({'shard': shard_index, 'stage': 'fetching'})
+    check_cancelled(operation_id)
+    connection = pool.get()
+    connection_id = attach_connection(operation_id, connection)
+    try:
+        consistent = begin_audit_snapshot(connection) if use_snapshot else False
+        fingerprints = get_audit_fingerprints(connection, key_range) if fingerprint else None
+        tm_rows, tt_rows = fetch_audit_inputs(connection, key_range)
+        connection.commit()
+    finally:
+        detach_connection(operation_id, connection_id)
+        pool.put(connection)
+    
+    progress_queue.put({'shard': shard_index, 'stage': 'comparing'})
+    summary_data, issues_phase1, issues_phase2 = compare_audit_inputs(tm_rows, tt_rows)
+    progress_queue.put({'shard': shard_index, 'stage': 'done'})
+    
+    return {
+        'shard': shard_index,
+        'range': list(key_range),
+        'consistent': consistent,
+        'fingerprints': fingerprints,
+        'tm_rows': tm_rows,
+        'tt_rows': tt_rows,
+        'summary': summary_data,
+        'issues_phase1': issues_phase1,
+        'issues_phase2': issues_phase2
+    }
+
+
+def run_audit_shards(host, user, password, database, key_ranges, use_snapshot, shard_results, operation_id=None,
+                     fingerprint=False):
+    """Audit key ranges in parallel, yielding aggregated progress events; results are appended in shard order"""
+    pool = MySQLConnectionPool(host, user, password, database, size=len(key_ranges))
+    progress_queue = queue.Queue()
+    shard_states = ['queued'] * len(key_ranges)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=len(key_ranges)) as executor:
+            futures = [executor.submit(run_audit_shard, pool, i, key_range, use_snapshot, progress_queue, operation_id,
+                                       fingerprint)
+                       for i, key_range in enumerate(key_ranges)]
+            
+            while True:
+                try:
+                    event = progress_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if all(future.done() for future in futures):
+                        break
+                    continue
+                
+                shard_states[event['shard']] = event['stage']
+                done = shard_states.count('done')
+                yield {
+                    'type': 'progress',
+                    'step': 'shard_progress',
+                    'percent': 5 + int((done / len(key_ranges)) * 90),
+                    'shards': shard_states,
+                    'message': f"Shard {event['shard'] + 1}/{len(key_ranges)}: {event['stage']} ({done}/{len(key_ranges)} shards done)"
+                }
+            
+            for future in futures:
+                shard_results.append(future.result())
+    finally:
+        pool.close_all()
+
+
+def merge_audit_shard_results(shard_results):
+    """Merge per-shard summaries and issue lists deterministically (shard order = key order)"""
+    summary_data = {'phase1': {}, 'phase2': {}, 'shards': []}
+    issues_phase1 = []
+    issues_phase2 = []
+    
+    for result in sorted(shard_results, key=lambda r: r['shard']):
+        for phase in ('phase1', 'phase2'):
+            for key, value in result['summary'][phase].items():
+                summary_data[phase][key] = summary_data[phase].get(key, 0) + value
+        issues_phase1.extend(result['issues_phase1'])
+        issues_phase2.extend(result['issues_phase2'])
+        summary_data['shards'].append({
+            'shard': result['shard'],
+            'range': result['range'],
+            'total_tm_barang': result['summary']['phase1']['total_tm_barang'],
+            'total_tt_barang': result['summary']['phase2']['total_tt_barang'],
+            'issues': len(result['issues_phase1']) + len(result['issues_phase2'])
+        })
+    
+    return summary_data, issues_phase1, issues_phase2
+
+
+# ============================================================
+# SMART AUDIT - PIPELINED FETCH / COMPARE / EMIT
+# ============================================================
+AUDIT_PIPELINE_BATCH_ROWS = 5000
+AUDIT_PIPELINE_QUEUE_BATCHES = 8  # bounded queues: a slow stage blocks the one feeding it
+
+
+class PipelineQueue:
+    """Bounded queue between two pipeline stages, recording depth and the time each side spent waiting.
+    
+    A producer that often finds the queue full is held back by its consumer; a consumer that often finds
+    it empty is starved by its producer. put/get give up when stop is set (the other side has gone).
+    """
+    
+    def __init__(self, name, capacity, stop):
+        self.name = name
+        self.capacity = capacity
+        self.queue = queue.Queue(maxsize=capacity)
+        self.stop = stop
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+        self.items = 0
+        self.depth_total = 0
+        self.depth_max = 0
+    
+    def put(self, item):
+        started = time.time()
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.2)
+                break
+            except queue.Full:
+                continue
+        self.put_wait += time.time() - started
+        depth = self.queue.qsize()
+        self.items += 1
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+    
+    def get(self):
+        started = time.time()
+        try:
+            while not self.stop.is_set():
+                try:
+                    return self.queue.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+            return ('error', OperationCancelled('pipeline stopped'))
+        finally:
+            self.get_wait += time.time() - started
+    
+    def metrics(self):
+        return {
+            'capacity': self.capacity,
+            'items': self.items,
+            'avg_depth': round(self.depth_total / self.items, 2) if self.items else 0,
+            'max_depth': self.depth_max,
+            'producer_blocked_seconds': round(self.put_wait, 3),
+            'consumer_starved_seconds': round(self.get_wait, 3)
+        }
+
+
+def abort_unbuffered_read(connection, cursor, kill=None):
+    """Stop the SELECT an unbuffered cursor is reading, then close the cursor.
+    
+    SSCursor.close() reads every remaining row up to EOF, so the statement is aborted first: KILL QUERY
+    through kill(thread_id) (the connection stays usable), else the connection itself is closed.
+    """
+    if kill:
+        try:
+            kill(connection.thread_id())
+        except Exception as e:
+            print(f"[AUDIT] Could not kill the fetch query: {str(e)}")
+            kill = None
+    if not kill:
+        connection.close()
+        return
+    try:
+        cursor.close()
+    except Exception as e:
+        # 'Query execution was interrupted': the end of the aborted result
+        print(f"[AUDIT] Fetch query aborted: {str(e)}")
+
+
+def audit_fetch_stage(connection, out_queue, operation_id=None, batch_rows=AUDIT_PIPELINE_BATCH_ROWS, kill=None):
+    """FETCH: stream tt_barang_saldo, then tm_barang, in fetchmany batches from an unbuffered cursor.
+    
+    When stop is set (compare stage gone, cancel, client disconnect) the running SELECT is aborted with
+    kill(thread_id) instead of being read to the end; see abort_unbuffered_read.
+    """
+    import pymysql.cursors
+    
+    cursor = None
+    finished = False
+    try:
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        # tt first: its key counts must be complete before tm rows can be classified
+        for source, query in (('tt', AUDIT_TT_QUERY), ('tm', AUDIT_TM_QUERY)):
+            if out_queue.stop.is_set():
+                return
+            cursor.execute(query.format(key_range=''))
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if out_queue.stop.is_set():
+                    return
+                if not rows:
+                    break
+                check_cancelled(operation_id)
+                out_queue.put((source, list(rows)))
+        finished = True
+        out_queue.put(('done', None))
+    except Exception as e:
+        out_queue.put(('error', e))
+    finally:
+        if cursor is not None:
+            if finished:
+                cursor.close()
+            else:
+                abort_unbuffered_read(connection, cursor, kill)
+
+
+def audit_compare_stage(in_queue, out_queue, result):
+    """COMPARE: count tt keys, classify tm batches (phase 1) as they arrive, then the held tt rows (phase 2)"""
+    try:
+        tm_rows, tt_rows = [], []
+        tm_counts, tt_counts = Counter(), Counter()
+        counters = new_audit_counters()
+        issues_phase1, issues_phase2 = [], []
+        
+        while True:
+            source, rows = in_queue.get()
+            if source == 'error':
+                out_queue.put(('error', rows))
+                return
+            if source == 'done':
+                break
+            if source == 'tt':
+                tt_rows.extend(rows)
+                tt_counts.update(audit_key(row[0], row[1]) for row in rows)
+                out_queue.put(('fetched', {'phase': 'tt', 'rows': len(tt_rows)}))
+            else:
+                tm_rows.extend(rows)
+                tm_counts.update(audit_key(row[0], row[1]) for row in rows)
+                issues_phase1.extend(classify_phase1_rows(rows, tt_counts, counters))
+                out_queue.put(('compared', {'phase': 'tm', 'rows': len(tm_rows), 'issues': len(issues_phase1)}))
+        
+        # Phase 2 needs every tm key: it runs over the tt rows already in memory
+        for start in range(0, len(tt_rows), AUDIT_PIPELINE_BATCH_ROWS):
+            issues_phase2.extend(classify_phase2_rows(tt_rows[start:start + AUDIT_PIPELINE_BATCH_ROWS], tm_counts, counters))
+            out_queue.put(('compared', {'phase': 'tt', 'rows': min(start + AUDIT_PIPELINE_BATCH_ROWS, len(tt_rows)),
+                                        'total': len(tt_rows), 'issues': len(issues_phase2)}))
+        
+        result.update(tm_rows=tm_rows, tt_rows=tt_rows, summary=counters,
+                      issues_phase1=issues_phase1, issues_phase2=issues_phase2)
+        out_queue.put(('done', None))
+    except Exception as e:
+        out_queue.put(('error', e))
+
+
+def run_audit_pipeline(connection, result, operation_id=None, batch_rows=AUDIT_PIPELINE_BATCH_ROWS,
+                       queue_batches=AUDIT_PIPELINE_QUEUE_BATCHES, kill=None):
+    """Fetch, compare and emit on three overlapping stages, yielding progress events (EMIT runs in the caller).
+    
+    Fills result with tm_rows, tt_rows, summary, issues_phase1/2 (same as compare_audit_inputs) and
+    'pipeline': per-stage busy/wait seconds, queue occupancy and the bottleneck stage.
+    kill(thread_id) aborts the fetch query when the pipeline stops early; without it the connection is closed.
+    """
+    estimates = {table: int((get_table_status(connection, table) or {}).get('Rows') or 0)
+                 for table in ('tm_barang', 'tt_barang_saldo')}
+    estimated_total = max(estimates['tm_barang'] + 2 * estimates['tt_barang_saldo'], 1)  # tt is read, then compared
+    
+    stop = threading.Event()
+    fetched_queue = PipelineQueue('fetch->compare', queue_batches, stop)
+    compared_queue = PipelineQueue('compare->emit', queue_batches, stop)
+    started = time.time()
+    timings = {}
+    
+    def timed(name, target, *args):
+        stage_started = time.time()
+        try:
+            target(*args)
+        finally:
+            timings[name] = time.time() - stage_started
+    
+    threads = [
+        threading.Thread(target=timed, args=('fetch', audit_fetch_stage, connection, fetched_queue, operation_id, batch_rows,
+                                             kill), daemon=True),
+        threading.Thread(target=timed, args=('compare', audit_compare_stage, fetched_queue, compared_queue, result),
+                         daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+    
+    # EMIT: turn compare output into progress events; time spent in the consumer (yield) counts as emit work
+    emit_busy = 0.0
+    tt_fetched = tm_compared = 0
+    try:
+        while True:
+            kind, payload = compared_queue.get()
+            emit_started = time.time()
+            if kind == 'error':
+                raise payload
+            if kind == 'done':
+                break
+            if kind == 'fetched':
+                tt_fetched = payload['rows']
+                done_rows, message = tt_fetched, f"Fetching tt_barang_saldo: {payload['rows']:,} rows"
+            elif payload['phase'] == 'tm':
+                tm_compared = payload['rows']
+                done_rows = tt_fetched + tm_compared
+                message = f"Phase 1: {payload['rows']:,} tm_barang rows compared, {payload['issues']:,} issues"
+            else:
+                done_rows = tt_fetched + tm_compared + payload['rows']
+                message = f"Phase 2: {payload['rows']:,}/{payload['total']:,} tt_barang_saldo rows compared, {payload['issues']:,} issues"
+            yield {'type': 'progress', 'step': 'pipeline', 'percent': min(5 + int(done_rows / estimated_total * 90), 95),
+                   'message': message}
+            emit_busy += time.time() - emit_started
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    
+    # Busy time = stage run time minus waiting on its queues; the busiest stage limits the throughput
+    elapsed = time.time() - started
+    busy = {
+        'fetch': timings.get('fetch', 0) - fetched_queue.put_wait,
+        'compare': timings.get('compare', 0) - fetched_queue.get_wait - compared_queue.put_wait,
+        'emit': emit_busy
+    }
+    result['pipeline'] = {
+        'seconds': round(elapsed, 3),
+        'batch_rows': batch_rows,
+        'stages': {name: {'busy_seconds': round(max(seconds, 0), 3),
+                          'utilization': round(max(seconds, 0) / elapsed, 2) if elapsed else 0}
+                   for name, seconds in busy.items()},
+        'queues': {fetched_queue.name: fetched_queue.metrics(), compared_queue.name: compared_queue.metrics()},
+        'bottleneck': max(busy, key=busy.get)
+    }
+    print(f"[AUDIT] Pipeline {elapsed:.1f}s, bottleneck: {result['pipeline']['bottleneck']} "
+          + ', '.join(f"{name} {stage['utilization']:.0%}" for name, stage in result['pipeline']['stages'].items()))
+
+
+def run_smart_audit_events(connection, host, user, password, database, use_snapshot=True, use_cache=True, shard_count=1,
+                           operation_id=None):
+    """Run Smart Audit Toko on an open connection, yielding progress events; the last event is 'complete'.
+    
+    With an operation_id the extraction queries can be cancelled (KILL QUERY); OperationCancelled is raised.
+    """
+    connection_id = attach_connection(operation_id, connection)
+    
+    # ============================================================
+    # EXTRACT: local snapshot cache, else both tables inside one consistent snapshot
+    # ============================================================
+    snapshot_consistent = False
+    cache_status = 'off'
+    tm_rows = tt_rows = snapshot_path = fingerprints = shard_results = pipeline_result = None
+    non_innodb = []
+    
+    if use_snapshot:
+        engines = get_table_engines(connection, ['tm_barang', 'tt_barang_saldo'])
+        non_innodb = [f"{name} ({engine})" for name, engine in engines.items() if (engine or '').upper() != 'INNODB']
+        snapshot_consistent = begin_audit_snapshot(connection) and not non_innodb
+    
+    if use_cache:
+        yield {'type': 'progress', 'step': 'query', 'message': 'Checking local snapshot cache...'}
+        # Inside the read view: the content hash describes exactly the rows extracted below
+        fingerprints = get_audit_fingerprints(connection)
+        snapshot_path = get_audit_snapshot_path(host, database, fingerprints)
+        cached = load_audit_snapshot(snapshot_path)
+        if cached:
+            # Consistency is that of the run which extracted the cached rows
+            tm_rows, tt_rows, snapshot_consistent = cached
+            cache_status = 'hit'
+        else:
+            cache_status = 'miss'
+    
+    if tm_rows is None and shard_count > 1:
+        # Sharded: one pooled connection per kode_barang range, each in its own snapshot
+        key_ranges = find_audit_key_ranges(connection, shard_count)
+        detach_connection(operation_id, connection_id)
+        connection.close()
+        print(f"[AUDIT] Running {len(key_ranges)} shards in parallel")
+        yield {'type': 'progress', 'step': 'query', 'message': f'Auditing {len(key_ranges)} key ranges in parallel...'}
+        
+        shard_results = []
+        for event in run_audit_shards(host, user, password, database, key_ranges, use_snapshot, shard_results, operation_id,
+                                      fingerprint=use_cache):
+            yield event
+        
+        snapshot_consistent = all(result['consistent'] for result in shard_results)
+        tm_rows = [row for result in shard_results for row in result['tm_rows']]
+        tt_rows = [row for result in shard_results for row in result['tt_rows']]
+        # The shards read in their own, later snapshots: key the cache on what they hashed there
+        if use_cache:
+            fingerprints = combine_audit_fingerprints(result['fingerprints'] for result in shard_results)
+            snapshot_path = get_audit_snapshot_path(host, database, fingerprints)
+            save_audit_snapshot(snapshot_path, tm_rows, tt_rows, fingerprints, snapshot_consistent)
+    elif tm_rows is None:
+        if non_innodb:
+            yield {'type': 'warning', 'message': 'Snapshot is not transactional for: ' + ', '.join(non_innodb)}
+        
+        print("[AUDIT] Streaming tt_barang_saldo and tm_barang through the fetch/compare pipeline...")
+        yield {'type': 'progress', 'step': 'query', 'message': 'Querying tt_barang_saldo and tm_barang...'}
+        
+        # Rows are compared while the next batches are still being read
+        pipeline_result = {}
+        kill = lambda thread_id: kill_query(host, user, password, database, thread_id)
+        for event in run_audit_pipeline(connection, pipeline_result, operation_id, kill=kill):
+            yield event
+        tm_rows, tt_rows = pipeline_result['tm_rows'], pipeline_result['tt_rows']
+        
+        # Release the read view, the rest runs offline
+        connection.commit()
+        
+        if use_cache:
+            save_audit_snapshot(snapshot_path, tm_rows, tt_rows, fingerprints, snapshot_consistent)
+        detach_connection(operation_id, connection_id)
+        connection.close()
+    else:
+        print(f"[AUDIT] Using local snapshot: {snapshot_path}")
+        detach_connection(operation_id, connection_id)
+        connection.close()
+    
+    check_cancelled(operation_id)
+    
+    total_tm_barang = len(tm_rows)
+    print(f"[AUDIT PHASE 1] Found {total_tm_barang} items in tm_barang")
+    print(f"[AUDIT PHASE 2] Found {len(tt_rows)} items in tt_barang_saldo")
+    yield {'type': 'progress', 'step': 'start_phase1', 'total': total_tm_barang, 'message': f'Phase 1: Found {total_tm_barang} items in tm_barang'}
+    
+    # ============================================================
+    # COMPARE: both phases in memory against the same snapshot
+    # ============================================================
+    if shard_results:
+        summary_data, issues_phase1, issues_phase2 = merge_audit_shard_results(shard_results)
+    elif pipeline_result:
+        summary_data = pipeline_result['summary'] | {'pipeline': pipeline_result['pipeline']}
+        issues_phase1, issues_phase2 = pipeline_result['issues_phase1'], pipeline_result['issues_phase2']
+    else:
+        summary_data, issues_phase1, issues_phase2 = compare_audit_inputs(tm_rows, tt_rows)
+    phase1 = summary_data['phase1']
+    phase2 = summary_data['phase2']
+    total_tt_barang = phase2['total_tt_barang']
+    summary_data['snapshot'] = {'consistent': snapshot_consistent, 'cache': cache_status}
+    
+    yield {'type': 'progress', 'step': 'processing_phase1', 'current': total_tm_barang, 'total': total_tm_barang, 'percent': 50, 'message': f'Phase 1: Processed {total_tm_barang}/{total_tm_barang}'}
+    print(f"[AUDIT PHASE 1] Completed. Match: {phase1['match_tm_to_tt']}, Not Found: {phase1['not_found']}, Duplicate: {phase1['duplicate']}")
+    
+    yield {'type': 'progress', 'step': 'start_phase2', 'total': total_tt_barang, 'message': f'Phase 2: Found {total_tt_barang} items in tt_barang_saldo'}
+    yield {'type': 'progress', 'step': 'processing_phase2', 'current': total_tt_barang, 'total': total_tt_barang, 'percent': 100, 'message': f'Phase 2: Processed {total_tt_barang}/{total_tt_barang}'}
+    print(f"[AUDIT PHASE 2] Completed. Match: {phase2['match_tt_to_tm']}, Not Found: {phase2['not_found']}, Duplicate: {phase2['duplicate']}")
+    
+    # Combine all issues
+    all_issues = issues_phase1 + issues_phase2
+    
+    # Save audit log
+    save_audit_log(database, summary_data, len(all_issues), issues_phase1, issues_phase2)
+    
+    # Store the result so exports read it back instead of re-running the audit
+    job_id = new_job_id('audit')
+    save_job_result(job_id, 'audit', database, summary_data | {'total_issues': len(all_issues)}, {'issues': all_issues})
+    
+    # Index the findings so later runs can be diffed against this one
+    history = record_audit_history(host, database, job_id, summary_data, all_issues)
+    
+    # Send final result with both phases
+    yield {'type': 'complete', 'success': True, 'job_id': job_id, 'summary': summary_data | {'total_issues': len(all_issues)},
+           'history': history, 'issues': all_issues}
+
+
+# ============================================================
+# SMART AUDIT - LOCAL COLUMNAR SNAPSHOT CACHE
+# ============================================================
+SNAPSHOT_FOLDER = os.path.join("data", "snapshots")
+SNAPSHOT_MAGIC = b'NCSNAP1\n'
+SNAPSHOT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Column layout of the audit inputs: (name, kind); 'dict' columns are dictionary-encoded strings
+AUDIT_SNAPSHOT_COLUMNS = {
+    'tm': [('kode_barang', 'str'), ('kode_lokasi_toko', 'dict'), ('stock', 'f64')],
+    'tt': [('kode_barang', 'str'), ('kode_lokasi_toko', 'dict'), ('kode_lokasi_gudang', 'dict'), ('stock', 'f64')]
+}
+
+
+def get_audit_fingerprints(connection, key_range=None):
+    """Content hash of the audited rows of tm_barang and tt_barang_saldo, used to key the local snapshot.
+    
+    Computed on the server with get_table_hash over the audit columns and predicates, so inside a
+    consistent snapshot it describes exactly the rows that snapshot returns (table metadata such as
+    Update_time or CHECKSUM TABLE is neither MVCC nor fresh on 8.0). key_range limits it to one shard.
+    """
+    range_clause, range_params = get_key_range_clause(key_range)
+    return {table: get_table_hash(connection, table, columns, where=f"WHERE {where} {range_clause}", params=range_params)
+            for table, (columns, where) in AUDIT_FINGERPRINT_SIDES.items()}
+
+
+def combine_audit_fingerprints(parts):
+    """Fingerprint of the whole tables from per-shard fingerprints (COUNT, BIT_XOR and SUM all combine)"""
+    combined = {}
+    for part in parts:
+        for table, value in part.items():
+            total = combined.setdefault(table, {'rows': 0, 'xor': 0, 'sum': 0})
+            total['rows'] += value['rows']
+            total['xor'] ^= value['xor']
+            total['sum'] += value['sum']
+    return combined
+
+
+def get_audit_snapshot_path(host, database, fingerprints):
+    """Snapshot file path, keyed by database and table fingerprints"""
+    key_source = json.dumps({'host': host, 'database': database, 'tables': fingerprints}, sort_keys=True)
+    key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_FOLDER, f"audit_snapshot_{safe_file_part(database)}_{key}.ncs")
+
+
+def _encode_snapshot_column(values, kind):
+    """Encode one column into (header, bytes)"""
+    if kind == 'f64':
+        return {'kind': kind}, array('d', (float(v or 0) for v in values)).tobytes()
+    
+    if kind == 'dict':
+        dictionary = {}
+        codes = array('I', (dictionary.setdefault(v, len(dictionary)) for v in values))
+        return {'kind': kind, 'dictionary': list(dictionary)}, codes.tobytes()
+    
+    # 'str': end offsets + utf-8 blob
+    blob = bytearray()
+    ends = array('Q')
+    for v in values:
+        blob += str(v if v is not None else '').encode('utf-8')
+        ends.append(len(blob))
+    ends_bytes = ends.tobytes()
+    return {'kind': kind, 'ends_length': len(ends_bytes)}, ends_bytes + bytes(blob)
+
+
+def _decode_snapshot_column(buffer, header):
+    """Decode one column from its bytes"""
+    kind = header['kind']
+    if kind == 'f64':
+        values = array('d')
+        values.frombytes(buffer)
+        return values.tolist()
+    
+    if kind == 'dict':
+        codes = array('I')
+        codes.frombytes(buffer)
+        dictionary = header['dictionary']
+        return [dictionary[code] for code in codes]
+    
+    ends = array('Q')
+    ends.frombytes(buffer[:header['ends_length']])
+    blob = bytes(buffer[header['ends_length']:])
+    values = []
+    start = 0
+    for end in ends:
+        values.append(blob[start:end].decode('utf-8'))
+        start = end
+    return values
+
+
+def save_audit_snapshot(path, tm_rows, tt_rows, fingerprints, consistent=False):
+    """Save audit inputs as a compact columnar snapshot file, with whether they came from one consistent snapshot"""
+    try:
+        if not os.path.exists(SNAPSHOT_FOLDER):
+            os.makedirs(SNAPSHOT_FOLDER)
+        
+        header = {'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'fingerprints': fingerprints,
+                  'consistent': bool(consistent), 'tables': {}}
+        blocks = []
+        offset = 0
+        for table_key, rows in (('tm', tm_rows), ('tt', tt_rows)):
+            columns = []
+            for position, (name, kind) in enumerate(AUDIT_SNAPSHOT_COLUMNS[table_key]):
+                column_header, data = _encode_snapshot_column([row[position] for row in rows], kind)
+                column_header.update({'name': name, 'offset': offset, 'length': len(data)})
+                columns.append(column_header)
+                blocks.append(data)
+                offset += len(data)
+            header['tables'][table_key] = {'count': len(rows), 'columns': columns}
+        
+        header_bytes = json.dumps(header).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for data in blocks:
+                f.write(data)
+        os.replace(tmp_path, path)
+        
+        print(f"[LOG] Audit snapshot saved to: {path}")
+        evict_audit_snapshots(keep_path=path)
+        
+    except Exception as e:
+        print(f"[LOG] Error saving audit snapshot: {str(e)}")
+
+
+def load_audit_snapshot(path):
+    """Load audit inputs from a snapshot file, returns (tm_rows, tt_rows, consistent) or None"""
+    import mmap
+    
+    try:
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                    return None
+                pos = len(SNAPSHOT_MAGIC)
+                header_length = struct.unpack('<I', mm[pos:pos + 4])[0]
+                header = json.loads(mm[pos + 4:pos + 4 + header_length].decode('utf-8'))
+                data_start = pos + 4 + header_length
+                
+                tables = {}
+                for table_key, table in header['tables'].items():
+                    columns = []
+                    for column in table['columns']:
+                        start = data_start + column['offset']
+                        columns.append(_decode_snapshot_column(mm[start:start + column['length']], column))
+                    tables[table_key] = list(zip(*columns)) if table['count'] else []
+        
+        # Touch for LRU eviction
+        os.utime(path, None)
+        print(f"[LOG] Audit snapshot loaded from: {path}")
+        return tables['tm'], tables['tt'], header.get('consistent', False)
+        
+    except Exception as e:
+        print(f"[LOG] Error loading audit snapshot: {str(e)}")
+        return None
+
+
+def evict_audit_snapshots(keep_path=None, max_bytes=SNAPSHOT_CACHE_MAX_BYTES):
+    """Delete least recently used snapshot files until the cache fits in max_bytes"""
+    try:
+        snapshots = []
+        for name in os.listdir(SNAPSHOT_FOLDER):
+            if name.endswith('.ncs'):
+                path = os.path.join(SNAPSHOT_FOLDER, name)
+                stat = os.stat(path)
+                snapshots.append((stat.st_mtime, stat.st_size, path))
+        
+        total_size = sum(size for _, size, _ in snapshots)
+        for _, size, path in sorted(snapshots):
+            if total_size <= max_bytes:
+                break
+            if path == keep_path:
+                continue
+            os.remove(path)
+            total_size -= size
+            print(f"[LOG] Evicted audit snapshot: {path}")
+            
+    except Exception as e:
+        print(f"[LOG] Error evicting audit snapshots: {str(e)}")
+
+
+# ============================================================
+# QUERY PLAN GUARD (EXPLAIN before heavy operations)
+# ============================================================
+PLAN_SAMPLE_KEY = 'NAGACHECK_PLAN_PROBE'  # placeholder key for EXPLAIN of the per-item lookups
+
+# Built-in statements, EXPLAINed as SELECTs (EXPLAIN of INSERT/DELETE needs 5.6+).
+# per_item: executed once per fixed issue, so its estimate is multiplied by the issue count.
+PLAN_QUERY_TEMPLATES = {
+    'audit_tm': {
+        'operation': 'audit', 'table': 'tm_barang', 'per_item': False,
+        'sql': AUDIT_TM_QUERY.format(key_range='')
+    },
+    'audit_tt': {
+        'operation': 'audit', 'table': 'tt_barang_saldo', 'per_item': False,
+        'sql': AUDIT_TT_QUERY.format(key_range='')
+    },
+    'fix_duplicate_lookup': {
+        'operation': 'fix', 'table': 'tt_barang_saldo', 'per_item': True,
+        'sql': """
+            SELECT COUNT(*) as count FROM tt_barang_saldo
+            WHERE kode_barang = %s AND kode_lokasi_toko = %s AND stock_akhir*1 > 0
+        """
+    },
+    'fix_missing_lookup': {
+        'operation': 'fix', 'table': 'tm_barang', 'per_item': True,
+        'sql': """
+            SELECT * FROM tm_barang
+            WHERE kode_barang = %s AND kode_lokasi_toko = %s
+            AND kode_lokasi_gudang = 'TOKO' AND stock_on_hand*1 > 0
+            LIMIT 1
+        """
+    },
+    'saldo_period_count': {
+        'operation': 'saldo', 'table': 'th_barang_saldo', 'per_item': False,
+        'sql': "SELECT COUNT(*) as count FROM th_barang_saldo WHERE LEFT(tanggal, 7) = %s"
+    },
+    'saldo_period_move': {
+        'operation': 'fix_saldo', 'table': 'th_barang_saldo', 'per_item': False,
+        'sql': "SELECT * FROM th_barang_saldo WHERE LEFT(tanggal, 7) = %s"
+    }
+}
+
+# Covering index per table for the audit scan + per-item lookups; the first two columns
+# alone already serve the lookups, so an index starting with them counts as present
+PLAN_RECOMMENDED_INDEXES = {
+    'tm_barang': ('idx_nc_barang_lokasi', ['kode_barang', 'kode_lokasi_toko', 'kode_lokasi_gudang', 'stock_on_hand']),
+    'tt_barang_saldo': ('idx_nc_barang_lokasi', ['kode_barang', 'kode_lokasi_toko', 'kode_lokasi_gudang', 'stock_akhir'])
+}
+PLAN_INDEX_LEADING_COLUMNS = 2
+
+NON_SARGABLE_PATTERNS = (r"\b\w+\*1\b", r"\bLEFT\(\w+,\s*\d+\)")
+
+
+def find_non_sargable_predicates(sql):
+    """Expressions on columns in a WHERE clause, which keep MySQL from using an index on them"""
+    where = sql.split('WHERE', 1)[1] if 'WHERE' in sql else ''
+    return sorted({match for pattern in NON_SARGABLE_PATTERNS for match in re.findall(pattern, where)})
+
+
+def get_table_indexes(connection, table_name):
+    """Index name -> ordered column list, None when the table does not exist"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SHOW INDEX FROM `{table_name}`")
+        indexes = {}
+        for row in cursor.fetchall():
+            indexes.setdefault(row['Key_name'], []).append(row['Column_name'].lower())
+        return indexes
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+
+def explain_query(connection, sql, params, use_json=False):
+    """EXPLAIN one statement: estimated rows, full scans, filesort/temporary and (5.7+) the optimizer cost"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("EXPLAIN " + sql, params)
+        plan = cursor.fetchall()
+        
+        rows_estimate = 1
+        for row in plan:
+            rows_estimate *= int(row.get('rows') or 1)
+        extra = ' '.join(str(row.get('Extra') or '') for row in plan)
+        result = {
+            'rows_estimate': rows_estimate,
+            'full_scan': [row.get('table') for row in plan if row.get('type') == 'ALL'],
+            'full_index_scan': [row.get('table') for row in plan if row.get('type') == 'index'],
+            'filesort': 'Using filesort' in extra,
+            'temporary': 'Using temporary' in extra,
+            'keys': [row.get('key') for row in plan if row.get('key')],
+            'cost': None,
+            'plan': [{key: row.get(key) for key in ('table', 'type', 'possible_keys', 'key', 'rows', 'Extra')} for row in plan]
+        }
+        
+        if use_json:
+            try:
+                cursor.execute("EXPLAIN FORMAT=JSON " + sql, params)
+                document = json.loads(list(cursor.fetchone().values())[0])
+                cost = document.get('query_block', {}).get('cost_info', {}).get('query_cost')
+                result['cost'] = float(cost) if cost is not None else None
+            except Exception as e:
+                print(f"[PLAN] EXPLAIN FORMAT=JSON not available: {str(e)}")
+        
+        return result
+    finally:
+        cursor.close()
+
+
+def check_query_plans(connection, capabilities, operation=None, executions=None, check_date=None, settings=None):
+    """EXPLAIN the built-in statements of an operation (None = all) and compare the estimate with the budget.
+    
+    executions: per_item template name -> how many times it will run (default 1).
+    """
+    settings = settings or load_maintenance_settings()
+    executions = executions or {}
+    use_json = bool(capabilities and capabilities.get('supports_explain_json'))
+    
+    queries = []
+    warnings = []
+    suggestions = {}
+    table_indexes = {}
+    for name, template in PLAN_QUERY_TEMPLATES.items():
+        if operation and template['operation'] != operation:
+            continue
+        table = template['table']
+        if table not in table_indexes:
+            table_indexes[table] = get_table_indexes(connection, table)
+        if table_indexes[table] is None:
+            queries.append({'name': name, 'table': table, 'error': f'Table {table} does not exist'})
+            continue
+        
+        sql = template['sql']
+        if '%s' not in sql:
+            params = None
+        elif 'tanggal' in sql:
+            params = (check_date or get_last_month_str(),)
+        else:
+            params = (PLAN_SAMPLE_KEY, PLAN_SAMPLE_KEY)
+        explained = explain_query(connection, sql, params, use_json=use_json)
+        runs = max(1, int(executions.get(name, 1))) if template['per_item'] else 1
+        entry = {
+            'name': name,
+            'operation': template['operation'],
+            'table': table,
+            'executions': runs,
+            'estimated_rows': explained['rows_estimate'] * runs,
+            'non_sargable': find_non_sargable_predicates(sql)
+        } | explained
+        queries.append(entry)
+        
+        if explained['full_scan']:
+            warnings.append(f"{name}: full table scan of {table} (~{entry['estimated_rows']:,} rows)")
+        if explained['filesort']:
+            warnings.append(f"{name}: filesort on {table}")
+        
+        # Without a (kode_barang, kode_lokasi_toko) index every per-item lookup is a full scan
+        recommended = PLAN_RECOMMENDED_INDEXES.get(table)
+        if recommended and not any(columns[:PLAN_INDEX_LEADING_COLUMNS] == recommended[1][:PLAN_INDEX_LEADING_COLUMNS]
+                                   for columns in table_indexes[table].values()):
+            index_name, columns = recommended
+            suggestions[table] = {
+                'table': table,
+                'index': index_name,
+                'columns': columns,
+                'sql': f"ALTER TABLE `{table}` ADD INDEX `{index_name}` ({', '.join(f'`{c}`' for c in columns)})"
+            }
+    
+    estimated_rows = sum(entry.get('estimated_rows', 0) for entry in queries)
+    budget = int(settings.get('plan_max_rows') or 0)
+    over_budget = bool(budget) and estimated_rows > budget
+    if over_budget:
+        warnings.append(f"Estimated {estimated_rows:,} rows examined exceeds the budget of {budget:,}")
+    
+    return {
+        'operation': operation or 'all',
+        'queries': queries,
+        'estimated_rows': estimated_rows,
+        'budget': budget,
+        'over_budget': over_budget,
+        'warnings': warnings,
+        'suggestions': list(suggestions.values())
+    }
+
+
+def create_suggested_indexes(connection, suggestions, capabilities):
+    """Create missing indexes (online on 5.6+); a covering index that cannot be built falls back to the lookup columns"""
+    results = []
+    online = ", ALGORITHM=INPLACE, LOCK=NONE" if capabilities and capabilities.get('supports_online_ddl') else ""
+    cursor = connection.cursor()
+    try:
+        for suggestion in suggestions:
+            table, index_name = suggestion['table'], suggestion['index']
+            for columns in (suggestion['columns'], suggestion['columns'][:PLAN_INDEX_LEADING_COLUMNS]):
+                column_sql = ', '.join(f'`{c}`' for c in columns)
+                try:
+                    print(f"[PLAN] Creating index {index_name} on {table} ({column_sql})")
+                    cursor.execute(f"ALTER TABLE `{table}` ADD INDEX `{index_name}` ({column_sql}){online}")
+                    results.append({'table': table, 'index': index_name, 'columns': columns, 'status': 'CREATED'})
+                    break
+                except Exception as e:
+                    # e.g. key too long for the stock column, or LOCK=NONE refused
+                    error = str(e)
+                    print(f"[PLAN] Index {index_name} on {table} ({column_sql}) failed: {error}")
+            else:
+                results.append({'table': table, 'index': index_name, 'columns': suggestion['columns'], 'status': 'FAILED', 'error': error})
+    finally:
+        cursor.close()
+    return results
+
+
+def run_plan_guard(connection, host, database, operation, executions=None, check_date=None):
+    """Plan check before a heavy operation: returns (report, refusal message or None); never raises"""
+    settings = load_maintenance_settings()
+    if settings.get('plan_guard', 'warn') == 'off':
+        return None, None
+    try:
+        capabilities = get_server_capabilities(connection, host, database)
+        report = check_query_plans(connection, capabilities, operation=operation, executions=executions,
+                                   check_date=check_date, settings=settings)
+    except Exception as e:
+        print(f"[PLAN] Plan check skipped: {str(e)}")
+        return None, None
+    
+    for warning in report['warnings']:
+        print(f"[PLAN] {warning}")
+    if report['over_budget'] and settings.get('plan_guard') == 'refuse':
+        hint = "create the suggested indexes (POST /plan-check)" if report['suggestions'] else "raise plan_max_rows"
+        message = (f"Refused by plan guard: estimated {report['estimated_rows']:,} rows examined, budget is {report['budget']:,}. "
+                   f"To continue, {hint} or run with force.")
+        return report, message
+    return report, None
+
+
+# ============================================================
+# AUDIT HISTORY STORE (run-to-run diff & trend)
+# ============================================================
+AUDIT_HISTORY_DB = os.path.join("data", "audit_history.db")
+AUDIT_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT,
+    host TEXT NOT NULL,
+    database_name TEXT NOT NULL,
+    run_time TEXT NOT NULL,
+    total_issues INTEGER NOT NULL,
+    issue_counts TEXT NOT NULL,
+    new_count INTEGER,
+    resolved_count INTEGER,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_runs_store_time ON audit_runs (database_name, host, run_time);
+CREATE TABLE IF NOT EXISTS audit_findings (
+    run_id INTEGER NOT NULL,
+    issue_type TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    location_key TEXT NOT NULL,
+    kode_barang TEXT,
+    kode_lokasi TEXT,
+    count INTEGER,
+    PRIMARY KEY (run_id, issue_type, item_key, location_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_audit_findings_key ON audit_findings (item_key, location_key, run_id);
+"""
+AUDIT_DIFF_SECTIONS = ('new', 'resolved', 'persisting')
+AUDIT_DIFF_DEFAULT_LIMIT = 1000
+
+audit_history_lock = threading.Lock()
+
+
+def open_audit_history():
+    """Open the local audit history database, creating the schema on first use"""
+    import sqlite3
+    folder = os.path.dirname(AUDIT_HISTORY_DB)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    db = sqlite3.connect(AUDIT_HISTORY_DB, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(AUDIT_HISTORY_SCHEMA)
+    return db
+
+
+def get_previous_audit_run(db, host, database, before_run_id=None):
+    """run_id of the latest stored run for a store (optionally before another run), or None"""
+    query = "SELECT run_id FROM audit_runs WHERE database_name = ? AND host = ?"
+    params = [database, host]
+    if before_run_id is not None:
+        query += " AND run_id < ?"
+        params.append(before_run_id)
+    row = db.execute(query + " ORDER BY run_time DESC, run_id DESC LIMIT 1", params).fetchone()
+    return row['run_id'] if row else None
+
+
+def count_audit_diff(db, from_run_id, to_run_id):
+    """Counts of new / resolved / persisting findings between two stored runs"""
+    def count_missing(run_id, other_run_id):
+        return db.execute("""
+            SELECT COUNT(*) FROM audit_findings f
+            WHERE f.run_id = ? AND NOT EXISTS (
+                SELECT 1 FROM audit_findings o
+                WHERE o.run_id = ? AND o.issue_type = f.issue_type
+                  AND o.item_key = f.item_key AND o.location_key = f.location_key)
+        """, (run_id, other_run_id)).fetchone()[0]
+    
+    new_count = count_missing(to_run_id, from_run_id)
+    resolved_count = count_missing(from_run_id, to_run_id)
+    total_to = db.execute("SELECT COUNT(*) FROM audit_findings WHERE run_id = ?", (to_run_id,)).fetchone()[0]
+    return {'new': new_count, 'resolved': resolved_count, 'persisting': total_to - new_count}
+
+
+def record_audit_history(host, database, job_id, summary_data, issues):
+    """Store one audit's findings; returns how it compares to the previous run of the same store, or None"""
+    try:
+        issue_counts = Counter(issue['issue'] for issue in issues)
+        with audit_history_lock:
+            db = open_audit_history()
+            try:
+                previous_run_id = get_previous_audit_run(db, host, database)
+                with db:
+                    cursor = db.execute("""
+                        INSERT INTO audit_runs (job_id, host, database_name, run_time, total_issues, issue_counts, summary)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (job_id, host, database, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(issues),
+                          json.dumps(issue_counts), json.dumps(summary_data, default=str)))
+                    run_id = cursor.lastrowid
+                    # A key listed twice (duplicated tm_barang rows) is one finding
+                    db.executemany("""
+                        INSERT OR IGNORE INTO audit_findings
+                            (run_id, issue_type, item_key, location_key, kode_barang, kode_lokasi, count)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, ((run_id, issue['issue'], *audit_key(issue['kode_barang'], issue['kode_lokasi']),
+                           str(issue['kode_barang'] or ''), str(issue['kode_lokasi'] or ''),
+                           issue.get('count_tt', issue.get('count_tm', 0))) for issue in issues))
                     
-                    if msg_type == 'status' and 'ok' in msg_text.lower():
-                        repair_success = True
-                        print(f"[LOG] ✓ Repair successful")
-                        break
+                    diff = None
+                    if previous_run_id is not None:
+                        diff = count_audit_diff(db, previous_run_id, run_id)
+                        db.execute("UPDATE audit_runs SET new_count = ?, resolved_count = ? WHERE run_id = ?",
+                                   (diff['new'], diff['resolved'], run_id))
+            finally:
+                db.close()
+        
+        print(f"[LOG] Audit history run {run_id} stored ({len(issues)} findings)")
+        return {'run_id': run_id, 'previous_run_id': previous_run_id, 'diff': diff}
+        
+    except Exception as e:
+        print(f"[LOG] Error storing audit history: {str(e)}")
+        return None
+
+
+def audit_run_record(row):
+    """audit_runs row as a JSON-ready dict"""
+    return {
+        'run_id': row['run_id'],
+        'job_id': row['job_id'],
+        'host': row['host'],
+        'database': row['database_name'],
+        'run_time': row['run_time'],
+        'total_issues': row['total_issues'],
+        'issue_counts': json.loads(row['issue_counts']),
+        'new': row['new_count'],
+        'resolved': row['resolved_count']
+    }
+
+
+def list_audit_runs(host, database, limit=100, since=None):
+    """Stored runs of one store, newest first"""
+    query = "SELECT * FROM audit_runs WHERE database_name = ? AND host = ?"
+    params = [database, host]
+    if since:
+        query += " AND run_time >= ?"
+        params.append(since)
+    db = open_audit_history()
+    try:
+        rows = db.execute(query + " ORDER BY run_time DESC, run_id DESC LIMIT ?", params + [limit]).fetchall()
+        return [audit_run_record(row) for row in rows]
+    finally:
+        db.close()
+
+
+def diff_audit_runs(from_run_id, to_run_id, limit=AUDIT_DIFF_DEFAULT_LIMIT):
+    """New, resolved and persisting findings between two stored runs (read from the store, not MySQL)"""
+    db = open_audit_history()
+    try:
+        runs = {row['run_id']: audit_run_record(row) for row in db.execute(
+            "SELECT * FROM audit_runs WHERE run_id IN (?, ?)", (from_run_id, to_run_id))}
+        for run_id in (from_run_id, to_run_id):
+            if run_id not in runs:
+                raise ValueError(f"Audit run {run_id} not found")
+        
+        # NOT EXISTS / EXISTS probes walk the (run_id, issue_type, key) primary key, one lookup per finding
+        probes = {
+            'new': ("NOT EXISTS", to_run_id, from_run_id),
+            'resolved': ("NOT EXISTS", from_run_id, to_run_id),
+            'persisting': ("EXISTS", to_run_id, from_run_id)
+        }
+        findings = {}
+        for section in AUDIT_DIFF_SECTIONS:
+            operator, run_id, other_run_id = probes[section]
+            rows = db.execute(f"""
+                SELECT f.issue_type, f.kode_barang, f.kode_lokasi, f.count FROM audit_findings f
+                WHERE f.run_id = ? AND {operator} (
+                    SELECT 1 FROM audit_findings o
+                    WHERE o.run_id = ? AND o.issue_type = f.issue_type
+                      AND o.item_key = f.item_key AND o.location_key = f.location_key)
+                ORDER BY f.issue_type, f.item_key, f.location_key
+                LIMIT ?
+            """, (run_id, other_run_id, limit)).fetchall()
+            findings[section] = [{
+                'kode_barang': row['kode_barang'],
+                'kode_lokasi': row['kode_lokasi'],
+                'issue': row['issue_type'],
+                'issue_text': audit_issue_text(row['issue_type'], row['count']),
+                'count': row['count']
+            } for row in rows]
+        
+        return {
+            'from': runs[from_run_id],
+            'to': runs[to_run_id],
+            'counts': count_audit_diff(db, from_run_id, to_run_id),
+            'findings': findings,
+            'limit': limit
+        }
+    finally:
+        db.close()
+
+
+def get_audit_trend(host, database, limit=30):
+    """Per-run issue totals for one store, oldest first (reads audit_runs only)"""
+    runs = list_audit_runs(host, database, limit=limit)
+    runs.reverse()
+    return [{
+        'run_id': run['run_id'],
+        'run_time': run['run_time'],
+        'total_issues': run['total_issues'],
+        'issue_counts': {code: run['issue_counts'].get(code, 0) for code in AUDIT_ISSUE_TEXT},
+        'new': run['new'],
+        'resolved': run['resolved']
+    } for run in runs]
+
+
+def get_finding_history(kode_barang, kode_lokasi, host=None, database=None, limit=100):
+    """Runs in which one kode_barang/kode_lokasi pair was reported"""
+    item_key, location_key = audit_key(kode_barang, kode_lokasi)
+    query = """
+        SELECT r.run_id, r.host, r.database_name, r.run_time, f.issue_type, f.count
+        FROM audit_findings f JOIN audit_runs r ON r.run_id = f.run_id
+        WHERE f.item_key = ? AND f.location_key = ?
+    """
+    params = [item_key, location_key]
+    if database:
+        query += " AND r.database_name = ?"
+        params.append(database)
+    if host:
+        query += " AND r.host = ?"
+        params.append(host)
+    db = open_audit_history()
+    try:
+        rows = db.execute(query + " ORDER BY r.run_time DESC LIMIT ?", params + [limit]).fetchall()
+        return [{
+            'run_id': row['run_id'],
+            'host': row['host'],
+            'database': row['database_name'],
+            'run_time': row['run_time'],
+            'issue': row['issue_type'],
+            'issue_text': audit_issue_text(row['issue_type'], row['count'])
+        } for row in rows]
+    finally:
+        db.close()
+
+
+# ============================================================
+# TABLE GROWTH SAMPLER & CAPACITY FORECAST
+# ============================================================
+GROWTH_DB = os.path.join("data", "table_growth.db")
+GROWTH_SAMPLER_FILE = os.path.join("data", "growth_sampler.json")
+GROWTH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS growth_tables (
+    table_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT NOT NULL,
+    database_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    UNIQUE (database_name, host, table_name)
+);
+CREATE TABLE IF NOT EXISTS growth_samples (
+    table_id INTEGER NOT NULL,
+    sampled_at INTEGER NOT NULL,
+    data_length INTEGER NOT NULL,
+    index_length INTEGER NOT NULL,
+    data_free INTEGER NOT NULL,
+    table_rows INTEGER NOT NULL,
+    PRIMARY KEY (table_id, sampled_at)
+) WITHOUT ROWID;
+"""
+
+DEFAULT_GROWTH_SAMPLER = {
+    'interval_minutes': 60,     # one SHOW TABLE STATUS per store per interval
+    'retention_days': 400,      # samples older than this are pruned
+    'threshold_mb': 2048,       # default size (data + index) for the days-until-threshold forecast
+    'targets': []               # stores to sample: host/user/password/database
+}
+
+growth_lock = threading.Lock()
+growth_sampler_wakeup = threading.Event()
+growth_sampler_lock = threading.Lock()
+growth_sampler_state = {'running': False, 'last_run': None, 'last_error': None}
+
+
+def load_growth_sampler():
+    """Sampler config merged over the defaults"""
+    config = dict(DEFAULT_GROWTH_SAMPLER)
+    config.update(load_json_file(GROWTH_SAMPLER_FILE, {}))
+    return config
+
+
+def open_growth_store():
+    """Open the local table growth database, creating the schema on first use"""
+    import sqlite3
+    folder = os.path.dirname(GROWTH_DB)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    db = sqlite3.connect(GROWTH_DB, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(GROWTH_SCHEMA)
+    return db
+
+
+def record_growth_sample(host, database, all_status, sampled_at=None, retention_days=None):
+    """Store one SHOW TABLE STATUS result (see get_all_table_status) as a sample per table"""
+    try:
+        sampled_at = int(sampled_at or time.time())
+        with growth_lock:
+            db = open_growth_store()
+            try:
+                with db:
+                    db.executemany("INSERT OR IGNORE INTO growth_tables (host, database_name, table_name) VALUES (?, ?, ?)",
+                                   ((host, database, name) for name in all_status))
+                    table_ids = {row['table_name']: row['table_id'] for row in db.execute(
+                        "SELECT table_id, table_name FROM growth_tables WHERE database_name = ? AND host = ?", (database, host))}
+                    # Views have no Data_length, they are not sampled
+                    db.executemany("""
+                        INSERT OR REPLACE INTO growth_samples
+                            (table_id, sampled_at, data_length, index_length, data_free, table_rows)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, ((table_ids[name], sampled_at, int(status.get('Data_length') or 0), int(status.get('Index_length') or 0),
+                           int(status.get('Data_free') or 0), int(status.get('Rows') or 0))
+                          for name, status in all_status.items() if status.get('Data_length') is not None))
+                    if retention_days:
+                        db.execute("DELETE FROM growth_samples WHERE sampled_at < ?", (sampled_at - retention_days * 86400,))
+            finally:
+                db.close()
+        return True
+    except Exception as e:
+        print(f"[LOG] Error storing growth sample for {database}@{host}: {str(e)}")
+        return False
+
+
+def sample_table_growth(target, retention_days=None):
+    """Take one growth sample of a store: a single SHOW TABLE STATUS round trip"""
+    host, user, password, database = (target.get(key, '') for key in ('host', 'user', 'password', 'database'))
+    connection = connect_to_mysql(host, user, password, database)
+    if not connection:
+        raise ConnectionError(f"Cannot connect to {database}@{host}")
+    try:
+        # 8.0 caches table statistics (default one day): without this every sample repeats the cached sizes
+        if get_server_capabilities(connection, host, database).get('stats_expiry'):
+            cursor = connection.cursor()
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+            cursor.close()
+        all_status = get_all_table_status(connection)
+    finally:
+        connection.close()
+    record_growth_sample(host, database, all_status, retention_days=retention_days)
+    return len(all_status)
+
+
+def growth_sampler_loop():
+    """Background sampler: every interval, one metadata query per configured store"""
+    while True:
+        config = load_growth_sampler()
+        for target in config['targets']:
+            try:
+                tables = sample_table_growth(target, retention_days=config['retention_days'])
+                growth_sampler_state['last_error'] = None
+                print(f"[GROWTH] Sampled {tables} tables of {target.get('database')}@{target.get('host')}")
+            except Exception as e:
+                growth_sampler_state['last_error'] = f"{target.get('database')}@{target.get('host')}: {str(e)}"
+                print(f"[GROWTH] Sample failed: {growth_sampler_state['last_error']}")
+        growth_sampler_state['last_run'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        # Sleep until the next interval, or until the config changes
+        growth_sampler_wakeup.wait(max(1, config['interval_minutes']) * 60)
+        growth_sampler_wakeup.clear()
+
+
+def start_growth_sampler():
+    """Start the sampler thread once, when there is something to sample"""
+    with growth_sampler_lock:
+        if growth_sampler_state['running'] or not load_growth_sampler()['targets']:
+            return False
+        # Claimed before the thread starts, so two concurrent callers cannot both start one
+        growth_sampler_state['running'] = True
+    threading.Thread(target=growth_sampler_loop, daemon=True).start()
+    return True
+
+
+def linear_growth_per_day(points):
+    """Least-squares slope (units per day) of (epoch seconds, value) points, None with fewer than 2 distinct times"""
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if var_t == 0:
+        return None
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t
+    return slope * 86400
+
+
+def forecast_table_growth(host, database, days=30, threshold_mb=None, table_name=None):
+    """Per-table growth rates, days until the size threshold and fragmentation trend over the last `days`"""
+    threshold_bytes = (threshold_mb or load_growth_sampler()['threshold_mb']) * 1024 * 1024
+    since = int(time.time()) - days * 86400
+    query = """
+        SELECT t.table_name, s.sampled_at, s.data_length, s.index_length, s.data_free, s.table_rows
+        FROM growth_tables t JOIN growth_samples s ON s.table_id = t.table_id
+        WHERE t.database_name = ? AND t.host = ? AND s.sampled_at >= ?
+    """
+    params = [database, host, since]
+    if table_name:
+        query += " AND t.table_name = ?"
+        params.append(table_name)
+    
+    db = open_growth_store()
+    try:
+        samples = {}
+        for row in db.execute(query + " ORDER BY t.table_name, s.sampled_at", params):
+            samples.setdefault(row['table_name'], []).append(row)
+    finally:
+        db.close()
+    
+    forecasts = []
+    for name, rows in samples.items():
+        first, last = rows[0], rows[-1]
+        size = last['data_length'] + last['index_length']
+        bytes_per_day = linear_growth_per_day([(r['sampled_at'], r['data_length'] + r['index_length']) for r in rows])
+        rows_per_day = linear_growth_per_day([(r['sampled_at'], r['table_rows']) for r in rows])
+        
+        def free_ratio(row):
+            allocated = row['data_length'] + row['data_free']
+            return round(row['data_free'] / allocated, 4) if allocated else 0.0
+        
+        if size >= threshold_bytes:
+            days_until_threshold = 0
+        elif bytes_per_day and bytes_per_day > 0:
+            days_until_threshold = round((threshold_bytes - size) / bytes_per_day, 1)
+        else:
+            days_until_threshold = None  # not growing
+        
+        forecasts.append({
+            'table': name,
+            'samples': len(rows),
+            'first_sample': datetime.fromtimestamp(first['sampled_at']).strftime('%Y-%m-%d %H:%M:%S'),
+            'last_sample': datetime.fromtimestamp(last['sampled_at']).strftime('%Y-%m-%d %H:%M:%S'),
+            'rows': last['table_rows'],
+            'size_mb': round(size / (1024 * 1024), 2),
+            'growth_mb_per_day': round(bytes_per_day / (1024 * 1024), 3) if bytes_per_day is not None else None,
+            'rows_per_day': round(rows_per_day) if rows_per_day is not None else None,
+            'days_until_threshold': days_until_threshold,
+            'fragmentation': {'first': free_ratio(first), 'last': free_ratio(last),
+                              'change': round(free_ratio(last) - free_ratio(first), 4)}
+        })
+    
+    # Tables that reach the threshold soonest first, tables that are not growing last
+    forecasts.sort(key=lambda f: (f['days_until_threshold'] is None, f['days_until_threshold'] or 0, -f['size_mb']))
+    return {'threshold_mb': threshold_bytes // (1024 * 1024), 'days': days, 'tables': forecasts}
+
+
+# ============================================================
+# LOG SEARCH INDEX (SQLite FTS5 over the data/ log files)
+# ============================================================
+LOG_INDEX_DB = os.path.join("data", "log_index.db")
+LOG_FILE_PATTERN = re.compile(r'(maintenance_log|saldo_checker_log|smart_audit_log|smart_audit_fixing)_(\d{14})(_[A-Za-z0-9_\-]+)?\.txt')
+LOG_LINE_BITS = 24  # line rowid = file_id << 24 | line number, so a file's lines are one rowid range
+LOG_SEARCH_LIMIT = 200
+
+# Codes, table names and dates stay whole tokens: th_barang_saldo_202501, BRG-001.A, 2025-01-31
+LOG_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_files (
+    file_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    database_name TEXT,
+    logged_at TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    line_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_files_logged ON log_files (logged_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS log_lines USING fts5(line, tokenize="unicode61 tokenchars '_-./'");
+"""
+
+log_index_lock = threading.Lock()
+
+
+def open_log_index():
+    """Open the local log search index, creating the schema on first use"""
+    import sqlite3
+    folder = os.path.dirname(LOG_INDEX_DB)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    db = sqlite3.connect(LOG_INDEX_DB, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(LOG_INDEX_SCHEMA)
+    return db
+
+
+def delete_indexed_log(db, file_id):
+    """Drop one file's lines (a rowid range) and its bookkeeping row"""
+    db.execute("DELETE FROM log_lines WHERE rowid BETWEEN ? AND ?",
+               (file_id << LOG_LINE_BITS, ((file_id + 1) << LOG_LINE_BITS) - 1))
+    db.execute("DELETE FROM log_files WHERE file_id = ?", (file_id,))
+
+
+def index_log_files(folder="data"):
+    """Ingest new or changed log files, forget deleted ones. Unchanged files (same mtime and size) are skipped."""
+    started = time.time()
+    if not os.path.isdir(folder):
+        return {'indexed': 0, 'removed': 0, 'files': 0, 'seconds': 0}
+    
+    with log_index_lock:
+        db = open_log_index()
+        try:
+            known = {row['name']: row for row in db.execute("SELECT file_id, name, mtime, size FROM log_files")}
+            present = set()
+            indexed = 0
+            
+            for entry in os.scandir(folder):
+                match = LOG_FILE_PATTERN.fullmatch(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                present.add(entry.name)
+                stat = entry.stat()
+                previous = known.get(entry.name)
+                if previous and previous['mtime'] == stat.st_mtime and previous['size'] == stat.st_size:
+                    continue
+                
+                with open(entry.path, encoding='utf-8', errors='replace') as f:
+                    lines = f.read().splitlines()[:(1 << LOG_LINE_BITS) - 1]
+                database_name = next((line.split(':', 1)[1].strip() for line in lines[:10]
+                                      if line.startswith('Database:')), None)
+                stamp = match.group(2)
+                logged_at = f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]} {stamp[8:10]}:{stamp[10:12]}:{stamp[12:]}"
+                
+                if previous:
+                    delete_indexed_log(db, previous['file_id'])
+                cursor = db.execute("""
+                    INSERT INTO log_files (name, kind, database_name, logged_at, mtime, size, line_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (entry.name, match.group(1), database_name, logged_at, stat.st_mtime, stat.st_size, len(lines)))
+                base = cursor.lastrowid << LOG_LINE_BITS
+                db.executemany("INSERT INTO log_lines (rowid, line) VALUES (?, ?)",
+                               ((base + number, line) for number, line in enumerate(lines, 1)
+                                if line.strip() and not set(line.strip()) <= set('=-')))
+                db.commit()
+                indexed += 1
+            
+            removed = [row['file_id'] for name, row in known.items() if name not in present]
+            for file_id in removed:
+                delete_indexed_log(db, file_id)
+            db.commit()
+            
+            files = db.execute("SELECT COUNT(*) FROM log_files").fetchone()[0]
+        finally:
+            db.close()
+    
+    seconds = round(time.time() - started, 3)
+    if indexed or removed:
+        print(f"[LOG] Log index: {indexed} file(s) indexed, {len(removed)} removed, {files} total ({seconds}s)")
+    return {'indexed': indexed, 'removed': len(removed), 'files': files, 'seconds': seconds}
+
+
+def fts_phrase(term):
+    """One search term as an FTS5 phrase; a trailing * keeps prefix matching"""
+    term = str(term).strip()
+    prefix = term.endswith('*')
+    term = term.rstrip('*').replace('"', '""')
+    return f'"{term}"' + ('*' if prefix else '') if term else None
+
+
+def search_logs(kode_barang=None, kode_lokasi=None, table_name=None, text=None, database=None,
+                date_from=None, date_to=None, kinds=None, limit=LOG_SEARCH_LIMIT):
+    """Matching log lines, newest file first. All given terms must appear on the same line."""
+    terms = [kode_barang, kode_lokasi, table_name] + (str(text).split() if text else [])
+    phrases = [phrase for phrase in (fts_phrase(term) for term in terms if term) if phrase]
+    if not phrases:
+        raise ValueError('Enter a kode barang, kode lokasi, table name or text to search for')
+    
+    filters, params = ["log_lines MATCH ?"], [' AND '.join(phrases)]
+    if database:
+        filters.append("f.database_name = ?")
+        params.append(database)
+    if date_from:
+        filters.append("f.logged_at >= ?")
+        params.append(str(date_from)[:10])
+    if date_to:
+        filters.append("f.logged_at < date(?, '+1 day')")
+        params.append(str(date_to)[:10])
+    if kinds:
+        filters.append(f"f.kind IN ({', '.join('?' * len(kinds))})")
+        params.extend(kinds)
+    
+    started = time.time()
+    db = open_log_index()
+    try:
+        # Lines join their file through the rowid range: rowid >> 24 is the file_id
+        where = ' AND '.join(filters)
+        joined = f"FROM log_lines JOIN log_files f ON f.file_id = (log_lines.rowid >> {LOG_LINE_BITS}) WHERE {where}"
+        total = db.execute(f"SELECT COUNT(*) {joined}", params).fetchone()[0]
+        rows = db.execute(f"""
+            SELECT f.name, f.kind, f.database_name, f.logged_at,
+                   log_lines.rowid & {(1 << LOG_LINE_BITS) - 1} as line_no, log_lines.line
+            {joined}
+            ORDER BY f.logged_at DESC, line_no
+            LIMIT ?
+        """, params + [int(limit)]).fetchall()
+    finally:
+        db.close()
+    
+    return {
+        'total': total,
+        'results': [dict(row) for row in rows],
+        'seconds': round(time.time() - started, 3)
+    }
+
+
+# ============================================================
+# JOB RESULT STORE & STREAMING EXPORTS
+# ============================================================
+JOBS_FOLDER = os.path.join("data", "jobs")
+EXPORT_CHUNK_ROWS = 1000
+
+# Export columns per (job kind, section): (header, row key); a tuple of keys takes the first present value
+EXPORT_COLUMNS = {
+    ('audit', 'issues'): [('No', None), ('Kode Barang', 'kode_barang'), ('Kode Lokasi', 'kode_lokasi'),
+                          ('Issue Type', 'issue'), ('Count', ('count_tt', 'count_tm')), ('Description', 'issue_text')],
+    ('fix', 'duplicates'): [('No', None), ('Kode Barang', 'kode_barang'), ('Kode Lokasi', 'kode_lokasi'), ('Deleted Count', 'deleted_count')],
+    ('fix', 'missing'): [('No', None), ('Kode Barang', 'kode_barang'), ('Kode Lokasi', 'kode_lokasi'), ('Stock', 'stock')],
+    ('maintenance', 'results'): [('No', None), ('Table Name', 'table'), ('Status', 'status'), ('Action', 'action'), ('Result', 'result'),
+                                 ('Engine', 'engine'), ('Check Mode', 'check_mode'), ('Strategy', 'strategy'), ('Check (s)', 'check_seconds'),
+                                 ('Optimize (s)', 'optimize_seconds'), ('Total (s)', 'seconds')]
+}
+
+
+def new_job_id(kind):
+    """Unique, filesystem-safe job id"""
+    return f"{kind}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.urandom(3).hex()}"
+
+
+def get_job_folder(job_id):
+    """Folder of a stored job, rejecting ids that could escape JOBS_FOLDER"""
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', job_id or ''):
+        raise ValueError(f"Invalid job id: {job_id}")
+    return os.path.join(JOBS_FOLDER, job_id)
+
+
+def save_job_result(job_id, kind, database, summary, sections):
+    """Store a job result: meta.json + one JSON-lines file per section, so exports can stream it back"""
+    try:
+        folder = get_job_folder(job_id)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        
+        for section, rows in sections.items():
+            with open(os.path.join(folder, f"{section}.jsonl"), 'w', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+        
+        save_json_file(os.path.join(folder, "meta.json"), {
+            'job_id': job_id,
+            'kind': kind,
+            'database': database,
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'summary': summary,
+            'sections': {section: len(rows) for section, rows in sections.items()}
+        })
+        print(f"[LOG] Job result stored: {folder}")
+        
+    except Exception as e:
+        print(f"[LOG] Error storing job result {job_id}: {str(e)}")
+
+
+def load_job_meta(job_id):
+    """Load a stored job's meta record, or None"""
+    path = os.path.join(get_job_folder(job_id), "meta.json")
+    return load_json_file(path, None)
+
+
+def iter_job_rows(job_id, section):
+    """Stream the rows of a stored job section one at a time"""
+    with open(os.path.join(get_job_folder(job_id), f"{section}.jsonl"), 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_export_values(job_id, kind, section):
+    """Yield export rows (lists of values) for a stored job section"""
+    columns = EXPORT_COLUMNS[(kind, section)]
+    for idx, row in enumerate(iter_job_rows(job_id, section), 1):
+        values = []
+        for _, key in columns:
+            if key is None:
+                values.append(idx)
+            elif isinstance(key, tuple):
+                values.append(next((row[k] for k in key if row.get(k) is not None), ''))
+            else:
+                values.append(row.get(key, ''))
+        yield values
+
+
+def generate_csv_export(job_id, kind, section):
+    """CSV export in chunks of EXPORT_CHUNK_ROWS rows"""
+    import csv
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM so Excel opens it as UTF-8
+    writer.writerow([header for header, _ in EXPORT_COLUMNS[(kind, section)]])
+    
+    for idx, values in enumerate(iter_export_values(job_id, kind, section), 1):
+        writer.writerow(values)
+        if idx % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    
+    yield buffer.getvalue()
+
+
+def _xlsx_cell(column_idx, row_idx, value):
+    """One worksheet cell as XML (numbers stay numeric, text uses inline strings)"""
+    column = ''
+    n = column_idx + 1
+    while n:
+        n, remainder = divmod(n - 1, 26)
+        column = chr(65 + remainder) + column
+    ref = f"{column}{row_idx}"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{xml_escape(str(value))}</t></is></c>'
+
+
+def generate_xlsx_export(job_id, kind, section):
+    """XLSX export: sheet XML is streamed into a spooled temp file, then sent in chunks"""
+    import tempfile
+    import zipfile
+    
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                    '<Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                    '</Types>')
+        zf.writestr('_rels/.rels',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+                    '</Relationships>')
+        zf.writestr('xl/workbook.xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                    f'<sheets><sheet name="{xml_escape(section)}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        zf.writestr('xl/_rels/workbook.xml.rels',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+                    '</Relationships>')
+        
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            headers = [header for header, _ in EXPORT_COLUMNS[(kind, section)]]
+            sheet.write(('<row r="1">' + ''.join(_xlsx_cell(i, 1, h) for i, h in enumerate(headers)) + '</row>').encode('utf-8'))
+            for row_idx, values in enumerate(iter_export_values(job_id, kind, section), 2):
+                sheet.write((f'<row r="{row_idx}">' + ''.join(_xlsx_cell(i, row_idx, v) for i, v in enumerate(values)) + '</row>').encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    
+    spool.seek(0)
+    try:
+        while True:
+            chunk = spool.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+
+# ============================================================
+# COMPACT WIRE FORMAT & RESPONSE COMPRESSION
+# ============================================================
+# Issue types are sent as their index in this list (append only, the client keeps the same table)
+AUDIT_ISSUE_CODES = ['TM_NOT_IN_TT', 'TM_DUPLICATE_IN_TT', 'TT_NOT_IN_TM', 'TT_DUPLICATE_IN_TM']
+COMPACT_FORMAT_VERSION = 1
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+def encode_audit_issues(issues):
+    """Issue list -> columnar payload: enum-coded issue types, dictionary-encoded kode_lokasi, no issue_text"""
+    lokasi_values = []
+    lokasi_index = {}
+    compact = {'v': COMPACT_FORMAT_VERSION, 'lokasi': lokasi_values,
+               'kode_barang': [], 'kode_lokasi': [], 'issue': [], 'count': []}
+    
+    for issue in issues:
+        kode_lokasi = issue.get('kode_lokasi') or ''
+        if kode_lokasi not in lokasi_index:
+            lokasi_index[kode_lokasi] = len(lokasi_values)
+            lokasi_values.append(kode_lokasi)
+        
+        compact['kode_barang'].append(issue.get('kode_barang'))
+        compact['kode_lokasi'].append(lokasi_index[kode_lokasi])
+        compact['issue'].append(AUDIT_ISSUE_CODES.index(issue['issue']))
+        compact['count'].append(issue.get('count_tt', issue.get('count_tm', 0)))
+    
+    return compact
+
+
+def decode_audit_issues(compact):
+    """Columnar payload -> issue list, the inverse of encode_audit_issues"""
+    if compact.get('v') != COMPACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact format version: {compact.get('v')}")
+    
+    lokasi_values = compact['lokasi']
+    issues = []
+    for kode_barang, lokasi_idx, code, count in zip(compact['kode_barang'], compact['kode_lokasi'],
+                                                    compact['issue'], compact['count']):
+        issue_type = AUDIT_ISSUE_CODES[code]
+        count_key = 'count_tt' if issue_type.startswith('TM_') else 'count_tm'
+        issues.append({
+            'kode_barang': kode_barang,
+            'kode_lokasi': lokasi_values[lokasi_idx],
+            count_key: count,
+            'issue': issue_type,
+            'issue_text': audit_issue_text(issue_type, count)
+        })
+    return issues
+
+
+def get_request_issues(data):
+    """Issues from a request body, in either the compact or the verbose format"""
+    if data.get('issues_compact'):
+        return decode_audit_issues(data['issues_compact'])
+    return data.get('issues', [])
+
+
+def client_accepts_gzip():
+    """True when the current request advertises gzip in Accept-Encoding"""
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        if coding.strip().lower() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def gzip_event_stream(events):
+    """Gzip an SSE stream, flushing at every event boundary so the client can decode each event as it arrives"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for event in events:
+        yield compressor.compress(event.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def event_stream_response(events):
+    """text/event-stream response, gzip-compressed when the client supports it"""
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'Vary': 'Accept-Encoding'}
+    if client_accepts_gzip():
+        headers['Content-Encoding'] = 'gzip'
+        events = gzip_event_stream(events)
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=headers)
+
+
+@app.after_request
+def compress_json_response(response):
+    """Gzip buffered JSON responses above GZIP_MIN_SIZE (streamed responses handle their own encoding)"""
+    if (response.mimetype != 'application/json' or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.status_code < 200 or response.status_code >= 300):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if not client_accepts_gzip():
+        return response
+    
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    response.set_data(compressor.compress(body) + compressor.flush())
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# ============================================================
+# FLEET MODE - RUN TOOLS ACROSS MANY STORE DATABASES
+# ============================================================
+FLEET_CONFIG_FILE = "fleet.json"
+FLEET_TASKS = ('audit', 'saldo', 'maintenance')
+
+fleet_status = {
+    'is_running': False,
+    'started': None,
+    'finished': None,
+    'total': 0,
+    'done': 0,
+    'failed': 0,
+    'stores': {},
+    'report': None
+}
+
+
+def get_last_month_str():
+    """Last month as YYYY-MM, the only period the saldo tools may process"""
+    today = datetime.now()
+    if today.month == 1:
+        return f"{today.year - 1}-12"
+    return f"{today.year}-{today.month - 1:02d}"
+
+
+def load_fleet_config(config_file=FLEET_CONFIG_FILE):
+    """Load store connection profiles and fleet limits from a local JSON config file"""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    
+    stores = config.get('stores', [])
+    profiles = load_connection_profiles()
+    for idx, store in enumerate(stores):
+        if store.get('profile'):
+            store.update({key: value for key, value in profiles.get(store['profile'], {}).items() if not store.get(key)})
+            store.setdefault('name', store['profile'])
+        store.setdefault('name', f"{store.get('host', '')}/{store.get('database', '')}")
+        if not all([store.get('host'), store.get('user'), store.get('database')]):
+            raise ValueError(f"Store #{idx + 1} ({store['name']}) needs host, user and database")
+    
+    return {
+        'stores': stores,
+        'concurrency': int(config.get('concurrency', 4)),
+        'per_host_concurrency': int(config.get('per_host_concurrency', 1)),
+        'retries': int(config.get('retries', 2)),
+        'backoff_seconds': float(config.get('backoff_seconds', 5)),
+        'maintenance_tables': config.get('maintenance_tables', []),
+        'include_deferred': bool(config.get('include_deferred', False))
+    }
+
+
+def connect_fleet_store(host, user, password, database):
+    """Open a connection for one fleet task; raises so the store is retried instead of failing on None"""
+    connection = connect_to_mysql(host, user, password, database)
+    if not connection:
+        raise Exception(f"Connection failed: {host}/{database}")
+    return connection
+
+
+def close_fleet_connection(connection):
+    """Close a fleet task connection unless the task already closed it"""
+    if connection.open:
+        connection.close()
+
+
+def run_fleet_store_tasks(store, tasks, maintenance_tables, include_deferred=False):
+    """Run the selected tools against one store; raises on connection/task failure"""
+    host = store['host']
+    user = store['user']
+    password = store.get('password', '')
+    database = store['database']
+    result = {}
+    
+    if 'audit' in tasks:
+        connection = connect_fleet_store(host, user, password, database)
+        try:
+            for event in run_smart_audit_events(connection, host, user, password, database, shard_count=store.get('shards', 1)):
+                if event.get('type') == 'complete':
+                    result['audit'] = event['summary']
+                    if event.get('history') and event['history']['diff']:
+                        result['audit'] = result['audit'] | {'new': event['history']['diff']['new'],
+                                                             'resolved': event['history']['diff']['resolved']}
+        finally:
+            close_fleet_connection(connection)
+    
+    if 'saldo' in tasks:
+        check_date = get_last_month_str()
+        monthly_table = f"th_barang_saldo_{check_date.replace('-', '')}"
+        connection = connect_fleet_store(host, user, password, database)
+        try:
+            saldo = check_saldo_period(connection, database, check_date, monthly_table)
+        finally:
+            close_fleet_connection(connection)
+        result['saldo'] = {key: saldo.get(key) for key in ('monthlyTable', 'needsFixing', 'needsCreating', 'monthlyCount', 'mainCount', 'message')}
+    
+    if 'maintenance' in tasks:
+        connection = connect_fleet_store(host, user, password, database)
+        try:
+            tables = maintenance_tables
+            if not tables:
+                cursor = connection.cursor()
+                cursor.execute("SHOW TABLES")
+                tables = [list(row.values())[0] for row in cursor.fetchall()]
+                cursor.close()
+            if include_deferred:
+                queued_tables = [entry['table'] for entry in load_deferred_tables(host, database)]
+                tables = queued_tables + [table for table in tables if table not in queued_tables]
+            status = {'results': []}
+            results, deferred = run_scheduled_maintenance(connection, host, user, password, database, tables, status)
+        finally:
+            close_fleet_connection(connection)
+        save_maintenance_log(results, database)
+        result['maintenance'] = {
+            'tables': len(results),
+            'deferred': len(deferred),
+            'repaired': sum(1 for r in results if 'REPAIR' in r['action']),
+            'errors': sum(1 for r in results if r['status'] != 'OK')
+        }
+    
+    return result
+
+
+def run_fleet_store(store, tasks, config, host_limits):
+    """Run one store under its host concurrency limit, retrying failures with exponential backoff"""
+    name = store['name']
+    state = fleet_status['stores'][name]
+    
+    for attempt in range(config['retries'] + 1):
+        with host_limits[store['host']]:
+            state.update({'state': 'running', 'attempt': attempt + 1})
+            started = time.time()
+            try:
+                state['result'] = run_fleet_store_tasks(store, tasks, config['maintenance_tables'], config['include_deferred'])
+                state.update({'state': 'done', 'duration': round(time.time() - started, 2), 'error': None})
+                return
+            except Exception as e:
+                state.update({'state': 'retrying', 'duration': round(time.time() - started, 2), 'error': str(e)})
+                print(f"[FLEET] {name} attempt {attempt + 1} failed: {str(e)}")
+        
+        if attempt < config['retries']:
+            time.sleep(config['backoff_seconds'] * (2 ** attempt) + random.uniform(0, 1))
+    
+    state['state'] = 'failed'
+
+
+def build_fleet_report(stores):
+    """Consolidated fleet report: per-store summaries, slowest stores, totals"""
+    finished = [dict(state, name=name) for name, state in stores.items() if state.get('duration') is not None]
+    slowest = sorted(finished, key=lambda s: s['duration'], reverse=True)[:5]
+    
+    totals = {'stores': len(stores), 'done': 0, 'failed': 0, 'audit_issues': 0, 'saldo_needs_fixing': 0,
+              'saldo_needs_creating': 0, 'tables_maintained': 0, 'tables_repaired': 0}
+    for state in stores.values():
+        totals['done' if state['state'] == 'done' else 'failed'] += 1
+        result = state.get('result') or {}
+        if 'audit' in result:
+            totals['audit_issues'] += result['audit'].get('total_issues', 0)
+        if 'saldo' in result:
+            totals['saldo_needs_fixing'] += 1 if result['saldo'].get('needsFixing') else 0
+            totals['saldo_needs_creating'] += 1 if result['saldo'].get('needsCreating') else 0
+        if 'maintenance' in result:
+            totals['tables_maintained'] += result['maintenance']['tables']
+            totals['tables_repaired'] += result['maintenance']['repaired']
+    
+    return {
+        'totals': totals,
+        'slowest': [{'name': s['name'], 'duration': s['duration']} for s in slowest],
+        'stores': stores
+    }
+
+
+def save_fleet_report(report, tasks):
+    """Save consolidated fleet report as text + JSON"""
+    try:
+        data_folder = "data"
+        if not os.path.exists(data_folder):
+            os.makedirs(data_folder)
+        
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        log_file = os.path.join(data_folder, f"fleet_report_{timestamp}.txt")
+        
+        with open(os.path.join(data_folder, f"fleet_report_{timestamp}.json"), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+        
+        with open(log_file, 'w', encoding='utf-8') as f:
+            f.write("=" * 100 + "\n")
+            f.write("FLEET REPORT\n")
+            f.write("=" * 100 + "\n")
+            f.write(f"Date/Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"Tasks: {', '.join(tasks)}\n")
+            f.write("=" * 100 + "\n\n")
+            
+            f.write("TOTALS\n")
+            f.write("-" * 100 + "\n")
+            for key, value in report['totals'].items():
+                f.write(f"{key.replace('_', ' ').title()}: {value:,}\n")
+            f.write("\n")
+            
+            f.write("SLOWEST STORES\n")
+            f.write("-" * 100 + "\n")
+            for item in report['slowest']:
+                f.write(f"{item['name']:<40} {item['duration']:>10.2f} s\n")
+            f.write("\n")
+            
+            f.write("PER STORE\n")
+            f.write("-" * 100 + "\n")
+            f.write(f"{'Store':<40} {'State':<10} {'Attempts':<10} {'Duration':<12} {'Issues':<10} {'Error':<30}\n")
+            f.write("-" * 100 + "\n")
+            for name, state in report['stores'].items():
+                audit = (state.get('result') or {}).get('audit', {})
+                duration = f"{state['duration']:.2f} s" if state.get('duration') is not None else '-'
+                f.write(f"{name:<40} {state['state']:<10} {state.get('attempt', 0):<10} {duration:<12} {audit.get('total_issues', '-'):<10} {(state.get('error') or '')[:30]:<30}\n")
+            f.write("=" * 100 + "\n")
+        
+        print(f"\n[LOG] Fleet report saved to: {log_file}")
+        
+    except Exception as e:
+        print(f"[LOG] Error saving fleet report: {str(e)}")
+
+
+def run_fleet(config, tasks):
+    """Run the selected tools across all stores with global and per-host concurrency limits"""
+    host_limits = {store['host']: threading.BoundedSemaphore(config['per_host_concurrency']) for store in config['stores']}
+    
+    with ThreadPoolExecutor(max_workers=max(1, config['concurrency'])) as executor:
+        futures = [executor.submit(run_fleet_store, store, tasks, config, host_limits) for store in config['stores']]
+        for future in as_completed(futures):
+            future.result()
+            fleet_status['done'] = sum(1 for s in fleet_status['stores'].values() if s['state'] in ('done', 'failed'))
+            fleet_status['failed'] = sum(1 for s in fleet_status['stores'].values() if s['state'] == 'failed')
+    
+    report = build_fleet_report(fleet_status['stores'])
+    save_fleet_report(report, tasks)
+    
+    fleet_status['report'] = {'totals': report['totals'], 'slowest': report['slowest']}
+    fleet_status['finished'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    fleet_status['is_running'] = False
+    print(f"[FLEET] Completed. {report['totals']}")
+
+
+# ============================================================
+# STARTUP, CACHED STATIC ASSETS & TIME-TO-INTERACTIVE
+# ============================================================
+SERVER_HOST = 'localhost'
+SERVER_PORT = 5000
+ASSET_CACHE_SECONDS = 365 * 24 * 60 * 60
+STARTUP_METRICS_FILE = os.path.join("data", "startup_metrics.jsonl")
+
+asset_hashes = {}   # static filename -> (mtime, content hash)
+index_cache = {}    # pre-rendered index.html: body, etag, sources (path -> mtime)
+startup_metrics = {'load_started': APP_LOAD_STARTED}
+
+
+def asset_url(filename):
+    """Static URL with a content hash (?v=), so the file can be cached for a year and still update when it changes"""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return url_for('static', filename=filename)
+    
+    cached = asset_hashes.get(filename)
+    if not cached or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = asset_hashes[filename] = (mtime, hashlib.md5(f.read()).hexdigest()[:10])
+    index_cache.setdefault('pending_sources', {})[path] = mtime
+    return url_for('static', filename=filename, v=cached[1])
+
+
+app.jinja_env.globals['asset_url'] = asset_url
+
+
+def index_sources_changed():
+    """True when the template or an asset it references changed since index.html was rendered"""
+    for path, mtime in index_cache.get('sources', {}).items():
+        try:
+            if os.path.getmtime(path) != mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def render_index():
+    """index.html rendered once (asset hashes baked in) and reused until a source file changes"""
+    if 'body' not in index_cache or index_sources_changed():
+        template_path = os.path.join(app.root_path, app.template_folder, 'index.html')
+        index_cache['pending_sources'] = {template_path: os.path.getmtime(template_path)}
+        body = render_template('index.html').encode('utf-8')
+        index_cache['sources'] = index_cache.pop('pending_sources')
+        index_cache['body'] = body
+        index_cache['etag'] = hashlib.md5(body).hexdigest()
+    return index_cache['body'], index_cache['etag']
+
+
+@app.after_request
+def cache_static_assets(response):
+    """Content-hashed static URLs never change, let the browser keep them"""
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_CACHE_SECONDS
+        response.cache_control.immutable = True
+    return response
+
+
+def report_startup_metrics(client):
+    """Log time-to-interactive: process start -> imports -> socket ready -> browser -> page interactive"""
+    now = time.time()
+    first_report = 'interactive' not in startup_metrics
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'first_load': first_report,
+        'client_interactive_ms': client.get('interactive_ms'),
+        'client_dom_content_loaded_ms': client.get('dom_content_loaded_ms'),
+        'client_load_ms': client.get('load_ms')
+    }
+    
+    if first_report:
+        startup_metrics['interactive'] = now
+        started = startup_metrics['load_started']
+        for key in ('imported', 'server_ready', 'browser_opened', 'first_page'):
+            if key in startup_metrics:
+                entry[f'{key}_seconds'] = round(startup_metrics[key] - started, 3)
+        entry['time_to_interactive_seconds'] = round(now - started, 3)
+        print(f"[STARTUP] Time to interactive: {entry['time_to_interactive_seconds']:.2f}s "
+              f"(imports {entry.get('imported_seconds', 0):.2f}s, socket ready {entry.get('server_ready_seconds', 0):.2f}s, "
+              f"first page {entry.get('first_page_seconds', 0):.2f}s, page script {client.get('interactive_ms') or 0:.0f}ms)")
+    
+    try:
+        folder = os.path.dirname(STARTUP_METRICS_FILE)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(STARTUP_METRICS_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+    except Exception as e:
+        print(f"[LOG] Error saving startup metrics: {str(e)}")
+    
+    startup_metrics.setdefault('page_loads', []).append(entry)
+    return entry
+
+
+@app.route('/')
+def index():
+    """Main page (pre-rendered; revalidated by ETag, assets are cached by content hash)"""
+    body, etag = render_index()
+    startup_metrics.setdefault('first_page', time.time())
+    
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/startup-metrics', methods=['GET'])
+def get_startup_metrics():
+    """Startup timeline of this process and the page loads reported so far"""
+    return jsonify({
+        'success': True,
+        'metrics': startup_metrics
+    })
+
+
+@app.route('/startup-metrics', methods=['POST'])
+def post_startup_metrics():
+    """Page reports it is interactive (sent once per page load by app.js)"""
+    entry = report_startup_metrics(request.get_json(silent=True) or {})
+    return jsonify({
+        'success': True,
+        'metrics': entry
+    })
+
+
+@app.route('/get-tables', methods=['POST'])
+def get_tables():
+    """Get list of all tables in database"""
+    try:
+        data = request.get_json()
+        host, user, password, database = get_connection_params(data)
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Host, User, and Database fields!'
+            })
+        
+        connection = connect_to_mysql(host, user, password, database)
+        
+        if connection:
+            # One SHOW TABLE STATUS for all tables instead of one per table
+            all_status = get_all_table_status(connection)
+            # Every Load Tables is also a free growth sample, unless 8.0 served cached statistics
+            if not get_server_capabilities(connection, host, database).get('stats_expiry'):
+                record_growth_sample(host, database, all_status)
+            
+            table_list = []
+            for table_name, status in all_status.items():
+                rows = status.get('Rows') or 0
+                size = status.get('Data_length') or 0
                 
-                if repair_success:
-                    # 3. OPTIMIZE TABLE after repair
-                    print(f"[LOG] Step 3: Optimizing table...")
-                    optimize_result = optimize_table(connection, table_name)
-                    action_taken = "REPAIR + OPTIMIZE"
-                    final_result = "Repaired & Optimized"
-                    print(f"[LOG] ✓ Optimization complete")
+                # Format size
+                if size > 1024 * 1024:
+                    size_str = f"{size / (1024 * 1024):.2f} MB"
+                elif size > 1024:
+                    size_str = f"{size / 1024:.2f} KB"
                 else:
-                    final_result = "Repair Failed"
-                    print(f"[LOG] ✗ Repair failed")
-            else:
-                # Table is OK, just optimize
-                print(f"[LOG] ✓ Table is healthy")
-                print(f"[LOG] Step 2: Optimizing table...")
-                optimize_result = optimize_table(connection, table_name)
-                action_taken = "OPTIMIZE"
-                final_result = "Optimized"
-                print(f"[LOG] ✓ Optimization complete")
-            
-            # Store result
-            result_entry = {
-                'table': table_name,
-                'status': table_status,
-                'action': action_taken,
-                'result': final_result
-            }
-            check_results.append(result_entry)
-            maintenance_status['results'].append(result_entry)
+                    size_str = f"{size} B"
+                
+                table_list.append({
+                    'name': table_name,
+                    'rows': rows,
+                    'size': size_str
+                })
+            
+            connection.close()
+            
+            return jsonify({
+                'success': True,
+                'tables': table_list
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'message': 'Connection failed. Please check your credentials.'
+            })
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/test-connection', methods=['POST'])
+def test_connection():
+    """Test MySQL connection"""
+    try:
+        data = request.get_json()
+        host, user, password, database = get_connection_params(data)
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Host, User, and Database fields!'
+            })
+        
+        connection = connect_to_mysql(host, user, password, database)
+        
+        if connection:
+            # Version and table count come from the cached capability record (probed once per server)
+            capabilities = get_server_capabilities(connection, host, database)
+            table_count = capabilities['table_count']
+            version = capabilities['version']
+            
+            connection.close()
+            
+            return jsonify({
+                'success': True,
+                'message': f'✓ Connected successfully!\nMySQL: {version}\nTables: {table_count}'
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'message': 'Connection failed. Please check your credentials.'
+            })
             
-            print(f"[LOG] ====== Completed: {table_name} ======\n")
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+def reset_maintenance_status(total, results=None):
+    """Fresh maintenance_status for a run of total tables (results already done when resuming)"""
+    maintenance_status.reset({
+        'is_running': True,
+        'current': len(results or []),
+        'total': total,
+        'percentage': 0,
+        'message': 'Connecting to database...',
+        'completed': False,
+        'error': None,
+        'results': list(results or []),
+        'paused': False,
+        'load': None,
+        'deferred': [],
+        'run_id': None,
+        'operation_id': None
+    })
+
+
+def execute_maintenance_run(host, user, password, database, run_id, tables, previous_results=None, operation_id=None):
+    """Run (or continue) journaled maintenance run_id over tables; returns the response body"""
+    global check_results
+    
+    maintenance_status['run_id'] = run_id
+    
+    # Connect to database
+    connection = connect_to_mysql(host, user, password, database)
+    
+    if not connection:
+        maintenance_status['error'] = 'Connection failed'
+        maintenance_status['is_running'] = False
+        return {
+            'success': False,
+            'message': 'Failed to connect to database'
+        }
+    
+    # Process tables under the load guard; tables that cannot run now are deferred
+    operation_id = register_operation(operation_id, 'maintenance', host, user, password, database)
+    maintenance_status['operation_id'] = operation_id
+    try:
+        attach_connection(operation_id, connection)
+        results, deferred = run_scheduled_maintenance(connection, host, user, password, database, tables,
+                                                      maintenance_status, run_id=run_id, operation_id=operation_id)
+    finally:
+        cancelled = is_cancelled(operation_id)
+        unregister_operation(operation_id)
+        connection.close()
+    check_results = list(previous_results or []) + results
+    
+    # Save log
+    save_maintenance_log(check_results, database)
+    
+    # The run id doubles as the job id, so the export of a resumed run covers all its tables
+    save_job_result(run_id, 'maintenance', database, {'tables': len(check_results)}, {'results': check_results})
+    
+    maintenance_status['completed'] = True
+    maintenance_status['is_running'] = False
+    
+    if cancelled:
+        # No finish record: the run stays resumable from the interrupted table
+        maintenance_status['message'] = f'Maintenance cancelled after {len(check_results)} tables.'
+        return {
+            'success': True,
+            'cancelled': True,
+            'message': f'Maintenance cancelled after {len(check_results)} tables. Use RESUME to continue the run.',
+            'job_id': run_id,
+            'run_id': run_id,
+            'results': check_results,
+            'deferred': deferred
+        }
+    
+    append_run_journal(run_id, 'finish', tables=len(check_results), deferred=len(deferred))
+    
+    # Nothing ran to the end (window closed, server busy, timeouts): the run was deferred, not completed
+    if deferred and all(r['status'] == 'DEFERRED' for r in results):
+        reasons = ', '.join(sorted({entry['reason'] for entry in deferred}))
+        maintenance_status['message'] = f'Maintenance deferred: {len(deferred)} table(s) ({reasons}).'
+        return {
+            'success': True,
+            'deferred_only': True,
+            'message': f'Maintenance deferred, no table was completed.\n{len(deferred)} table(s) queued for the next '
+                       f'maintenance window: {reasons}.',
+            'job_id': run_id,
+            'run_id': run_id,
+            'results': check_results,
+            'deferred': deferred
+        }
+    
+    maintenance_status['message'] = f'Maintenance completed! {len(check_results)} tables processed.'
+    
+    message = f'Maintenance completed successfully!\n{len(check_results)} tables processed.'
+    if deferred:
+        message += f'\n{len(deferred)} table(s) deferred to the next maintenance window.'
+    timed_out = sum(1 for r in check_results if r['status'] == 'TIMEOUT')
+    if timed_out:
+        message += f'\n{timed_out} table(s) stopped by the statement timeout.'
+    
+    return {
+        'success': True,
+        'message': message,
+        'job_id': run_id,
+        'run_id': run_id,
+        'results': check_results,
+        'deferred': deferred
+    }
+
+
+@app.route('/start-maintenance', methods=['POST'])
+def start_maintenance():
+    """Start table check/repair/optimize process"""
+    try:
+        data = request.get_json()
+        host, user, password, database = get_connection_params(data)
+        selected_tables = data.get('tables', [])
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in all required fields!'
+            })
+        
+        # Tables deferred by an earlier run are picked up first, when asked for
+        if data.get('include_deferred'):
+            queued_tables = [entry['table'] for entry in load_deferred_tables(host, database)]
+            selected_tables = queued_tables + [table for table in selected_tables if table not in queued_tables]
+        
+        if not selected_tables:
+            return jsonify({
+                'success': False,
+                'message': 'Please select at least one table to check!'
+            })
+        
+        # Reset status
+        reset_maintenance_status(len(selected_tables))
+        
+        run_id = new_job_id('maintenance')
+        append_run_journal(run_id, 'start', host=host, user=user, database=database, tables=selected_tables)
+        
+        return jsonify(execute_maintenance_run(host, user, password, database, run_id, selected_tables,
+                                               operation_id=data.get('operation_id')))
+        
+    except Exception as e:
+        maintenance_status['error'] = str(e)
+        maintenance_status['is_running'] = False
+        return jsonify({
+            'success': False,
+            'message': f'Maintenance failed: {str(e)}'
+        })
+
+
+@app.route('/resume-maintenance', methods=['POST'])
+def resume_maintenance():
+    """Resume a journaled maintenance run: finished tables are skipped, the rest runs as usual"""
+    try:
+        data = request.get_json() or {}
+        run = read_run_journal(data.get('run_id', ''))
+        start = run['start']
+        
+        # Password is never journaled: it comes from the request or a profile
+        host, user, password, database = get_connection_params({
+            'profile': data.get('profile'),
+            'host': data.get('host') or start['host'],
+            'user': data.get('user') or start['user'],
+            'password': data.get('password'),
+            'database': data.get('database') or start['database']
+        })
+        
+        if (host, database) != (start['host'], start['database']):
+            return jsonify({
+                'success': False,
+                'message': f"Run {run['run_id']} belongs to {start['database']} @ {start['host']}"
+            })
+        
+        if not run['remaining']:
+            return jsonify({
+                'success': False,
+                'message': f"Run {run['run_id']} has no unfinished tables"
+            })
+        
+        print(f"[LOG] Resuming run {run['run_id']}: {len(run['results'])} done, {len(run['remaining'])} remaining")
+        reset_maintenance_status(len(start['tables']), run['results'])
+        append_run_journal(run['run_id'], 'resume', remaining=len(run['remaining']))
+        
+        return jsonify(execute_maintenance_run(host, user, password, database, run['run_id'], run['remaining'], run['results'],
+                                               operation_id=data.get('operation_id')))
+        
+    except Exception as e:
+        maintenance_status['error'] = str(e)
+        maintenance_status['is_running'] = False
+        return jsonify({
+            'success': False,
+            'message': f'Resume failed: {str(e)}'
+        })
+
+
+@app.route('/maintenance-runs')
+def get_maintenance_runs():
+    """List journaled maintenance runs (newest first), with how many tables are left"""
+    return jsonify({
+        'success': True,
+        'runs': list_maintenance_runs()
+    })
+
+
+@app.route('/operations')
+def list_operations():
+    """Running cancellable operations"""
+    with operations_lock:
+        operations = [{'operation_id': operation_id, 'kind': op['kind'], 'database': op['database'],
+                       'started_at': op['started_at'], 'connections': len(op['connection_ids']), 'cancelled': op['cancelled']}
+                      for operation_id, op in running_operations.items()]
+    return jsonify({
+        'success': True,
+        'operations': operations
+    })
+
+
+@app.route('/cancel/<operation_id>', methods=['POST'])
+def cancel_running_operation(operation_id):
+    """Cancel a running operation: KILL QUERY its statements from a side connection, the operation rolls back"""
+    try:
+        found, killed, postponed = cancel_operation(operation_id)
+        if not found:
+            return jsonify({
+                'success': False,
+                'message': 'Operation not found (already finished?)'
+            })
+        
+        if postponed:
+            return jsonify({
+                'success': True,
+                'postponed': True,
+                'message': '✓ Cancel requested: a REPAIR/OPTIMIZE is running and is not interrupted (MyISAM), '
+                           'the operation stops right after it'
+            })
+        
+        return jsonify({
+            'success': True,
+            'message': f'✓ Cancel requested ({killed} running statement(s) killed)'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+STATUS_MAX_WAIT_SECONDS = 30
+STATUS_KEEPALIVE_SECONDS = 15
+
+
+def parse_status_cursor(source):
+    """(since, epoch) results cursor from query args; None when absent or malformed"""
+    try:
+        since = source.get('since')
+        epoch = source.get('epoch')
+        return (int(since), int(epoch)) if since is not None and epoch is not None else (None, None)
+    except (TypeError, ValueError):
+        return None, None
+
+
+def parse_status_wait(source):
+    """?wait=seconds for a long-poll, clamped to 0..STATUS_MAX_WAIT_SECONDS; 0 when absent or malformed"""
+    try:
+        wait = float(source.get('wait', 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+    if wait != wait:  # NaN
+        return 0
+    return min(max(wait, 0), STATUS_MAX_WAIT_SECONDS)
+
+
+@app.route('/maintenance-status')
+def get_maintenance_status():
+    """Current maintenance status.
+    
+    ?since=N&epoch=E returns only results after the first N of run epoch E. The ETag is the status version:
+    with If-None-Match (or ?version=) plus ?wait=seconds the request blocks until the status changes,
+    and answers 304 if it did not.
+    """
+    since, epoch = parse_status_cursor(request.args)
+    known = request.args.get('version') or (request.headers.get('If-None-Match') or '').strip('W/"') or None
+    
+    if known is not None and known == str(maintenance_status.version):
+        wait = parse_status_wait(request.args)
+        if wait:
+            maintenance_status.wait(int(known), wait)
+        if str(maintenance_status.version) == known:
+            response = Response(status=304)
+            response.headers['ETag'] = f'"{known}"'
+            return response
+    
+    body = maintenance_status.snapshot(since, epoch)
+    response = jsonify(body)
+    response.headers['ETag'] = f'"{body["version"]}"'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/maintenance-status-stream')
+def maintenance_status_stream():
+    """Maintenance status as server-sent events: one event per change, carrying only the new results.
+    
+    Each event id is epoch:results:version, so an EventSource reconnect (Last-Event-ID) resumes the delta.
+    """
+    since, epoch = parse_status_cursor(request.args)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.count(':') == 2:
+        epoch, since, _ = (int(part) if part.isdigit() else None for part in last_event_id.split(':'))
+    
+    def generate(since, epoch):
+        version = None
+        while True:
+            current = maintenance_status.wait(version, STATUS_KEEPALIVE_SECONDS) if version is not None else None
+            if version is not None and current == version:
+                yield ": keepalive\n\n"
+                continue
+            body = maintenance_status.snapshot(since, epoch)
+            version, epoch, since = body['version'], body['epoch'], body['results_total']
+            yield f"id: {epoch}:{since}:{version}\ndata: {json.dumps(body, default=str)}\n\n"
+    
+    return event_stream_response(generate(since, epoch))
+
+
+@app.route('/maintenance-settings', methods=['GET'])
+def get_maintenance_settings():
+    """Get the maintenance scheduler settings (load guard thresholds and window)"""
+    settings = load_maintenance_settings()
+    return jsonify({
+        'success': True,
+        'settings': settings,
+        'in_window': in_maintenance_window(settings)
+    })
+
+
+@app.route('/maintenance-settings', methods=['POST'])
+def save_maintenance_settings():
+    """Save maintenance scheduler settings; unknown keys are ignored"""
+    try:
+        data = request.get_json() or {}
+        settings = load_maintenance_settings()
+        
+        for key in DEFAULT_MAINTENANCE_SETTINGS:
+            if key not in data:
+                continue
+            value = data[key]
+            if key in ('smart_check', 'verify_moves', 'verify_after_fix'):
+                value = bool(value)
+            elif key == 'rebuild_mode':
+                if value not in ('online', 'classic'):
+                    raise ValueError("rebuild_mode must be 'online' or 'classic'")
+            elif key == 'plan_guard':
+                if value not in ('off', 'warn', 'refuse'):
+                    raise ValueError("plan_guard must be 'off', 'warn' or 'refuse'")
+            elif key in ('window_start', 'window_end'):
+                value = None if value in (None, '') else int(value)
+                if value is not None and not 0 <= value <= 23:
+                    raise ValueError(f'{key} must be an hour between 0 and 23')
+            else:
+                value = float(value) if key == 'throttle_factor' else int(value)
+            settings[key] = value
+        
+        with settings_lock:
+            save_json_file(MAINTENANCE_SETTINGS_FILE, settings)
+        
+        return jsonify({
+            'success': True,
+            'message': '✓ Maintenance settings saved',
+            'settings': settings
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/maintenance-deferred', methods=['POST'])
+def get_maintenance_deferred():
+    """Tables deferred for the next maintenance window of a database"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
         
-        connection.close()
+        if data.get('clear'):
+            save_deferred_tables(host, database, [])
         
-        # Save log
-        save_maintenance_log(check_results, database)
+        return jsonify({
+            'success': True,
+            'deferred': load_deferred_tables(host, database)
+        })
         
-        maintenance_status['completed'] = True
-        maintenance_status['is_running'] = False
-        maintenance_status['message'] = f'Maintenance completed! {len(check_results)} tables processed.'
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/growth-sampler', methods=['GET'])
+def get_growth_sampler():
+    """Growth sampler config (without passwords) and state"""
+    config = load_growth_sampler()
+    config['targets'] = [{'host': t.get('host'), 'database': t.get('database'), 'user': t.get('user')} for t in config['targets']]
+    return jsonify({'success': True, 'sampler': config, 'state': growth_sampler_state})
+
+
+@app.route('/growth-sampler', methods=['POST'])
+def save_growth_sampler():
+    """Change the sampler interval/retention/threshold, add or remove a store ("action": "add" | "remove")"""
+    try:
+        data = request.get_json() or {}
+        with settings_lock:
+            config = load_growth_sampler()
+            for key in ('interval_minutes', 'retention_days', 'threshold_mb'):
+                if key in data:
+                    value = int(data[key])
+                    if value < 1:
+                        raise ValueError(f'{key} must be at least 1')
+                    config[key] = value
+            
+            action = data.get('action')
+            if action in ('add', 'remove'):
+                host, user, password, database = get_connection_params(data)
+                if not all([host, user, database]):
+                    raise ValueError('Please fill in Host, User, and Database fields!')
+                config['targets'] = [t for t in config['targets'] if (t['host'], t['database']) != (host, database)]
+                if action == 'add':
+                    config['targets'].append({'host': host, 'user': user, 'password': password, 'database': database})
+            
+            save_json_file(GROWTH_SAMPLER_FILE, config)
+        
+        if not start_growth_sampler():
+            growth_sampler_wakeup.set()  # running loop picks up the new config now
         
         return jsonify({
             'success': True,
-            'message': f'Maintenance completed successfully!\n{len(check_results)} tables processed.',
-            'results': check_results
+            'message': f"✓ Growth sampler: {len(config['targets'])} store(s), every {config['interval_minutes']} minutes"
         })
         
     except Exception as e:
-        maintenance_status['error'] = str(e)
-        maintenance_status['is_running'] = False
         return jsonify({
             'success': False,
-            'message': f'Maintenance failed: {str(e)}'
+            'message': f'Error: {str(e)}'
         })
 
 
-@app.route('/maintenance-status')
-def get_maintenance_status():
-    """Get current maintenance status"""
-    return jsonify(maintenance_status)
+@app.route('/table-growth', methods=['POST'])
+def table_growth():
+    """Growth rate, days until threshold and fragmentation trend per table of a store"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        if not all([host, database]):
+            return jsonify({'success': False, 'message': 'Please fill in host and database!'}), 400
+        
+        threshold_mb = int(data['threshold_mb']) if data.get('threshold_mb') else None
+        forecast = forecast_table_growth(host, database, days=int(data.get('days', 30)), threshold_mb=threshold_mb,
+                                         table_name=data.get('table') or None)
+        return jsonify({'success': True, 'forecast': forecast})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/plan-check', methods=['POST'])
+def plan_check():
+    """EXPLAIN the built-in queries of an operation; optionally create the suggested indexes"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Host, User, and Database fields!'
+            })
+        
+        operation = data.get('operation') or None
+        if operation and operation not in {t['operation'] for t in PLAN_QUERY_TEMPLATES.values()}:
+            raise ValueError(f'Unknown operation: {operation}')
+        
+        connection = connect_to_mysql(host, user, password, database)
+        if not connection:
+            return jsonify({
+                'success': False,
+                'message': 'Connection failed. Please check your credentials.'
+            })
+        
+        try:
+            capabilities = get_server_capabilities(connection, host, database)
+            report = check_query_plans(connection, capabilities, operation=operation,
+                                       executions=data.get('executions'), check_date=data.get('checkDate'))
+            
+            created = []
+            if data.get('create_indexes') and report['suggestions']:
+                created = create_suggested_indexes(connection, report['suggestions'], capabilities)
+                # The cached capabilities carry each table's index list: refresh them, then re-check with the new indexes
+                capabilities = get_server_capabilities(connection, host, database, refresh=True)
+                report = check_query_plans(connection, capabilities, operation=operation,
+                                           executions=data.get('executions'), check_date=data.get('checkDate'))
+        finally:
+            connection.close()
+        
+        return jsonify({
+            'success': True,
+            'plan': report,
+            'created_indexes': created
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
 
 
 @app.route('/open-data-folder', methods=['POST'])
 def open_data_folder():
     """Open data folder in file explorer"""
+    import subprocess
+    
     try:
         data_folder = os.path.abspath("data")
         if os.path.exists(data_folder):
@@ -627,15 +5280,48 @@ def open_data_folder():
         return jsonify({'success': False, 'message': str(e)})
 
 
+@app.route('/log-search', methods=['POST'])
+def log_search():
+    """Search the data/ log files (new files are indexed first) by kode barang, lokasi, table, text, database, date"""
+    try:
+        data = request.get_json() or {}
+        index_status = index_log_files()
+        kinds = data.get('kinds') or None
+        if isinstance(kinds, str):
+            kinds = [kinds]
+        
+        found = search_logs(
+            kode_barang=(data.get('kode_barang') or '').strip() or None,
+            kode_lokasi=(data.get('kode_lokasi') or '').strip() or None,
+            table_name=(data.get('table') or '').strip() or None,
+            text=(data.get('text') or '').strip() or None,
+            database=(data.get('database') or '').strip() or None,
+            date_from=data.get('date_from') or None,
+            date_to=data.get('date_to') or None,
+            kinds=kinds,
+            limit=max(1, min(int(data.get('limit', LOG_SEARCH_LIMIT)), 1000))
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': f"{found['total']:,} matching line(s) in {index_status['files']:,} log files ({found['seconds'] * 1000:.0f} ms)",
+            'index': index_status,
+            **found
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
 @app.route('/check-saldo', methods=['POST'])
 def check_saldo():
     """Check barang saldo data for specific month (format: th_barang_saldo_yyyyMM)"""
     try:
         data = request.get_json()
-        host = data.get('host', '').strip()
-        user = data.get('user', '').strip()
-        password = data.get('password', '').strip()
-        database = data.get('database', '').strip()
+        host, user, password, database = get_connection_params(data)
         check_date = data.get('checkDate', '').strip()  # Format: YYYY-MM
         
         if not all([host, user, database, check_date]):
@@ -688,82 +5374,7 @@ def check_saldo():
                 'message': 'Connection failed. Please check your credentials.'
             })
         
-        cursor = connection.cursor()
-        
-        # Check if monthly table exists
-        cursor.execute(f"SHOW TABLES LIKE '{monthly_table}'")
-        table_exists = cursor.fetchone() is not None
-        
-        if not table_exists:
-            cursor.close()
-            connection.close()
-            return jsonify({
-                'success': True,
-                'needsFixing': False,
-                'needsCreating': True,
-                'message': f'⚠ Table {monthly_table} does not exist in database. You can create it now.',
-                'monthlyTable': monthly_table,
-                'checkDate': check_date
-            })
-        
-        # Check if monthly table has data
-        cursor.execute(f"SELECT COUNT(*) as count FROM `{monthly_table}`")
-        monthly_count = cursor.fetchone()['count']
-        
-        if monthly_count > 0:
-            cursor.close()
-            connection.close()
-            
-            # Log the check result
-            result_data = {'monthlyCount': monthly_count, 'mainCount': 0, 'needsFixing': False, 'needsCreating': False}
-            save_saldo_checker_log("CHECK", database, check_date, monthly_table, result_data)
-            
-            return jsonify({
-                'success': True,
-                'needsFixing': False,
-                'message': f'✓ Table {monthly_table} exists and has {monthly_count:,} records. Data is OK!',
-                'monthlyTable': monthly_table,
-                'monthlyCount': monthly_count
-            })
-        
-        # Monthly table is empty, check main table
-        cursor.execute(f"""
-            SELECT COUNT(*) as count 
-            FROM th_barang_saldo 
-            WHERE LEFT(tanggal, 7) = '{check_date}'
-        """)
-        main_count = cursor.fetchone()['count']
-        
-        cursor.close()
-        connection.close()
-        
-        if main_count > 0:
-            # Log the check result
-            result_data = {'monthlyCount': 0, 'mainCount': main_count, 'needsFixing': True, 'needsCreating': False}
-            save_saldo_checker_log("CHECK", database, check_date, monthly_table, result_data)
-            
-            return jsonify({
-                'success': True,
-                'needsFixing': True,
-                'message': f'⚠ Table {monthly_table} is EMPTY, but found {main_count:,} records in th_barang_saldo for period {check_date}. Ready to fix!',
-                'monthlyTable': monthly_table,
-                'monthlyCount': 0,
-                'mainCount': main_count,
-                'checkDate': check_date
-            })
-        else:
-            # Log the check result
-            result_data = {'monthlyCount': 0, 'mainCount': 0, 'needsFixing': False, 'needsCreating': False}
-            save_saldo_checker_log("CHECK", database, check_date, monthly_table, result_data)
-            
-            return jsonify({
-                'success': True,
-                'needsFixing': False,
-                'message': f'ℹ Table {monthly_table} is empty and no data found in th_barang_saldo for period {check_date}.',
-                'monthlyTable': monthly_table,
-                'monthlyCount': 0,
-                'mainCount': 0
-            })
+        return jsonify(check_saldo_period(connection, database, check_date, monthly_table))
         
     except Exception as e:
         return jsonify({
@@ -777,10 +5388,7 @@ def fix_saldo():
     """Fix barang saldo by moving data from main table to monthly table (th_barang_saldo_yyyyMM)"""
     try:
         data = request.get_json()
-        host = data.get('host', '').strip()
-        user = data.get('user', '').strip()
-        password = data.get('password', '').strip()
-        database = data.get('database', '').strip()
+        host, user, password, database = get_connection_params(data)
         check_date = data.get('checkDate', '').strip()  # Format: YYYY-MM
         monthly_table = data.get('monthlyTable', '').strip()
         
@@ -823,12 +5431,66 @@ def fix_saldo():
                 'message': 'Connection failed. Please check your credentials.'
             })
         
+        # Partitioned th_barang_saldo: swap the month's partition in, no rows are copied
+        if data.get('archiveMode', 'auto') != 'copy':
+            try:
+                capabilities = get_server_capabilities(connection, host, database)
+                partition = find_exchange_partition(connection, capabilities, check_date)
+                if partition:
+                    moved_count = exchange_saldo_partition(connection, monthly_table, partition)
+                    connection.close()
+                    
+                    result_data = {'insertedCount': moved_count, 'deletedCount': moved_count, 'mode': 'EXCHANGE PARTITION'}
+                    save_saldo_checker_log("FIX_SALDO", database, check_date, monthly_table, result_data)
+                    
+                    return jsonify({
+                        'success': True,
+                        'message': f'✓ Partition {partition["name"]} exchanged with {monthly_table} ({moved_count:,} records moved without copying).',
+                        'insertedCount': moved_count,
+                        'deletedCount': moved_count,
+                        'monthlyTable': monthly_table,
+                        'mode': 'exchange'
+                    })
+            except Exception as e:
+                connection.close()
+                return jsonify({
+                    'success': False,
+                    'message': f'Partition exchange failed: {str(e)}'
+                })
+        
+        # EXPLAIN the period move first: LEFT(tanggal, 7) scans all of th_barang_saldo
+        if not data.get('force'):
+            plan_report, refusal = run_plan_guard(connection, host, database, 'fix_saldo', check_date=check_date)
+            if refusal:
+                connection.close()
+                return jsonify({
+                    'success': False,
+                    'message': refusal,
+                    'plan': plan_report
+                })
+        
+        # Registered so the INSERT ... SELECT / DELETE can be cancelled with KILL QUERY
+        operation_id = register_operation(data.get('operation_id'), 'fix_saldo', host, user, password, database)
+        
+        # MyISAM ignores the transaction: a failed or cancelled move can leave rows copied or deleted
+        engines = get_table_engines(connection, ['th_barang_saldo', monthly_table])
+        non_transactional = [f"{name} ({engine})" for name, engine in engines.items() if (engine or '').upper() != 'INNODB']
         cursor = connection.cursor()
         
         try:
+            attach_connection(operation_id, connection)
+            verify_moves = load_maintenance_settings().get('verify_moves', True)
+            
             # Start transaction
             connection.begin()
             
+            # Month rows already in the monthly table (an earlier partial run): the hash is additive, so the
+            # table after the copy must hash to these rows + the copied rows
+            if verify_moves:
+                columns = get_table_columns(connection, 'th_barang_saldo')
+                month_where = "WHERE LEFT(tanggal, 7) = %s"
+                existing_hash = get_table_hash(connection, monthly_table, columns, month_where, (check_date,))
+            
             # Step 1: Copy data from th_barang_saldo to monthly table
             insert_query = f"""
                 INSERT INTO `{monthly_table}` 
@@ -837,6 +5499,30 @@ def fix_saldo():
             """
             cursor.execute(insert_query)
             inserted_count = cursor.rowcount
+            check_cancelled(operation_id)
+            
+            # Step 1b: compare the copy with the source rows before deleting them (same transaction)
+            verification = None
+            if verify_moves:
+                started = time.time()
+                source_hash = get_table_hash(connection, 'th_barang_saldo', columns, month_where, (check_date,))
+                copied_hash = get_table_hash(connection, monthly_table, columns, month_where, (check_date,))
+                expected_hash = {
+                    'rows': existing_hash['rows'] + source_hash['rows'],
+                    'xor': existing_hash['xor'] ^ source_hash['xor'],
+                    'sum': existing_hash['sum'] + source_hash['sum']
+                }
+                verification = {
+                    'match': copied_hash == expected_hash,
+                    'rows_source': source_hash['rows'],
+                    'rows_target': copied_hash['rows'] - existing_hash['rows'],
+                    'seconds': round(time.time() - started, 2)
+                }
+                print(f"[SALDO] Verify {monthly_table}: {verification}")
+                if not verification['match']:
+                    raise ValueError(f"Verification failed: {verification['rows_source']:,} source rows, "
+                                     f"{verification['rows_target']:,} copied, checksums differ. Nothing deleted")
+                check_cancelled(operation_id)
             
             # Step 2: Delete data from th_barang_saldo
             delete_query = f"""
@@ -845,6 +5531,7 @@ def fix_saldo():
             """
             cursor.execute(delete_query)
             deleted_count = cursor.rowcount
+            check_cancelled(operation_id)
             
             # Commit transaction
             connection.commit()
@@ -853,28 +5540,63 @@ def fix_saldo():
             connection.close()
             
             # Log the fix result
-            result_data = {'insertedCount': inserted_count, 'deletedCount': deleted_count}
+            result_data = {'insertedCount': inserted_count, 'deletedCount': deleted_count, 'verification': verification}
             save_saldo_checker_log("FIX_SALDO", database, check_date, monthly_table, result_data)
             
             return jsonify({
                 'success': True,
-                'message': f'✓ Successfully moved {inserted_count:,} records from th_barang_saldo to {monthly_table}. {deleted_count:,} records deleted from main table.',
+                'message': f'✓ Successfully moved {inserted_count:,} records from th_barang_saldo to {monthly_table}. {deleted_count:,} records deleted from main table.'
+                           + (' Copy verified by checksum.' if verification else ''),
                 'insertedCount': inserted_count,
                 'deletedCount': deleted_count,
-                'monthlyTable': monthly_table
+                'monthlyTable': monthly_table,
+                'verification': verification
             })
             
         except Exception as e:
-            # Rollback on error
+            # Rollback on error (also after KILL QUERY from /cancel)
             connection.rollback()
+            
+            if non_transactional:
+                # Nothing was rolled back on these tables: report what is actually there now
+                try:
+                    state_counts = {}
+                    for table in ('th_barang_saldo', monthly_table):
+                        cursor.execute(f"SELECT COUNT(*) as count FROM `{table}` WHERE LEFT(tanggal, 7) = %s", (check_date,))
+                        state_counts[table] = cursor.fetchone()['count']
+                    state = (f"{state_counts['th_barang_saldo']:,} rows of {check_date} are still in th_barang_saldo, "
+                             f"{state_counts[monthly_table]:,} are in {monthly_table}")
+                except Exception as count_error:
+                    state = f"the current row counts could not be read ({str(count_error)})"
+                cursor.close()
+                connection.close()
+                
+                stopped = 'Cancelled by operator' if is_cancelled(operation_id) else f'Move failed: {str(e)}'
+                return jsonify({
+                    'success': False,
+                    'cancelled': is_cancelled(operation_id),
+                    'message': f"{stopped}. Not rolled back: {', '.join(non_transactional)} is not transactional, "
+                               f"{state}. Run CHECK again before retrying."
+                })
+            
             cursor.close()
             connection.close()
             
+            if is_cancelled(operation_id):
+                return jsonify({
+                    'success': False,
+                    'cancelled': True,
+                    'message': 'Cancelled by operator. Transaction rolled back, no data was moved.'
+                })
+            
             return jsonify({
                 'success': False,
                 'message': f'Transaction failed and rolled back: {str(e)}'
             })
         
+        finally:
+            unregister_operation(operation_id)
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -887,10 +5609,7 @@ def create_table_saldo():
     """Create monthly table th_barang_saldo_yyyyMM with structure from main table"""
     try:
         data = request.get_json()
-        host = data.get('host', '').strip()
-        user = data.get('user', '').strip()
-        password = data.get('password', '').strip()
-        database = data.get('database', '').strip()
+        host, user, password, database = get_connection_params(data)
         check_date = data.get('checkDate', '').strip()  # Format: YYYY-MM
         monthly_table = data.get('monthlyTable', '').strip()
         
@@ -922,81 +5641,401 @@ def create_table_saldo():
         except Exception as e:
             return jsonify({
                 'success': False,
-                'message': f'Date validation error: {str(e)}'
+                'message': f'Date validation error: {str(e)}'
+            })
+        
+        connection = connect_to_mysql(host, user, password, database)
+        
+        if not connection:
+            return jsonify({
+                'success': False,
+                'message': 'Connection failed. Please check your credentials.'
+            })
+        
+        cursor = connection.cursor()
+        
+        try:
+            # Check if table already exists
+            cursor.execute(f"SHOW TABLES LIKE '{monthly_table}'")
+            if cursor.fetchone() is not None:
+                cursor.close()
+                connection.close()
+                return jsonify({
+                    'success': False,
+                    'message': f'Table {monthly_table} already exists!'
+                })
+            
+            # Create table with same structure as th_barang_saldo
+            create_query = f"""
+                CREATE TABLE `{monthly_table}` LIKE th_barang_saldo
+            """
+            cursor.execute(create_query)
+            connection.commit()
+            
+            # The archive must be a plain table to receive a partition through EXCHANGE PARTITION
+            if remove_partitioning(connection, monthly_table):
+                print(f"[SALDO] {monthly_table} created without the partitioning of th_barang_saldo")
+            
+            cursor.close()
+            connection.close()
+            
+            # Log the create table result
+            result_data = {}
+            save_saldo_checker_log("CREATE_TABLE", database, check_date, monthly_table, result_data)
+            
+            return jsonify({
+                'success': True,
+                'message': f'✓ Successfully created table {monthly_table}!',
+                'monthlyTable': monthly_table
+            })
+            
+        except Exception as e:
+            # Rollback on error
+            connection.rollback()
+            cursor.close()
+            connection.close()
+            
+            return jsonify({
+                'success': False,
+                'message': f'Failed to create table: {str(e)}'
+            })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/saldo-partitioning', methods=['POST'])
+def saldo_partitioning():
+    """Inspect, or with "apply": true run, the conversion of th_barang_saldo to monthly RANGE partitions"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Host, User, and Database fields!'
+            })
+        
+        connection = connect_to_mysql(host, user, password, database)
+        if not connection:
+            return jsonify({
+                'success': False,
+                'message': 'Connection failed. Please check your credentials.'
+            })
+        
+        operation_id = None
+        try:
+            capabilities = get_server_capabilities(connection, host, database)
+            inspection = inspect_saldo_partitioning(connection, capabilities)
+            
+            if inspection['partitioned']:
+                added = ensure_future_saldo_partitions(connection, inspection['partitions']) if data.get('apply') else []
+                return jsonify({
+                    'success': True,
+                    'message': f"✓ {SALDO_TABLE} is already partitioned ({len(inspection['partitions'])} partitions)"
+                               + (f", added {len(added)} future month(s)" if added else ''),
+                    'partitioning': inspection
+                })
+            
+            if not data.get('apply') or inspection['blockers']:
+                return jsonify({
+                    'success': not inspection['blockers'],
+                    'message': 'Cannot partition: ' + '; '.join(inspection['blockers']) if inspection['blockers']
+                               else 'Ready to partition. Send "apply": true inside the maintenance window.',
+                    'partitioning': inspection
+                })
+            
+            # The copy blocks writes for its whole duration: only inside the window and under normal load
+            settings = load_maintenance_settings()
+            if not data.get('force'):
+                if not in_maintenance_window(settings):
+                    raise ValueError('Outside the maintenance window (window_start..window_end)')
+                violations = get_load_violations(get_server_load(connection, capabilities.get('has_innodb_trx')), settings)
+                if violations:
+                    raise ValueError('Server busy: ' + ', '.join(violations))
+            
+            operation_id = register_operation(data.get('operation_id'), 'partition', host, user, password, database)
+            connection_id = attach_connection(operation_id, connection)
+            print(f"[SALDO] Partitioning {SALDO_TABLE}:\n{inspection['ddl']}")
+            started = time.time()
+            
+            cursor = connection.cursor()
+            try:
+                with StatementWatchdog(host, user, password, database, connection_id, settings.get('table_timeout_seconds')) as watchdog:
+                    cursor.execute(inspection['ddl'])
+            except Exception as e:
+                if is_cancelled(operation_id) or watchdog.fired:
+                    raise ValueError(f"Partitioning stopped ({'cancelled' if is_cancelled(operation_id) else 'timeout'}), "
+                                     f"{SALDO_TABLE} is unchanged") from e
+                raise
+            finally:
+                cursor.close()
+            
+            seconds = round(time.time() - started, 1)
+            save_saldo_checker_log("PARTITION", database, '-', SALDO_TABLE, {'months': inspection['months'], 'seconds': seconds})
+            return jsonify({
+                'success': True,
+                'message': f"✓ {SALDO_TABLE} partitioned by month ({inspection['months'][0]} .. {inspection['months'][1]}) in {seconds}s",
+                'partitioning': inspect_saldo_partitioning(connection, capabilities)
+            })
+        finally:
+            unregister_operation(operation_id)
+            connection.close()
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/compress-archives', methods=['POST'])
+def compress_archives():
+    """List closed th_barang_saldo_yyyyMM archives and, with "apply": true, convert them to a compact format"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Host, User, and Database fields!'
             })
         
         connection = connect_to_mysql(host, user, password, database)
-        
         if not connection:
             return jsonify({
                 'success': False,
                 'message': 'Connection failed. Please check your credentials.'
             })
         
-        cursor = connection.cursor()
-        
+        settings = load_maintenance_settings()
+        quiet_days = int(data.get('quiet_days', settings['archive_quiet_days']))
+        operation_id = None
         try:
-            # Check if table already exists
-            cursor.execute(f"SHOW TABLES LIKE '{monthly_table}'")
-            if cursor.fetchone() is not None:
-                cursor.close()
-                connection.close()
+            capabilities = get_server_capabilities(connection, host, database)
+            candidates = find_closed_archives(connection, capabilities, quiet_days)
+            if data.get('tables'):
+                candidates = [c for c in candidates if c['table'] in data['tables']]
+            todo = [c for c in candidates if c['format']]
+            
+            if not data.get('apply') or not todo:
                 return jsonify({
-                    'success': False,
-                    'message': f'Table {monthly_table} already exists!'
+                    'success': True,
+                    'message': f"{len(todo)} of {len(candidates)} archive table(s) can be compressed",
+                    'archives': candidates
                 })
             
-            # Create table with same structure as th_barang_saldo
-            create_query = f"""
-                CREATE TABLE `{monthly_table}` LIKE th_barang_saldo
-            """
-            cursor.execute(create_query)
-            connection.commit()
-            
-            cursor.close()
-            connection.close()
+            if not data.get('force') and not in_maintenance_window(settings):
+                raise ValueError('Outside the maintenance window (window_start..window_end)')
             
-            # Log the create table result
-            result_data = {}
-            save_saldo_checker_log("CREATE_TABLE", database, check_date, monthly_table, result_data)
+            operation_id = register_operation(data.get('operation_id'), 'compress', host, user, password, database)
+            connection_id = attach_connection(operation_id, connection)
+            results = []
+            for candidate in todo:
+                if is_cancelled(operation_id):
+                    break
+                
+                # Same load guard as table maintenance, checked before every table
+                violations = get_load_violations(get_server_load(connection, capabilities.get('has_innodb_trx')), settings)
+                if violations and not data.get('force'):
+                    results.append({'table': candidate['table'], 'status': 'DEFERRED', 'error': 'Server busy: ' + ', '.join(violations)})
+                    continue
+                
+                print(f"[ARCHIVE] Compressing {candidate['table']} ({candidate['format']})...")
+                try:
+                    with StatementWatchdog(host, user, password, database, connection_id, settings.get('table_timeout_seconds')) as watchdog:
+                        result = compress_archive_table(connection, candidate['table'], candidate, capabilities)
+                    save_saldo_checker_log("COMPRESS", database, candidate['month'], candidate['table'], result)
+                    print(f"[ARCHIVE] {candidate['table']}: {result['before_mb']} MB -> {result['after_mb']} MB")
+                except Exception as e:
+                    status = 'CANCELLED' if is_cancelled(operation_id) else (watchdog.fired or 'ERROR')
+                    result = {'table': candidate['table'], 'format': candidate['format'], 'status': status, 'error': str(e)}
+                    print(f"[ARCHIVE] {candidate['table']} not converted: {str(e)}")
+                results.append(result)
             
+            converted = [r for r in results if r['status'] == 'CONVERTED']
+            saved_mb = round(sum(r['saved_mb'] for r in converted), 2)
             return jsonify({
                 'success': True,
-                'message': f'✓ Successfully created table {monthly_table}!',
-                'monthlyTable': monthly_table
+                'cancelled': is_cancelled(operation_id),
+                'message': f"✓ Compressed {len(converted)} of {len(todo)} archive table(s), {saved_mb:,} MB saved",
+                'results': results,
+                'archives': candidates
             })
-            
-        except Exception as e:
-            # Rollback on error
-            connection.rollback()
-            cursor.close()
+        finally:
+            unregister_operation(operation_id)
             connection.close()
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/offload-archive-stream', methods=['POST'])
+def offload_archive_stream():
+    """Move a closed th_barang_saldo_yyyyMM table to the archive server, streaming progress"""
+    def generate():
+        operation_id = None
+        source = target = None
+        verify_pools = ()
+        try:
+            data = json.loads(request.get_data())
+            host, user, password, database = get_connection_params(data)
+            target_host, target_user, target_password, target_database = get_connection_params(data.get('target') or {})
+            table_name = (data.get('table') or '').strip()
+            
+            if not all([host, user, database, target_host, target_user, target_database, table_name]):
+                yield f"data: {json.dumps({'type': 'error', 'message': 'Source, target (archive server) and table are required!'})}\n\n"
+                return
+            if (host, database) == (target_host, target_database):
+                yield f"data: {json.dumps({'type': 'error', 'message': 'Source and archive server must be different!'})}\n\n"
+                return
+            
+            # Only closed archives: the month is over and the table is no longer written
+            quiet_days = load_maintenance_settings()['archive_quiet_days']
+            if not ARCHIVE_TABLE_PATTERN.fullmatch(table_name):
+                yield f"data: {json.dumps({'type': 'error', 'message': f'{table_name} is not a th_barang_saldo_yyyyMM archive table'})}\n\n"
+                return
+            if not data.get('force') and not get_closed_archive_month(table_name, quiet_days):
+                yield f"data: {json.dumps({'type': 'error', 'message': f'{table_name} is not closed yet (month ended less than {quiet_days} days ago)'})}\n\n"
+                return
+            
+            method = data.get('method', 'auto')
+            source = connect_to_mysql(host, user, password, database)
+            if not source:
+                yield f"data: {json.dumps({'type': 'error', 'message': 'Connection failed. Please check your credentials.'})}\n\n"
+                return
+            target = connect_to_mysql(target_host, target_user, target_password, target_database,
+                                      local_infile=method in ('auto', 'load_data'))
+            if not target:
+                yield f"data: {json.dumps({'type': 'error', 'message': 'Connection to the archive server failed. Please check your credentials.'})}\n\n"
+                return
+            source_capabilities = get_server_capabilities(source, host, database)
+            target_capabilities = get_server_capabilities(target, target_host, target_database)
             
+            operation_id = register_operation(data.get('operation_id'), 'offload', host, user, password, database)
+            attach_connection(operation_id, source)
+            verify_pools = (MySQLConnectionPool(host, user, password, database, size=VERIFY_WORKERS),
+                            MySQLConnectionPool(target_host, target_user, target_password, target_database, size=VERIFY_WORKERS))
+            
+            for event in offload_archive_events(source, target, table_name, source_capabilities, target_capabilities,
+                                                method=method, drop_source=bool(data.get('drop_source')),
+                                                operation_id=operation_id, verify_pools=verify_pools):
+                if event['type'] == 'complete':
+                    save_saldo_checker_log("OFFLOAD", database, get_closed_archive_month(table_name, 0) or '-', table_name,
+                                           event | {'target': f"{target_database}@{target_host}"})
+                yield f"data: {json.dumps(event)}\n\n"
+            
+        except Exception as e:
+            if is_cancelled(operation_id):
+                message = ('Offload cancelled by operator. The source table is unchanged, '
+                           'the partial copy on the archive server was removed.')
+            else:
+                message = f'Offload error: {str(e)}'
+            print(f"[OFFLOAD] {message}")
+            yield f"data: {json.dumps({'type': 'error', 'cancelled': is_cancelled(operation_id), 'message': message})}\n\n"
+        
+        finally:
+            unregister_operation(operation_id)
+            for pool in verify_pools:
+                pool.close_all()
+            for connection in (source, target):
+                if connection:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+    
+    return event_stream_response(generate())
+
+
+@app.route('/verify-data', methods=['POST'])
+def verify_data():
+    """Chunk-hash comparison on demand: the audit keys of one database, or an archive table vs its offloaded copy"""
+    pools = []
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        check = data.get('check', 'audit_keys')
+        
+        if not all([host, user, database]):
             return jsonify({
                 'success': False,
-                'message': f'Failed to create table: {str(e)}'
+                'message': 'Please fill in all required fields!'
+            })
+        
+        if check == 'audit_keys':
+            verification = verify_audit_keys(host, user, password, database)
+            label = 'tm_barang vs tt_barang_saldo keys'
+        elif check == 'archive':
+            table_name = (data.get('table') or '').strip()
+            target_host, target_user, target_password, target_database = get_connection_params(data.get('target') or {})
+            if not ARCHIVE_TABLE_PATTERN.fullmatch(table_name) or not all([target_host, target_user, target_database]):
+                return jsonify({
+                    'success': False,
+                    'message': 'An archive table (th_barang_saldo_yyyyMM) and the archive server are required!'
+                })
+            pools = [MySQLConnectionPool(host, user, password, database, size=VERIFY_WORKERS),
+                     MySQLConnectionPool(target_host, target_user, target_password, target_database, size=VERIFY_WORKERS)]
+            connection = pools[0].get()
+            try:
+                columns = get_table_columns(connection, table_name)
+                chunk_column = choose_chunk_column(connection, table_name, columns)
+            finally:
+                pools[0].put(connection)
+            side = {'table': table_name, 'where': '', 'params': ()}
+            verification = verify_table_chunks(pools[0], pools[1], side, side, columns, chunk_column=chunk_column)
+            label = f"{table_name} vs {target_database}@{target_host}"
+        else:
+            return jsonify({
+                'success': False,
+                'message': "check must be 'audit_keys' or 'archive'"
             })
         
+        if verification['match']:
+            message = f"✓ {label}: {verification['rows_source']:,} rows match ({verification['chunks']} chunks, {verification['seconds']}s)"
+        else:
+            message = (f"✗ {label}: {verification['mismatched_chunks']} of {verification['chunks']} chunks differ, "
+                       f"{verification['missing_in_target']:,} missing, {verification['extra_in_target']:,} extra")
+        return jsonify({
+            'success': True,
+            'message': message,
+            'verification': verification
+        })
+        
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
         })
+    
+    finally:
+        for pool in pools:
+            pool.close_all()
 
 
 @app.route('/smart-audit-stream', methods=['POST'])
 def smart_audit_stream():
     """Smart Audit Toko - Cross check with real-time progress streaming"""
     def generate():
+        operation_id = None
         try:
             # Get request data from the request context
-            from flask import Request
             req_data = request.get_data()
             data = json.loads(req_data)
-            host = data.get('host', '').strip()
-            user = data.get('user', '').strip()
-            password = data.get('password', '').strip()
-            database = data.get('database', '').strip()
+            host, user, password, database = get_connection_params(data)
+            use_snapshot = data.get('consistentSnapshot', True)
+            use_cache = data.get('useSnapshotCache', True)
+            shard_count = max(1, min(int(data.get('shards', 1) or 1), AUDIT_MAX_SHARDS))
+            compact = data.get('compact', False)
+            operation_id = register_operation(data.get('operation_id'), 'audit', host, user, password, database)
             
             if not all([host, user, database]):
                 yield f"data: {json.dumps({'error': True, 'message': 'Please fill in all required fields!'})}\n\n"
@@ -1007,203 +6046,49 @@ def smart_audit_stream():
             if not connection:
                 yield f"data: {json.dumps({'error': True, 'message': 'Connection failed. Please check your credentials.'})}\n\n"
                 return
-        
-            cursor = connection.cursor()
-            
-            # ============================================================
-            # PHASE 1: Check tm_barang -> tt_barang_saldo
-            # ============================================================
-            print("[AUDIT PHASE 1] Getting tm_barang data...")
-            yield f"data: {json.dumps({'type': 'progress', 'step': 'query', 'message': 'Phase 1: Querying tm_barang...'})}\n\n"
-            
-            cursor.execute("""
-                SELECT kode_barang, kode_lokasi_toko, stock_on_hand*1 as stock
-                FROM tm_barang 
-                WHERE kode_lokasi_gudang = 'TOKO' 
-                AND stock_on_hand*1 > 0
-                ORDER BY kode_barang
-            """)
-            tm_barang_list = cursor.fetchall()
-            total_tm_barang = len(tm_barang_list)
-            
-            print(f"[AUDIT PHASE 1] Found {total_tm_barang} items in tm_barang")
-            yield f"data: {json.dumps({'type': 'progress', 'step': 'start_phase1', 'total': total_tm_barang, 'message': f'Phase 1: Found {total_tm_barang} items in tm_barang'})}\n\n"
-        
-            issues_phase1 = []
-            not_found_tm_to_tt = 0
-            duplicate_tm_to_tt = 0
-            match_tm_to_tt = 0
-            
-            # Check each tm_barang in tt_barang_saldo
-            for idx, tm_item in enumerate(tm_barang_list):
-                kode_barang = tm_item['kode_barang']
-                kode_lokasi = tm_item['kode_lokasi_toko']
-                stock_tm = tm_item['stock']
-                
-                # Send progress update
-                current = idx + 1
-                percent = int((current / total_tm_barang) * 50)  # 0-50% for phase 1
-                yield f"data: {json.dumps({'type': 'progress', 'step': 'processing_phase1', 'current': current, 'total': total_tm_barang, 'percent': percent, 'kode_barang': kode_barang, 'message': f'Phase 1: Processing {current}/{total_tm_barang}'})}\n\n"
-                
-                # Check in tt_barang_saldo
-                cursor.execute("""
-                SELECT kode_barang, kode_lokasi_toko, stock_akhir*1 as stock
-                FROM tt_barang_saldo
-                WHERE kode_barang = %s 
-                AND kode_lokasi_toko = %s
-                AND stock_akhir*1 > 0
-                """, (kode_barang, kode_lokasi))
-                
-                tt_items = cursor.fetchall()
-                tt_count = len(tt_items)
-                
-                if tt_count == 0:
-                    not_found_tm_to_tt += 1
-                    issues_phase1.append({
-                        'kode_barang': kode_barang,
-                        'kode_lokasi': kode_lokasi,
-                        'count_tt': 0,
-                        'issue': 'TM_NOT_IN_TT',
-                        'issue_text': '[TM→TT] Not found in tt_barang_saldo'
-                    })
-                elif tt_count == 1:
-                    match_tm_to_tt += 1
-                elif tt_count > 1:
-                    duplicate_tm_to_tt += 1
-                    kode_lokasi_toko = tt_items[0]['kode_lokasi_toko'] if tt_items else kode_lokasi
-                    issues_phase1.append({
-                        'kode_barang': kode_barang,
-                        'kode_lokasi': kode_lokasi_toko,
-                        'count_tt': tt_count,
-                        'issue': 'TM_DUPLICATE_IN_TT',
-                        'issue_text': f'[TM→TT] Duplicate in tt! Found {tt_count} records'
-                    })
-            
-            print(f"[AUDIT PHASE 1] Completed. Match: {match_tm_to_tt}, Not Found: {not_found_tm_to_tt}, Duplicate: {duplicate_tm_to_tt}")
-            
-            # ============================================================
-            # PHASE 2: Check tt_barang_saldo -> tm_barang
-            # ============================================================
-            print("[AUDIT PHASE 2] Getting tt_barang_saldo data...")
-            yield f"data: {json.dumps({'type': 'progress', 'step': 'query_phase2', 'message': 'Phase 2: Querying tt_barang_saldo...'})}\n\n"
-            
-            cursor.execute("""
-                SELECT kode_barang, kode_lokasi_toko, stock_akhir*1 as stock
-                FROM tt_barang_saldo
-                WHERE kode_lokasi_gudang = 'TOKO' 
-                AND stock_akhir*1 > 0
-                ORDER BY kode_barang
-            """)
-            tt_barang_list = cursor.fetchall()
-            total_tt_barang = len(tt_barang_list)
-            
-            print(f"[AUDIT PHASE 2] Found {total_tt_barang} items in tt_barang_saldo")
-            yield f"data: {json.dumps({'type': 'progress', 'step': 'start_phase2', 'total': total_tt_barang, 'message': f'Phase 2: Found {total_tt_barang} items in tt_barang_saldo'})}\n\n"
-        
-            issues_phase2 = []
-            not_found_tt_to_tm = 0
-            duplicate_tt_to_tm = 0
-            match_tt_to_tm = 0
-            
-            # Check each tt_barang_saldo in tm_barang
-            for idx, tt_item in enumerate(tt_barang_list):
-                kode_barang = tt_item['kode_barang']
-                kode_lokasi = tt_item['kode_lokasi_toko']
-                stock_tt = tt_item['stock']
-                
-                # Send progress update
-                current = idx + 1
-                percent = 50 + int((current / total_tt_barang) * 50)  # 50-100% for phase 2
-                yield f"data: {json.dumps({'type': 'progress', 'step': 'processing_phase2', 'current': current, 'total': total_tt_barang, 'percent': percent, 'kode_barang': kode_barang, 'message': f'Phase 2: Processing {current}/{total_tt_barang}'})}\n\n"
-                
-                # Check in tm_barang
-                cursor.execute("""
-                SELECT kode_barang, kode_lokasi_toko, stock_on_hand*1 as stock
-                FROM tm_barang
-                WHERE kode_barang = %s 
-                AND kode_lokasi_toko = %s
-                AND kode_lokasi_gudang = 'TOKO'
-                AND stock_on_hand*1 > 0
-                """, (kode_barang, kode_lokasi))
-                
-                tm_items = cursor.fetchall()
-                tm_count = len(tm_items)
-                
-                if tm_count == 0:
-                    not_found_tt_to_tm += 1
-                    issues_phase2.append({
-                        'kode_barang': kode_barang,
-                        'kode_lokasi': kode_lokasi,
-                        'count_tm': 0,
-                        'issue': 'TT_NOT_IN_TM',
-                        'issue_text': '[TT→TM] Not found in tm_barang'
-                    })
-                elif tm_count == 1:
-                    match_tt_to_tm += 1
-                elif tm_count > 1:
-                    duplicate_tt_to_tm += 1
-                    kode_lokasi_toko = tm_items[0]['kode_lokasi_toko'] if tm_items else kode_lokasi
-                    issues_phase2.append({
-                        'kode_barang': kode_barang,
-                        'kode_lokasi': kode_lokasi_toko,
-                        'count_tm': tm_count,
-                        'issue': 'TT_DUPLICATE_IN_TM',
-                        'issue_text': f'[TT→TM] Duplicate in tm! Found {tm_count} records'
-                    })
-            
-            print(f"[AUDIT PHASE 2] Completed. Match: {match_tt_to_tm}, Not Found: {not_found_tt_to_tm}, Duplicate: {duplicate_tt_to_tm}")
-            
-            # Combine all issues
-            all_issues = issues_phase1 + issues_phase2
-            
-            cursor.close()
-            connection.close()
-            
-            # Prepare summary data for logging
-            summary_data = {
-                'phase1': {
-                    'total_tm_barang': total_tm_barang,
-                    'match_tm_to_tt': match_tm_to_tt,
-                    'not_found': not_found_tm_to_tt,
-                    'duplicate': duplicate_tm_to_tt,
-                    'issues': len(issues_phase1)
-                },
-                'phase2': {
-                    'total_tt_barang': total_tt_barang,
-                    'match_tt_to_tm': match_tt_to_tm,
-                    'not_found': not_found_tt_to_tm,
-                    'duplicate': duplicate_tt_to_tm,
-                    'issues': len(issues_phase2)
-                }
-            }
             
-            # Save audit log
-            save_audit_log(database, summary_data, len(all_issues), issues_phase1, issues_phase2)
+            if not data.get('force'):
+                plan_report, refusal = run_plan_guard(connection, host, database, 'audit')
+                if refusal:
+                    connection.close()
+                    yield f"data: {json.dumps({'type': 'error', 'message': refusal, 'plan': plan_report})}\n\n"
+                    return
+                for warning in (plan_report or {}).get('warnings', []):
+                    yield f"data: {json.dumps({'type': 'warning', 'message': f'Plan guard: {warning}'})}\n\n"
             
-            # Send final result with both phases
-            yield f"data: {json.dumps({'type': 'complete', 'success': True, 'summary': summary_data | {'total_issues': len(all_issues)}, 'issues': all_issues})}\n\n"
+            for event in run_smart_audit_events(connection, host, user, password, database,
+                                                use_snapshot=use_snapshot, use_cache=use_cache, shard_count=shard_count,
+                                                operation_id=operation_id):
+                if compact and event.get('type') == 'complete':
+                    event['issues_compact'] = encode_audit_issues(event.pop('issues'))
+                yield f"data: {json.dumps(event)}\n\n"
             
         except Exception as e:
-            print(f"[AUDIT ERROR] {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'Audit error: {str(e)}'})}\n\n"
+            if is_cancelled(operation_id):
+                print(f"[AUDIT] Cancelled by operator")
+                yield f"data: {json.dumps({'type': 'error', 'cancelled': True, 'message': 'Audit cancelled by operator.'})}\n\n"
+            else:
+                print(f"[AUDIT ERROR] {str(e)}")
+                yield f"data: {json.dumps({'type': 'error', 'message': f'Audit error: {str(e)}'})}\n\n"
+        
+        finally:
+            unregister_operation(operation_id)
     
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return event_stream_response(generate())
 
 
 @app.route('/fix-smart-audit-stream', methods=['POST'])
 def fix_smart_audit_stream():
     """Fix Smart Audit Issues - Delete duplicates and insert missing data with real-time progress"""
     def generate():
+        operation_id = None
         try:
             # Get request data
             from flask import Request
             req_data = request.get_data()
             data = json.loads(req_data)
-            host = data.get('host', '').strip()
-            user = data.get('user', '').strip()
-            password = data.get('password', '').strip()
-            database = data.get('database', '').strip()
-            issues = data.get('issues', [])
+            host, user, password, database = get_connection_params(data)
+            issues = get_request_issues(data)
             
             if not all([host, user, database]):
                 yield f"data: {json.dumps({'error': True, 'message': 'Please fill in all required fields!'})}\n\n"
@@ -1219,6 +6104,23 @@ def fix_smart_audit_stream():
                 yield f"data: {json.dumps({'error': True, 'message': 'Connection failed. Please check your credentials.'})}\n\n"
                 return
             
+            # Every fixed issue runs its lookup once: without an index that is one full scan per issue
+            if not data.get('force'):
+                executions = {
+                    'fix_duplicate_lookup': sum(1 for issue in issues if issue.get('issue') == 'TM_DUPLICATE_IN_TT'),
+                    'fix_missing_lookup': sum(1 for issue in issues if issue.get('issue') == 'TM_NOT_IN_TT')
+                }
+                plan_report, refusal = run_plan_guard(connection, host, database, 'fix', executions=executions)
+                if refusal:
+                    connection.close()
+                    yield f"data: {json.dumps({'type': 'error', 'message': refusal, 'plan': plan_report})}\n\n"
+                    return
+                for warning in (plan_report or {}).get('warnings', []):
+                    yield f"data: {json.dumps({'type': 'warning', 'message': f'Plan guard: {warning}'})}\n\n"
+            
+            # Registered so /cancel can stop the run; every fix is its own committed transaction
+            operation_id = register_operation(data.get('operation_id'), 'fix', host, user, password, database)
+            attach_connection(operation_id, connection)
             cursor = connection.cursor()
             
             # Filter issues that need fixing
@@ -1243,6 +6145,8 @@ def fix_smart_audit_stream():
             yield f"data: {json.dumps({'type': 'progress', 'step': 'fixing_duplicates', 'message': 'Step 1: Fixing duplicates...'})}\n\n"
             
             for idx, issue in enumerate(duplicate_issues):
+                if is_cancelled(operation_id):
+                    break
                 kode_barang = issue.get('kode_barang')
                 kode_lokasi = issue.get('kode_lokasi')
                 
@@ -1288,6 +6192,7 @@ def fix_smart_audit_stream():
                         print(f"[FIXING] Deleted {deleted_count} duplicate(s) for {kode_barang} @ {kode_lokasi}")
                         
                 except Exception as e:
+                    connection.rollback()
                     print(f"[FIXING ERROR] Failed to fix duplicate {kode_barang}: {str(e)}")
                     yield f"data: {json.dumps({'type': 'warning', 'message': f'Failed to fix duplicate {kode_barang}: {str(e)}'})}\n\n"
             
@@ -1298,6 +6203,8 @@ def fix_smart_audit_stream():
             yield f"data: {json.dumps({'type': 'progress', 'step': 'inserting_missing', 'message': 'Step 2: Inserting missing records...'})}\n\n"
             
             for idx, issue in enumerate(missing_issues):
+                if is_cancelled(operation_id):
+                    break
                 kode_barang = issue.get('kode_barang')
                 kode_lokasi = issue.get('kode_lokasi')
                 
@@ -1382,6 +6289,7 @@ def fix_smart_audit_stream():
                         yield f"data: {json.dumps({'type': 'warning', 'message': f'Data not found in tm_barang: {kode_barang} @ {kode_lokasi}'})}\n\n"
                         
                 except Exception as e:
+                    connection.rollback()
                     print(f"[FIXING ERROR] Failed to insert {kode_barang}: {str(e)}")
                     import traceback
                     traceback.print_exc()
@@ -1392,6 +6300,7 @@ def fix_smart_audit_stream():
             
             # Prepare fixing result
             fixing_result = {
+                'cancelled': is_cancelled(operation_id),
                 'duplicates_deleted': duplicates_deleted,
                 'missing_inserted': missing_inserted,
                 'total_fixed': duplicates_deleted + missing_inserted,
@@ -1399,38 +6308,351 @@ def fix_smart_audit_stream():
                 'missing_detail': missing_detail
             }
             
+            # Re-check the audit keys by chunk hashes instead of a full re-audit
+            if load_maintenance_settings().get('verify_after_fix', True) and not is_cancelled(operation_id):
+                yield f"data: {json.dumps({'type': 'progress', 'step': 'verifying', 'message': 'Step 3: Verifying tm_barang vs tt_barang_saldo keys...'})}\n\n"
+                try:
+                    verification = verify_audit_keys(host, user, password, database)
+                    fixing_result['verification'] = verification
+                    print(f"[FIXING] Verification: match={verification['match']}, {verification['mismatched_chunks']} of "
+                          f"{verification['chunks']} chunks differ ({verification['seconds']}s)")
+                    if not verification['match']:
+                        message = (f"Verification: {verification['missing_in_target']:,} key(s) still missing, "
+                                   f"{verification['extra_in_target']:,} extra in tt_barang_saldo")
+                        yield f"data: {json.dumps({'type': 'warning', 'message': message})}\n\n"
+                except Exception as e:
+                    yield f"data: {json.dumps({'type': 'warning', 'message': f'Verification failed: {str(e)}'})}\n\n"
+            
             # Save fixing log
             save_smart_audit_fixing_log(database, fixing_result)
             
+            job_id = new_job_id('fix')
+            save_job_result(job_id, 'fix', database,
+                            {key: fixing_result[key] for key in ('duplicates_deleted', 'missing_inserted', 'total_fixed')},
+                            {'duplicates': duplicates_detail, 'missing': missing_detail})
+            
             # Send final result
-            yield f"data: {json.dumps({'type': 'complete', 'success': True, 'result': fixing_result})}\n\n"
+            yield f"data: {json.dumps({'type': 'complete', 'success': True, 'job_id': job_id, 'result': fixing_result})}\n\n"
             
         except Exception as e:
             print(f"[FIXING ERROR] {str(e)}")
             yield f"data: {json.dumps({'type': 'error', 'message': f'Fixing error: {str(e)}'})}\n\n"
+        
+        finally:
+            unregister_operation(operation_id)
+    
+    return event_stream_response(generate())
+
+
+@app.route('/connection-profiles', methods=['GET'])
+def list_connection_profiles():
+    """List saved connection profiles (passwords are not returned)"""
+    profiles = load_connection_profiles()
+    return jsonify({
+        'success': True,
+        'profiles': [{'name': name, 'host': p.get('host'), 'user': p.get('user'), 'database': p.get('database')}
+                     for name, p in sorted(profiles.items())]
+    })
+
+
+@app.route('/connection-profiles', methods=['POST'])
+def save_connection_profile():
+    """Save (create or replace) a named connection profile"""
+    try:
+        data = request.get_json() or {}
+        name = data.get('name', '').strip()
+        host, user, password, database = get_connection_params({key: data.get(key) for key in ('host', 'user', 'password', 'database')})
+        
+        if not all([name, host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Name, Host, User, and Database fields!'
+            })
+        
+        with settings_lock:
+            profiles = load_connection_profiles()
+            profiles[name] = {'host': host, 'user': user, 'password': password, 'database': database}
+            save_json_file(PROFILES_FILE, profiles)
+        
+        return jsonify({
+            'success': True,
+            'message': f'✓ Profile {name} saved'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/connection-profiles/<name>', methods=['DELETE'])
+def delete_connection_profile(name):
+    """Delete a named connection profile"""
+    with settings_lock:
+        profiles = load_connection_profiles()
+        if name not in profiles:
+            return jsonify({
+                'success': False,
+                'message': f'Profile {name} not found'
+            })
+        del profiles[name]
+        save_json_file(PROFILES_FILE, profiles)
+    
+    return jsonify({
+        'success': True,
+        'message': f'✓ Profile {name} deleted'
+    })
+
+
+@app.route('/server-capabilities', methods=['POST'])
+def server_capabilities():
+    """Get (or refresh) the cached capability record of a server"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        
+        if not all([host, user, database]):
+            return jsonify({
+                'success': False,
+                'message': 'Please fill in Host, User, and Database fields!'
+            })
+        
+        connection = connect_to_mysql(host, user, password, database)
+        capabilities = get_server_capabilities(connection, host, database, refresh=data.get('refresh', False))
+        connection.close()
+        
+        return jsonify({
+            'success': True,
+            'capabilities': capabilities
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Get the stored summary of a finished job"""
+    try:
+        meta = load_job_meta(job_id)
+        if not meta:
+            return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+        return jsonify({'success': True, 'job': meta})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/export/<job_id>/<section>.<fmt>')
+def export_job(job_id, section, fmt):
+    """Stream a stored job section as CSV or XLSX (reads the stored result, never re-runs the job)"""
+    try:
+        meta = load_job_meta(job_id)
+        if not meta:
+            return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+        
+        kind = meta['kind']
+        if (kind, section) not in EXPORT_COLUMNS or section not in meta['sections']:
+            return jsonify({'success': False, 'message': f'Nothing to export for {section}'}), 404
+        
+        filename = f"{job_id}_{section}.{fmt}"
+        if fmt == 'csv':
+            generator = generate_csv_export(job_id, kind, section)
+            mimetype = 'text/csv'
+        elif fmt == 'xlsx':
+            generator = generate_xlsx_export(job_id, kind, section)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            return jsonify({'success': False, 'message': 'Format must be csv or xlsx'}), 400
+        
+        return Response(generator, mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/audit-history/runs', methods=['POST'])
+def audit_history_runs():
+    """Stored Smart Audit runs of one store, newest first"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        if not all([host, database]):
+            return jsonify({'success': False, 'message': 'Please fill in host and database!'}), 400
+        
+        runs = list_audit_runs(host, database, limit=int(data.get('limit', 100)), since=data.get('since'))
+        return jsonify({'success': True, 'runs': runs})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/audit-history/diff', methods=['POST'])
+def audit_history_diff():
+    """New / resolved / persisting findings between two stored runs (defaults: the last two runs of a store)"""
+    try:
+        data = request.get_json() or {}
+        to_run_id = data.get('to_run_id')
+        from_run_id = data.get('from_run_id')
+        
+        if not to_run_id or not from_run_id:
+            host, user, password, database = get_connection_params(data)
+            if not all([host, database]):
+                return jsonify({'success': False, 'message': 'Give from_run_id/to_run_id, or host and database'}), 400
+            db = open_audit_history()
+            try:
+                to_run_id = to_run_id or get_previous_audit_run(db, host, database)
+                from_run_id = from_run_id or (to_run_id and get_previous_audit_run(db, host, database, before_run_id=to_run_id))
+            finally:
+                db.close()
+            if not to_run_id or not from_run_id:
+                return jsonify({'success': False, 'message': 'At least two stored audit runs are needed for a diff'}), 404
+        
+        diff = diff_audit_runs(int(from_run_id), int(to_run_id), limit=int(data.get('limit', AUDIT_DIFF_DEFAULT_LIMIT)))
+        return jsonify({'success': True, 'diff': diff})
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/audit-history/trend', methods=['POST'])
+def audit_history_trend():
+    """Issue totals per run for one store, oldest first"""
+    try:
+        data = request.get_json() or {}
+        host, user, password, database = get_connection_params(data)
+        if not all([host, database]):
+            return jsonify({'success': False, 'message': 'Please fill in host and database!'}), 400
+        
+        return jsonify({'success': True, 'trend': get_audit_trend(host, database, limit=int(data.get('limit', 30)))})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/audit-history/finding', methods=['POST'])
+def audit_history_finding():
+    """Runs in which one kode_barang/kode_lokasi pair was reported"""
+    try:
+        data = request.get_json() or {}
+        if not data.get('kode_barang'):
+            return jsonify({'success': False, 'message': 'kode_barang is required'}), 400
+        
+        history = get_finding_history(data['kode_barang'], data.get('kode_lokasi', ''),
+                                      host=(data.get('host') or '').strip() or None,
+                                      database=(data.get('database') or '').strip() or None,
+                                      limit=int(data.get('limit', 100)))
+        return jsonify({'success': True, 'history': history})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+
+@app.route('/fleet-run', methods=['POST'])
+def fleet_run():
+    """Start Smart Audit / saldo check / maintenance across all stores in the fleet config"""
+    global fleet_status
     
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    try:
+        data = request.get_json() or {}
+        tasks = [task for task in data.get('tasks', ['audit']) if task in FLEET_TASKS]
+        
+        if not tasks:
+            return jsonify({
+                'success': False,
+                'message': f'Please select at least one task: {", ".join(FLEET_TASKS)}'
+            })
+        
+        if fleet_status['is_running']:
+            return jsonify({
+                'success': False,
+                'message': 'A fleet run is already in progress!'
+            })
+        
+        config = load_fleet_config(data.get('configFile', FLEET_CONFIG_FILE))
+        
+        if not config['stores']:
+            return jsonify({
+                'success': False,
+                'message': 'No stores found in fleet config!'
+            })
+        
+        fleet_status = {
+            'is_running': True,
+            'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'finished': None,
+            'total': len(config['stores']),
+            'done': 0,
+            'failed': 0,
+            'stores': {store['name']: {'state': 'queued', 'host': store['host'], 'attempt': 0, 'duration': None, 'error': None}
+                       for store in config['stores']},
+            'report': None
+        }
+        
+        threading.Thread(target=run_fleet, args=(config, tasks), daemon=True).start()
+        
+        return jsonify({
+            'success': True,
+            'message': f'Fleet run started for {len(config["stores"])} stores ({", ".join(tasks)})'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+
+@app.route('/fleet-status')
+def get_fleet_status():
+    """Get current fleet run status"""
+    return jsonify(fleet_status)
 
 
 def open_browser():
     """Open browser automatically"""
-    webbrowser.open_new('http://localhost:5000')
+    import webbrowser
+    
+    webbrowser.open_new(f'http://{SERVER_HOST}:{SERVER_PORT}')
+    startup_metrics['browser_opened'] = time.time()
 
 
 def main():
     """Main entry point"""
+    from werkzeug.serving import make_server
+    
+    startup_metrics['imported'] = time.time()
     print("=" * 80)
     print("NAGACHECK - DATABASE MAINTENANCE & DATA MANAGEMENT TOOL")
     print("=" * 80)
-    print("Starting Flask server on http://localhost:5000")
-    print("Browser will open automatically in 2 seconds...")
+    print(f"Starting Flask server on http://{SERVER_HOST}:{SERVER_PORT}")
     print("=" * 80)
     
-    # Auto-open browser after 2 seconds
-    Timer(2, open_browser).start()
+    # Bind the socket first: the browser is opened only once the port is listening
+    try:
+        server = make_server(SERVER_HOST, SERVER_PORT, app, threaded=True)
+    except OSError as e:
+        print(f"[ERROR] Cannot listen on port {SERVER_PORT}: {str(e)}")
+        print("[ERROR] Is NagaCheck already running? Close it or free the port, then start again.")
+        return
+    startup_metrics['server_ready'] = time.time()
+    print(f"[STARTUP] Server ready in {startup_metrics['server_ready'] - APP_LOAD_STARTED:.2f}s, opening browser...")
+    
+    # Pre-render the page so the first request is served from memory
+    with app.test_request_context('/'):
+        render_index()
+    
+    threading.Thread(target=open_browser, daemon=True).start()
+    start_growth_sampler()
     
     # Run Flask app
-    app.run(host='localhost', port=5000, debug=False, use_reloader=False)
+    server.serve_forever()
 
 
 if __name__ == '__main__':
@@ -50,6 +50,36 @@ function clearAlerts() {
     document.getElementById('alertContainer').innerHTML = '';
 }
 
+// Cancellable operations: the client picks the operation id, so CANCEL works while the request is still running
+function startOperation(cancelBtnId, kind) {
+    const operationId = `${kind}_${Date.now()}_${Math.random().toString(16).slice(2, 8)}`;
+    const cancelBtn = document.getElementById(cancelBtnId);
+    cancelBtn.dataset.operationId = operationId;
+    cancelBtn.disabled = false;
+    cancelBtn.style.display = 'inline-block';
+    return operationId;
+}
+
+function finishOperation(cancelBtnId) {
+    document.getElementById(cancelBtnId).style.display = 'none';
+}
+
+// Cancel Buttons - KILL QUERY the running statement, the server rolls back
+document.querySelectorAll('.cancel-operation-btn').forEach(cancelBtn => {
+    cancelBtn.addEventListener('click', async function() {
+        this.disabled = true;
+        
+        try {
+            const response = await fetch(`/cancel/${this.dataset.operationId}`, {method: 'POST'});
+            const result = await response.json();
+            showAlert(result.message, result.success ? 'warning' : 'danger');
+        } catch (error) {
+            showAlert('Cancel failed: ' + error.message, 'danger');
+            this.disabled = false;
+        }
+    });
+});
+
 // Test Connection
 document.getElementById('testConnectionBtn').addEventListener('click', async function() {
     const btn = this;
@@ -131,6 +161,7 @@ document.getElementById('loadTablesBtn').addEventListener('click', async functio
             document.getElementById('tableSection').style.display = 'block';
             document.getElementById('processBtn').disabled = false;
             showAlert(`✓ Loaded ${result.tables.length} tables successfully!`, 'success');
+            checkUnfinishedRun();
         } else {
             showAlert(result.message || 'Failed to load tables', 'danger');
         }
@@ -147,7 +178,7 @@ document.getElementById('loadTablesBtn').addEventListener('click', async functio
 // Display tables in list
 function displayTables(tables) {
     const tableList = document.getElementById('tableList');
-    tableList.innerHTML = '';
+    const fragment = document.createDocumentFragment();
     
     tables.forEach((table, index) => {
         const row = document.createElement('tr');
@@ -167,9 +198,11 @@ function displayTables(tables) {
             <td class="text-end">${table.rows ? table.rows.toLocaleString() : '0'}</td>
             <td class="text-end">${table.size || '-'}</td>
         `;
-        tableList.appendChild(row);
+        fragment.appendChild(row);
     });
     
+    tableList.replaceChildren(fragment);
+    
     // Update process button state
     updateProcessButtonState();
 }
@@ -254,9 +287,13 @@ document.getElementById('maintenanceForm').addEventListener('submit', async func
         user: document.getElementById('user').value,
         password: document.getElementById('password').value,
         database: document.getElementById('database').value,
-        tables: selectedTables
+        tables: selectedTables,
+        include_deferred: document.getElementById('includeDeferredCheckbox').checked,
+        operation_id: startOperation('cancelMaintenanceBtn', 'maintenance')
     };
     
+    const stopFollowing = followMaintenanceStatus();
+    
     try {
         // Start maintenance
         const response = await fetch('/start-maintenance', {
@@ -270,7 +307,7 @@ document.getElementById('maintenanceForm').addEventListener('submit', async func
         const result = await response.json();
         
         if (result.success) {
-            showAlert(result.message, 'success');
+            showAlert(result.message, result.cancelled || result.deferred_only ? 'warning' : 'success');
             
             // Display results
             displayResults(result.results);
@@ -279,7 +316,8 @@ document.getElementById('maintenanceForm').addEventListener('submit', async func
             document.getElementById('openFolderBtn').style.display = 'block';
             
             // Update progress to 100%
-            updateProgress(100, selectedTables.length, selectedTables.length, 'Maintenance completed!');
+            updateProgress(100, selectedTables.length, selectedTables.length,
+                           result.deferred_only ? 'Maintenance deferred' : 'Maintenance completed!');
             
         } else {
             showAlert(result.message, 'danger');
@@ -288,16 +326,105 @@ document.getElementById('maintenanceForm').addEventListener('submit', async func
     } catch (error) {
         showAlert('Maintenance failed: ' + error.message, 'danger');
     } finally {
+        stopFollowing();
         // Re-enable button
         processBtn.disabled = false;
         processBtn.innerHTML = originalHTML;
+        finishOperation('cancelMaintenanceBtn');
+        checkUnfinishedRun();
     }
 });
 
+// Show the resume button when the journal has an unfinished run for this database
+async function checkUnfinishedRun() {
+    const resumeBtn = document.getElementById('resumeRunBtn');
+    resumeBtn.style.display = 'none';
+    
+    try {
+        const response = await fetch('/maintenance-runs');
+        const result = await response.json();
+        
+        const host = document.getElementById('host').value;
+        const database = document.getElementById('database').value;
+        const run = (result.runs || []).find(r => !r.finished && r.remaining > 0 && r.host === host && r.database === database);
+        
+        if (run) {
+            resumeBtn.dataset.runId = run.run_id;
+            document.getElementById('resumeRunInfo').textContent = `(${run.done}/${run.tables} done, ${run.started_at})`;
+            resumeBtn.style.display = 'block';
+        }
+    } catch (error) {
+        console.error('[MAINTENANCE] Failed to list runs:', error);
+    }
+}
+
+// Resume Unfinished Run Button - skip tables the journal already finished
+document.getElementById('resumeRunBtn').addEventListener('click', async function() {
+    const btn = this;
+    const originalHTML = btn.innerHTML;
+    
+    btn.disabled = true;
+    btn.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Resuming...';
+    
+    clearAlerts();
+    document.getElementById('progressSection').style.display = 'block';
+    const stopFollowing = followMaintenanceStatus();
+    
+    try {
+        const response = await fetch('/resume-maintenance', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                run_id: btn.dataset.runId,
+                operation_id: startOperation('cancelMaintenanceBtn', 'maintenance'),
+                host: document.getElementById('host').value,
+                user: document.getElementById('user').value,
+                password: document.getElementById('password').value,
+                database: document.getElementById('database').value
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            showAlert(result.message, result.cancelled ? 'warning' : 'success');
+            displayResults(result.results);
+            document.getElementById('openFolderBtn').style.display = 'block';
+            updateProgress(100, result.results.length, result.results.length, 'Maintenance completed!');
+        } else {
+            showAlert(result.message, 'danger');
+        }
+        
+    } catch (error) {
+        showAlert('Resume failed: ' + error.message, 'danger');
+    } finally {
+        stopFollowing();
+        btn.disabled = false;
+        btn.innerHTML = originalHTML;
+        finishOperation('cancelMaintenanceBtn');
+        checkUnfinishedRun();
+    }
+});
+
+// Live progress of the running maintenance: the server pushes one event per change with only the new results
+function followMaintenanceStatus() {
+    if (!window.EventSource) return () => {};
+    
+    const source = new EventSource('/maintenance-status-stream');
+    source.onmessage = function(e) {
+        const status = JSON.parse(e.data);
+        if (!status.is_running) return;  // the previous run's state until this run starts
+        updateProgress(status.percentage, status.current, status.total, status.message);
+    };
+    return () => source.close();
+}
+
 // Display maintenance results
 function displayResults(results) {
     const resultsList = document.getElementById('resultsList');
-    resultsList.innerHTML = '';
+    const fragment = document.createDocumentFragment();
     
     results.forEach(result => {
         const row = document.createElement('tr');
@@ -322,17 +449,29 @@ function displayResults(results) {
             actionBadge = '<span class="badge bg-info">REPAIR + OPTIMIZE</span>';
         } else if (result.action === 'OPTIMIZE') {
             actionBadge = '<span class="badge bg-primary">OPTIMIZE</span>';
+        } else if (result.action === 'REPAIR + ANALYZE') {
+            actionBadge = '<span class="badge bg-info">REPAIR + ANALYZE</span>';
+        } else if (result.action === 'ANALYZE') {
+            actionBadge = '<span class="badge bg-secondary">ANALYZE</span>';
         }
         
+        // Check mode, optimize strategy and timing, so the choices can be compared
+        const timing = result.check_mode
+            ? `<br><small class="text-muted">CHECK ${result.check_mode} · ${result.strategy || '-'} · ${result.seconds.toFixed(1)}s</small>`
+            : '';
+        
         row.innerHTML = `
             <td>${result.table}</td>
             <td>${statusBadge}</td>
             <td>${actionBadge}</td>
-            <td>${result.result}</td>
+            <td>${result.result}${timing}</td>
         `;
-        resultsList.appendChild(row);
+        fragment.appendChild(row);
     });
     
+    // Attach all rows in one DOM update
+    resultsList.replaceChildren(fragment);
+    
     // Show results section
     document.getElementById('resultsSection').style.display = 'block';
 }
@@ -582,7 +721,8 @@ document.getElementById('confirmFixingBtn').addEventListener('click', async func
         password: document.getElementById('password2').value,
         database: document.getElementById('database2').value,
         checkDate: checkDate,
-        monthlyTable: monthlyTable
+        monthlyTable: monthlyTable,
+        operation_id: startOperation('cancelFixSaldoBtn', 'fix_saldo')
     };
     
     try {
@@ -607,6 +747,11 @@ document.getElementById('confirmFixingBtn').addEventListener('click', async func
             
             // Show success alert
             showAlert(result.message, 'success');
+        } else if (result.cancelled) {
+            progressMessage.className = 'alert alert-warning';
+            progressMessage.innerHTML = `<i class="bi bi-x-octagon me-2"></i>${result.message}`;
+            
+            showAlert(result.message, 'warning');
         } else {
             progressMessage.className = 'alert alert-danger';
             progressMessage.innerHTML = `<i class="bi bi-x-circle-fill me-2"></i>${result.message}`;
@@ -624,6 +769,7 @@ document.getElementById('confirmFixingBtn').addEventListener('click', async func
         // Re-enable button
         btn.disabled = false;
         btn.innerHTML = originalHTML;
+        finishOperation('cancelFixSaldoBtn');
     }
 });
 
@@ -716,6 +862,68 @@ document.getElementById('confirmCreateTableBtn').addEventListener('click', async
 });
 
 
+// ============================================================================
+// SSE STREAM WORKER
+// ============================================================================
+
+// Run a POST event stream in a Web Worker; UI updates are applied at most once per animation frame
+function streamWithWorker(url, body, handlers) {
+    return new Promise((resolve, reject) => {
+        const worker = new Worker(document.body.dataset.sseWorker || '/static/js/sse_worker.js');
+        let pendingProgress = null;
+        let pendingWarnings = [];
+        let frame = null;
+        
+        const applyPending = () => {
+            frame = null;
+            if (pendingProgress && handlers.onProgress) handlers.onProgress(pendingProgress);
+            if (handlers.onWarning) pendingWarnings.forEach(handlers.onWarning);
+            pendingProgress = null;
+            pendingWarnings = [];
+        };
+        
+        const finish = () => {
+            if (frame) {
+                cancelAnimationFrame(frame);
+                applyPending();
+            }
+            worker.terminate();
+        };
+        
+        worker.onmessage = function(e) {
+            const message = e.data;
+            
+            if (message.type === 'batch') {
+                if (message.progress) pendingProgress = message.progress;
+                pendingWarnings.push(...message.warnings);
+                if (!frame) frame = requestAnimationFrame(applyPending);
+            } else if (message.type === 'complete') {
+                finish();
+                handlers.onComplete(message.data);
+                resolve();
+            } else if (message.type === 'error') {
+                finish();
+                handlers.onError(message.data);
+                resolve();
+            } else if (message.type === 'done') {
+                finish();
+                resolve();
+            } else if (message.type === 'fetch_error') {
+                finish();
+                reject(new Error(message.message));
+            }
+        };
+        
+        worker.onerror = function(e) {
+            finish();
+            reject(new Error(e.message || 'Stream worker failed'));
+        };
+        
+        worker.postMessage({url: url, body: body});
+    });
+}
+
+
 // ============================================================================
 // TOOL 3: SMART AUDIT TOKO
 // ============================================================================
@@ -774,150 +982,103 @@ document.getElementById('confirmAuditBtn').addEventListener('click', async funct
         host: document.getElementById('host3').value,
         user: document.getElementById('user3').value,
         password: document.getElementById('password3').value,
-        database: document.getElementById('database3').value
+        database: document.getElementById('database3').value,
+        shards: parseInt(document.getElementById('auditShards').value, 10) || 1,
+        compact: true,
+        operation_id: startOperation('cancelAuditBtn', 'audit')
     };
     
     try {
-        // Use fetch with streaming response
-        const response = await fetch('/smart-audit-stream', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(formData)
-        });
-        
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-        
-        while (true) {
-            const {done, value} = await reader.read();
-            
-            if (done) break;
-            
-            buffer += decoder.decode(value, {stream: true});
-            
-            // Process complete messages (separated by double newlines)
-            let lines = buffer.split('\n\n');
-            buffer = lines.pop(); // Keep the incomplete line in the buffer
-            
-            for (let line of lines) {
-                if (line.startsWith('data: ')) {
-                    const jsonStr = line.substring(6);
-                    try {
-                        const data = JSON.parse(jsonStr);
-                        console.log('[AUDIT] Received:', data);
-                        
-                        if (data.error) {
-                            // Error occurred
-                            document.getElementById('auditProgressSection').style.display = 'none';
-                            showAlert(data.message, 'danger');
-                            btn.disabled = false;
-                            btn.innerHTML = originalHTML;
-                            return;
-                        } else if (data.type === 'progress') {
-                            // Handle different progress steps
-                            if (data.step === 'query' || data.step === 'query_phase2') {
-                                const percent = data.step === 'query' ? 5 : 50;
-                                progressBar.style.width = percent + '%';
-                                progressText.textContent = percent + '%';
-                                progressStatus.textContent = data.message;
-                            } else if (data.step === 'start_phase1') {
-                                progressBar.style.width = '10%';
-                                progressText.textContent = '10%';
-                                progressStatus.textContent = data.message;
-                            } else if (data.step === 'processing_phase1') {
-                                // Phase 1: 10% - 50%
-                                const percent = Math.min(10 + Math.round((data.current / data.total) * 40), 50);
-                                progressBar.style.width = percent + '%';
-                                progressText.textContent = percent + '%';
-                                progressStatus.textContent = data.message || `Phase 1: ${data.current}/${data.total} - ${data.kode_barang}`;
-                            } else if (data.step === 'start_phase2') {
-                                progressBar.style.width = '55%';
-                                progressText.textContent = '55%';
-                                progressStatus.textContent = data.message;
-                            } else if (data.step === 'processing_phase2') {
-                                // Phase 2: 55% - 95%
-                                const percent = Math.min(55 + Math.round((data.current / data.total) * 40), 95);
-                                progressBar.style.width = percent + '%';
-                                progressText.textContent = percent + '%';
-                                progressStatus.textContent = data.message || `Phase 2: ${data.current}/${data.total} - ${data.kode_barang}`;
-                            }
-                        } else if (data.type === 'complete') {
-                            // Audit completed
-                            progressBar.style.width = '100%';
-                            progressText.textContent = '100%';
-                            progressStatus.textContent = 'Audit completed!';
-                            
-                            console.log('[AUDIT] Complete! Summary:', data.summary);
-                            
-                            // Update Phase 1 summary cards
-                            document.getElementById('summaryTmBarang').textContent = data.summary.phase1.total_tm_barang.toLocaleString();
-                            document.getElementById('summaryMatchTmToTt').textContent = data.summary.phase1.match_tm_to_tt.toLocaleString();
-                            document.getElementById('summaryNotFoundTmToTt').textContent = data.summary.phase1.not_found.toLocaleString();
-                            document.getElementById('summaryDuplicateTmToTt').textContent = data.summary.phase1.duplicate.toLocaleString();
-                            
-                            // Update Phase 2 summary cards
-                            document.getElementById('summaryTtBarang').textContent = data.summary.phase2.total_tt_barang.toLocaleString();
-                            document.getElementById('summaryMatchTtToTm').textContent = data.summary.phase2.match_tt_to_tm.toLocaleString();
-                            document.getElementById('summaryNotFoundTtToTm').textContent = data.summary.phase2.not_found.toLocaleString();
-                            document.getElementById('summaryDuplicateTtToTm').textContent = data.summary.phase2.duplicate.toLocaleString();
-                            
-                            // Update total issues count
-                            document.getElementById('totalIssuesCount').textContent = data.summary.total_issues.toLocaleString();
-                            
-                            // Display issues in table
-                            displayAuditResults(data.issues);
-                            
-                            // Store issues globally for fixing
-                            window.auditIssues = data.issues;
-                            window.auditFormData = formData;
-                            
-                            // Show/hide fix button based on fixable issues
-                            const fixableIssues = data.issues.filter(issue => 
-                                issue.issue === 'TM_DUPLICATE_IN_TT' || issue.issue === 'TM_NOT_IN_TT'
-                            );
-                            
-                            if (fixableIssues.length > 0) {
-                                document.getElementById('fixIssuesSection').style.display = 'block';
-                            } else {
-                                document.getElementById('fixIssuesSection').style.display = 'none';
-                            }
-                            
-                            // Hide progress, show results
-                            setTimeout(() => {
-                                document.getElementById('auditProgressSection').style.display = 'none';
-                                document.getElementById('auditResultsSection').style.display = 'block';
-                                
-                                // Show summary alert
-                                const totalIssues = data.summary.total_issues;
-                                if (totalIssues === 0) {
-                                    showAlert('✓ Audit completed! No issues found. All data is consistent in both directions.', 'success');
-                                } else {
-                                    showAlert(`⚠ Audit completed! Found ${totalIssues} issue(s). Please review the results below.`, 'warning');
-                                }
-                                
-                                // Re-enable button
-                                btn.disabled = false;
-                                btn.innerHTML = originalHTML;
-                            }, 500);
-                            
-                            return;
-                        } else if (data.type === 'error') {
-                            // Error during processing
-                            document.getElementById('auditProgressSection').style.display = 'none';
-                            showAlert(data.message, 'danger');
-                            btn.disabled = false;
-                            btn.innerHTML = originalHTML;
-                            return;
-                        }
-                    } catch (parseError) {
-                        console.error('[AUDIT] Parse error:', parseError, 'Data:', jsonStr);
-                    }
+        // Stream is read and parsed in a Web Worker, the page only applies batched updates
+        await streamWithWorker('/smart-audit-stream', formData, {
+            onProgress: data => applyAuditProgress(data, progressBar, progressText, progressStatus),
+            onWarning: data => console.warn('[AUDIT]', data.message),
+            onComplete: data => {
+                // Audit completed
+                progressBar.style.width = '100%';
+                progressText.textContent = '100%';
+                progressStatus.textContent = 'Audit completed!';
+                
+                console.log('[AUDIT] Complete! Summary:', data.summary);
+                
+                // Update Phase 1 summary cards
+                document.getElementById('summaryTmBarang').textContent = data.summary.phase1.total_tm_barang.toLocaleString();
+                document.getElementById('summaryMatchTmToTt').textContent = data.summary.phase1.match_tm_to_tt.toLocaleString();
+                document.getElementById('summaryNotFoundTmToTt').textContent = data.summary.phase1.not_found.toLocaleString();
+                document.getElementById('summaryDuplicateTmToTt').textContent = data.summary.phase1.duplicate.toLocaleString();
+                
+                // Update Phase 2 summary cards
+                document.getElementById('summaryTtBarang').textContent = data.summary.phase2.total_tt_barang.toLocaleString();
+                document.getElementById('summaryMatchTtToTm').textContent = data.summary.phase2.match_tt_to_tm.toLocaleString();
+                document.getElementById('summaryNotFoundTtToTm').textContent = data.summary.phase2.not_found.toLocaleString();
+                document.getElementById('summaryDuplicateTtToTm').textContent = data.summary.phase2.duplicate.toLocaleString();
+                
+                // Update total issues count
+                document.getElementById('totalIssuesCount').textContent = data.summary.total_issues.toLocaleString();
+                
+                // Display issues in table
+                displayAuditResults(data.issues);
+                
+                // Store issues globally for fixing
+                window.auditIssues = data.issues;
+                window.auditFormData = formData;
+                
+                // Export links read the stored job result on the server
+                if (data.job_id) {
+                    document.getElementById('exportAuditCsvBtn').href = `/export/${data.job_id}/issues.csv`;
+                    document.getElementById('exportAuditXlsxBtn').href = `/export/${data.job_id}/issues.xlsx`;
+                    document.getElementById('auditExportSection').style.display = 'block';
+                }
+                
+                // Compare with the previous stored audit of this store
+                const historyInfo = document.getElementById('auditHistoryInfo');
+                if (data.history && data.history.diff) {
+                    const diff = data.history.diff;
+                    historyInfo.textContent = `Since previous audit (run #${data.history.previous_run_id}): ${diff.new.toLocaleString()} new, ${diff.resolved.toLocaleString()} resolved, ${diff.persisting.toLocaleString()} persisting`;
+                    historyInfo.style.display = 'block';
+                } else if (data.history) {
+                    historyInfo.textContent = 'First stored audit for this store, later audits will be compared with it.';
+                    historyInfo.style.display = 'block';
+                } else {
+                    historyInfo.style.display = 'none';
+                }
+                
+                // Show/hide fix button based on fixable issues
+                const fixableIssues = data.issues.filter(issue => 
+                    issue.issue === 'TM_DUPLICATE_IN_TT' || issue.issue === 'TM_NOT_IN_TT'
+                );
+                
+                if (fixableIssues.length > 0) {
+                    document.getElementById('fixIssuesSection').style.display = 'block';
+                } else {
+                    document.getElementById('fixIssuesSection').style.display = 'none';
                 }
+                
+                // Hide progress, show results
+                setTimeout(() => {
+                    document.getElementById('auditProgressSection').style.display = 'none';
+                    document.getElementById('auditResultsSection').style.display = 'block';
+                    
+                    // Show summary alert
+                    const totalIssues = data.summary.total_issues;
+                    if (totalIssues === 0) {
+                        showAlert('✓ Audit completed! No issues found. All data is consistent in both directions.', 'success');
+                    } else {
+                        showAlert(`⚠ Audit completed! Found ${totalIssues} issue(s). Please review the results below.`, 'warning');
+                    }
+                    
+                    // Re-enable button
+                    btn.disabled = false;
+                    btn.innerHTML = originalHTML;
+                }, 500);
+            },
+            onError: data => {
+                document.getElementById('auditProgressSection').style.display = 'none';
+                showAlert(data.message, data.cancelled ? 'warning' : 'danger');
+                btn.disabled = false;
+                btn.innerHTML = originalHTML;
             }
-        }
+        });
         
     } catch (error) {
         console.error('[AUDIT] Fetch error:', error);
@@ -925,13 +1086,133 @@ document.getElementById('confirmAuditBtn').addEventListener('click', async funct
         showAlert('Connection error during audit: ' + error.message, 'danger');
         btn.disabled = false;
         btn.innerHTML = originalHTML;
+    } finally {
+        finishOperation('cancelAuditBtn');
     }
 });
 
+// Apply one (coalesced) audit progress event to the progress bar
+function applyAuditProgress(data, progressBar, progressText, progressStatus) {
+    let percent = null;
+    
+    if (data.step === 'query' || data.step === 'query_phase2') {
+        percent = data.step === 'query' ? 5 : 50;
+    } else if (data.step === 'start_phase1') {
+        percent = 10;
+    } else if (data.step === 'processing_phase1') {
+        // Phase 1: 10% - 50%
+        percent = Math.min(10 + Math.round((data.current / data.total) * 40), 50);
+    } else if (data.step === 'start_phase2') {
+        percent = 55;
+    } else if (data.step === 'processing_phase2') {
+        // Phase 2: 55% - 95%
+        percent = Math.min(55 + Math.round((data.current / data.total) * 40), 95);
+    } else if (data.step === 'shard_progress') {
+        // Sharded audit: aggregated progress over all key ranges
+        percent = data.percent;
+    }
+    
+    if (percent !== null) {
+        progressBar.style.width = percent + '%';
+        progressText.textContent = percent + '%';
+    }
+    if (data.message) {
+        progressStatus.textContent = data.message;
+    }
+}
+
+// ============================================================================
+// VIRTUALIZED AUDIT RESULTS TABLE
+// ============================================================================
+
+const AUDIT_ROW_HEIGHT = 56;    // px, fixed so any row position can be computed
+const AUDIT_ROW_OVERSCAN = 10;  // extra rows rendered above/below the viewport
+
+const auditTable = {
+    issues: [],     // all issues from the server
+    view: [],       // indexes into issues after filter + sort
+    sortKey: null,
+    sortDir: 1,
+    frame: null
+};
+
+// Escape text before putting it into HTML
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    }[ch]));
+}
+
+// Badge style and label for an issue type
+function getIssueBadge(issueType) {
+    switch (issueType) {
+        case 'TM_NOT_IN_TT': return ['badge-danger', 'TM NOT IN TT'];
+        case 'TT_NOT_IN_TM': return ['badge-danger', 'TT NOT IN TM'];
+        case 'TM_DUPLICATE_IN_TT': return ['badge-warning', 'TM DUP IN TT'];
+        case 'TT_DUPLICATE_IN_TM': return ['badge-warning', 'TT DUP IN TM'];
+        case 'NOT_FOUND': return ['badge-danger', 'NOT FOUND'];
+        case 'DUPLICATE': return ['badge-warning', 'DUPLICATE'];
+        default: return ['', ''];
+    }
+}
+
+function getIssueCount(issue) {
+    return issue.count_tt || issue.count_tm || 0;
+}
+
 // Display Audit Results in Table
 function displayAuditResults(issues) {
     console.log('[AUDIT] displayAuditResults called with', issues.length, 'issues');
     
+    auditTable.issues = issues;
+    auditTable.sortKey = null;
+    auditTable.sortDir = 1;
+    
+    // Fill kode_lokasi filter with the distinct values
+    const lokasiFilter = document.getElementById('auditFilterLokasi');
+    const lokasiValues = [...new Set(issues.map(issue => issue.kode_lokasi))].sort();
+    lokasiFilter.innerHTML = '<option value="">All Lokasi</option>' +
+        lokasiValues.map(value => `<option value="${escapeHtml(value)}">${escapeHtml(value)}</option>`).join('');
+    document.getElementById('auditFilterType').value = '';
+    
+    applyAuditFilter();
+}
+
+// Rebuild the filtered + sorted view (O(n log n) once per filter/sort change)
+function applyAuditFilter() {
+    const type = document.getElementById('auditFilterType').value;
+    const lokasi = document.getElementById('auditFilterLokasi').value;
+    const issues = auditTable.issues;
+    
+    const view = [];
+    for (let i = 0; i < issues.length; i++) {
+        if (type && issues[i].issue !== type) continue;
+        if (lokasi && issues[i].kode_lokasi !== lokasi) continue;
+        view.push(i);
+    }
+    
+    if (auditTable.sortKey) {
+        const key = auditTable.sortKey;
+        const dir = auditTable.sortDir;
+        const valueOf = key === 'count' ? (i => getIssueCount(issues[i])) : (i => String(issues[i][key] ?? ''));
+        view.sort((a, b) => {
+            const va = valueOf(a);
+            const vb = valueOf(b);
+            return (va < vb ? -1 : va > vb ? 1 : a - b) * dir;
+        });
+    }
+    
+    auditTable.view = view;
+    document.getElementById('auditFilterCount').textContent =
+        `${view.length.toLocaleString()} / ${issues.length.toLocaleString()}`;
+    
+    document.getElementById('auditResultsScroll').scrollTop = 0;
+    renderAuditRows();
+}
+
+// Render only the rows inside the viewport (+ overscan), spacer rows keep the scroll height
+function renderAuditRows() {
+    const container = document.getElementById('auditResultsScroll');
     const tableBody = document.getElementById('auditResultsTableBody');
     
     if (!tableBody) {
@@ -939,9 +1220,7 @@ function displayAuditResults(issues) {
         return;
     }
     
-    tableBody.innerHTML = '';
-    
-    if (issues.length === 0) {
+    if (auditTable.issues.length === 0) {
         tableBody.innerHTML = `
             <tr>
                 <td colspan="5" class="text-center py-4">
@@ -953,43 +1232,71 @@ function displayAuditResults(issues) {
         return;
     }
     
-    issues.forEach((issue, index) => {
-        let badgeClass = '';
-        let badgeText = '';
-        let countValue = issue.count_tt || issue.count_tm || 0;
-        
-        // Determine badge style based on issue type
-        if (issue.issue === 'TM_NOT_IN_TT' || issue.issue === 'TT_NOT_IN_TM') {
-            badgeClass = 'badge-danger';
-            badgeText = issue.issue === 'TM_NOT_IN_TT' ? 'TM NOT IN TT' : 'TT NOT IN TM';
-        } else if (issue.issue === 'TM_DUPLICATE_IN_TT' || issue.issue === 'TT_DUPLICATE_IN_TM') {
-            badgeClass = 'badge-warning';
-            badgeText = issue.issue === 'TM_DUPLICATE_IN_TT' ? 'TM DUP IN TT' : 'TT DUP IN TM';
-        } else if (issue.issue === 'NOT_FOUND') {
-            badgeClass = 'badge-danger';
-            badgeText = 'NOT FOUND';
-        } else if (issue.issue === 'DUPLICATE') {
-            badgeClass = 'badge-warning';
-            badgeText = 'DUPLICATE';
-        }
+    const view = auditTable.view;
+    if (view.length === 0) {
+        tableBody.innerHTML = '<tr><td colspan="5" class="text-center text-muted py-3">No issues match the filter.</td></tr>';
+        return;
+    }
+    
+    const viewportHeight = container.clientHeight || 500;
+    const first = Math.max(0, Math.floor(container.scrollTop / AUDIT_ROW_HEIGHT) - AUDIT_ROW_OVERSCAN);
+    const last = Math.min(view.length, first + Math.ceil(viewportHeight / AUDIT_ROW_HEIGHT) + AUDIT_ROW_OVERSCAN * 2);
+    
+    const parts = [];
+    if (first > 0) {
+        parts.push(`<tr class="virtual-spacer"><td colspan="5" style="height: ${first * AUDIT_ROW_HEIGHT}px;"></td></tr>`);
+    }
+    
+    for (let position = first; position < last; position++) {
+        const index = view[position];
+        const issue = auditTable.issues[index];
+        const [badgeClass, badgeText] = getIssueBadge(issue.issue);
         
-        const row = `
-            <tr>
+        parts.push(`
+            <tr class="virtual-row">
                 <td>${index + 1}</td>
-                <td><code>${issue.kode_barang}</code></td>
-                <td><code>${issue.kode_lokasi}</code></td>
-                <td class="text-center">${countValue}</td>
+                <td><code>${escapeHtml(issue.kode_barang)}</code></td>
+                <td><code>${escapeHtml(issue.kode_lokasi)}</code></td>
+                <td class="text-center">${getIssueCount(issue)}</td>
                 <td>
                     <span class="badge ${badgeClass}">${badgeText}</span>
                     <br>
-                    <small class="text-muted">${issue.issue_text}</small>
+                    <small class="text-muted">${escapeHtml(issue.issue_text)}</small>
                 </td>
             </tr>
-        `;
-        
-        tableBody.innerHTML += row;
-    });
+        `);
+    }
+    
+    if (last < view.length) {
+        parts.push(`<tr class="virtual-spacer"><td colspan="5" style="height: ${(view.length - last) * AUDIT_ROW_HEIGHT}px;"></td></tr>`);
+    }
+    
+    tableBody.innerHTML = parts.join('');
 }
+
+// Re-render at most once per animation frame while scrolling
+document.getElementById('auditResultsScroll').addEventListener('scroll', function() {
+    if (auditTable.frame) return;
+    auditTable.frame = requestAnimationFrame(() => {
+        auditTable.frame = null;
+        renderAuditRows();
+    });
+});
+
+document.getElementById('auditFilterType').addEventListener('change', applyAuditFilter);
+document.getElementById('auditFilterLokasi').addEventListener('change', applyAuditFilter);
+
+// Sortable headers
+document.querySelectorAll('#auditResultsScroll th[data-sort]').forEach(th => {
+    th.style.cursor = 'pointer';
+    th.addEventListener('click', function() {
+        const key = this.dataset.sort;
+        auditTable.sortDir = auditTable.sortKey === key ? -auditTable.sortDir : 1;
+        auditTable.sortKey = key;
+        applyAuditFilter();
+    });
+});
+
 // Fix Issues Button - Show Confirmation Modal
 document.getElementById('fixIssuesBtn').addEventListener('click', function() {
     const fixableIssues = window.auditIssues.filter(issue => 
@@ -1036,114 +1343,75 @@ document.getElementById('confirmFixSmartAuditBtn').addEventListener('click', asy
         user: window.auditFormData.user,
         password: window.auditFormData.password,
         database: window.auditFormData.database,
-        issues: window.auditIssues
+        // Only fixable issues are sent, in the columnar wire format
+        issues_compact: encodeAuditIssues(window.auditIssues.filter(issue =>
+            issue.issue === 'TM_DUPLICATE_IN_TT' || issue.issue === 'TM_NOT_IN_TT'
+        )),
+        operation_id: startOperation('cancelFixingBtn', 'fix')
     };
     
     try {
-        // Use fetch with streaming response
-        const response = await fetch('/fix-smart-audit-stream', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
+        // Stream is read and parsed in a Web Worker, the page only applies batched updates
+        await streamWithWorker('/fix-smart-audit-stream', requestData, {
+            onProgress: data => {
+                // Handle different progress steps
+                let percent = null;
+                if (data.step === 'start') {
+                    percent = 5;
+                } else if (data.step === 'fixing_duplicates') {
+                    percent = 10;
+                } else if (data.step === 'inserting_missing') {
+                    percent = 50;
+                } else if (data.step === 'processing') {
+                    percent = data.percent;
+                }
+                if (percent !== null) {
+                    progressBar.style.width = percent + '%';
+                    progressText.textContent = percent + '%';
+                }
+                progressStatus.textContent = data.message;
             },
-            body: JSON.stringify(requestData)
-        });
-        
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-        
-        while (true) {
-            const {done, value} = await reader.read();
-            
-            if (done) break;
-            
-            buffer += decoder.decode(value, {stream: true});
-            
-            // Process complete messages (separated by double newlines)
-            let lines = buffer.split('\n\n');
-            buffer = lines.pop(); // Keep the incomplete line in the buffer
-            
-            for (let line of lines) {
-                if (line.startsWith('data: ')) {
-                    const jsonStr = line.substring(6);
-                    try {
-                        const data = JSON.parse(jsonStr);
-                        console.log('[FIXING] Received:', data);
-                        
-                        if (data.error) {
-                            // Error occurred
-                            document.getElementById('fixingProgressSection').style.display = 'none';
-                            showAlert(data.message, 'danger');
-                            btn.disabled = false;
-                            btn.innerHTML = originalHTML;
-                            return;
-                        } else if (data.type === 'progress') {
-                            // Handle different progress steps
-                            if (data.step === 'start') {
-                                progressBar.style.width = '5%';
-                                progressText.textContent = '5%';
-                                progressStatus.textContent = data.message;
-                            } else if (data.step === 'fixing_duplicates') {
-                                progressBar.style.width = '10%';
-                                progressText.textContent = '10%';
-                                progressStatus.textContent = data.message;
-                            } else if (data.step === 'inserting_missing') {
-                                progressBar.style.width = '50%';
-                                progressText.textContent = '50%';
-                                progressStatus.textContent = data.message;
-                            } else if (data.step === 'processing') {
-                                progressBar.style.width = data.percent + '%';
-                                progressText.textContent = data.percent + '%';
-                                progressStatus.textContent = data.message;
-                            }
-                        } else if (data.type === 'warning') {
-                            // Warning during processing
-                            console.warn('[FIXING]', data.message);
-                        } else if (data.type === 'complete') {
-                            // Fixing completed
-                            progressBar.style.width = '100%';
-                            progressText.textContent = '100%';
-                            progressStatus.textContent = 'Fixing completed!';
-                            
-                            console.log('[FIXING] Complete! Result:', data.result);
-                            
-                            // Update fixing results display
-                            document.getElementById('duplicatesDeleted').textContent = data.result.duplicates_deleted.toLocaleString();
-                            document.getElementById('missingInserted').textContent = data.result.missing_inserted.toLocaleString();
-                            document.getElementById('totalFixed').textContent = data.result.total_fixed.toLocaleString();
-                            
-                            // Hide progress, show results
-                            setTimeout(() => {
-                                document.getElementById('fixingProgressSection').style.display = 'none';
-                                document.getElementById('fixingResultsSection').style.display = 'block';
-                                
-                                // Show success alert
-                                showAlert(`✓ Fixing completed! ${data.result.total_fixed} issue(s) fixed successfully. (Duplicates deleted: ${data.result.duplicates_deleted}, Missing inserted: ${data.result.missing_inserted})`, 'success');
-                                
-                                // Hide fix button after successful fix
-                                document.getElementById('fixIssuesSection').style.display = 'none';
-                                
-                                // Re-enable button
-                                btn.disabled = false;
-                                btn.innerHTML = originalHTML;
-                            }, 500);
-                            
-                            return;
-                        } else if (data.type === 'error') {
-                            // Error during processing
-                            document.getElementById('fixingProgressSection').style.display = 'none';
-                            showAlert(data.message, 'danger');
-                            btn.disabled = false;
-                            btn.innerHTML = originalHTML;
-                            return;
-                        }
-                    } catch (parseError) {
-                        console.error('[FIXING] Parse error:', parseError, 'Data:', jsonStr);
+            onWarning: data => console.warn('[FIXING]', data.message),
+            onComplete: data => {
+                // Fixing completed
+                progressBar.style.width = '100%';
+                progressText.textContent = '100%';
+                progressStatus.textContent = 'Fixing completed!';
+                
+                console.log('[FIXING] Complete! Result:', data.result);
+                
+                // Update fixing results display
+                document.getElementById('duplicatesDeleted').textContent = data.result.duplicates_deleted.toLocaleString();
+                document.getElementById('missingInserted').textContent = data.result.missing_inserted.toLocaleString();
+                document.getElementById('totalFixed').textContent = data.result.total_fixed.toLocaleString();
+                
+                // Hide progress, show results
+                setTimeout(() => {
+                    document.getElementById('fixingProgressSection').style.display = 'none';
+                    document.getElementById('fixingResultsSection').style.display = 'block';
+                    
+                    // Show success alert
+                    if (data.result.cancelled) {
+                        showAlert(`Fixing cancelled. ${data.result.total_fixed} issue(s) fixed before the cancel. (Duplicates deleted: ${data.result.duplicates_deleted}, Missing inserted: ${data.result.missing_inserted})`, 'warning');
+                    } else {
+                        showAlert(`✓ Fixing completed! ${data.result.total_fixed} issue(s) fixed successfully. (Duplicates deleted: ${data.result.duplicates_deleted}, Missing inserted: ${data.result.missing_inserted})`, 'success');
                     }
-                }
+                    
+                    // Hide fix button after successful fix
+                    document.getElementById('fixIssuesSection').style.display = 'none';
+                    
+                    // Re-enable button
+                    btn.disabled = false;
+                    btn.innerHTML = originalHTML;
+                }, 500);
+            },
+            onError: data => {
+                document.getElementById('fixingProgressSection').style.display = 'none';
+                showAlert(data.message, 'danger');
+                btn.disabled = false;
+                btn.innerHTML = originalHTML;
             }
-        }
+        });
         
     } catch (error) {
         console.error('[FIXING] Fetch error:', error);
@@ -1151,5 +1419,92 @@ document.getElementById('confirmFixSmartAuditBtn').addEventListener('click', asy
         showAlert('Connection error during fixing: ' + error.message, 'danger');
         btn.disabled = false;
         btn.innerHTML = originalHTML;
+    } finally {
+        finishOperation('cancelFixingBtn');
+    }
+});
+
+
+// ============================================================================
+// LOG SEARCH
+// ============================================================================
+
+document.getElementById('logSearchForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    
+    const searchBtn = document.getElementById('logSearchBtn');
+    const kind = document.getElementById('logKind').value;
+    const formData = {
+        kode_barang: document.getElementById('logKodeBarang').value,
+        kode_lokasi: document.getElementById('logKodeLokasi').value,
+        table: document.getElementById('logTable').value,
+        text: document.getElementById('logText').value,
+        database: document.getElementById('logDatabase').value,
+        date_from: document.getElementById('logDateFrom').value,
+        date_to: document.getElementById('logDateTo').value,
+        kinds: kind ? [kind] : null
+    };
+    
+    searchBtn.disabled = true;
+    
+    try {
+        const response = await fetch('/log-search', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(formData)
+        });
+        
+        const result = await response.json();
+        
+        if (!result.success) {
+            showAlert(result.message || 'Log search failed', 'danger');
+            return;
+        }
+        
+        const shown = result.results.length < result.total ? ` (showing newest ${result.results.length})` : '';
+        document.getElementById('logSearchSummary').textContent = result.message + shown;
+        document.getElementById('logSearchTableBody').innerHTML = result.results.map(row => `
+            <tr>
+                <td class="text-nowrap">${escapeHtml(row.logged_at)}</td>
+                <td class="text-nowrap" title="${escapeHtml(row.name)}">${escapeHtml(row.kind)}</td>
+                <td>${escapeHtml(row.database_name || '-')}</td>
+                <td><code>${escapeHtml(row.line.trim())}</code> <small class="text-muted">#${row.line_no}</small></td>
+            </tr>
+        `).join('');
+        document.getElementById('logSearchResults').style.display = 'block';
+        
+    } catch (error) {
+        showAlert('Error: ' + error.message, 'danger');
+    } finally {
+        searchBtn.disabled = false;
     }
-});
\ No newline at end of file
+});
+
+
+// ============================================================================
+// STARTUP METRICS
+// ============================================================================
+
+// Every handler above is attached: the page is interactive from here
+const appInteractiveAt = performance.now();
+
+// Report time-to-interactive; the server prints it and keeps it in data/startup_metrics.jsonl
+window.addEventListener('load', function() {
+    setTimeout(() => {
+        const navigation = performance.getEntriesByType('navigation')[0] || {};
+        
+        fetch('/startup-metrics', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                interactive_ms: Math.round(appInteractiveAt),
+                dom_content_loaded_ms: Math.round(navigation.domContentLoadedEventEnd || 0),
+                load_ms: Math.round(navigation.loadEventEnd || performance.now())
+            })
+        }).catch(error => console.error('[STARTUP] Failed to report metrics:', error));
+    }, 0);
+});
@@ -0,0 +1,104 @@
+// NagaCageur - SSE stream worker
+// Reads a POST event stream off the UI thread: fetch, line splitting and JSON
+// parsing happen here, the page only receives throttled, batched updates.
+
+importScripts('wire_format.js');
+
+const FLUSH_INTERVAL_MS = 50;
+
+let latestProgress = null;  // only the newest progress event matters for the UI
+let warnings = [];
+let eventCount = 0;
+let flushTimer = null;
+
+function flush() {
+    flushTimer = null;
+    if (!latestProgress && warnings.length === 0) return;
+    
+    self.postMessage({type: 'batch', progress: latestProgress, warnings: warnings, events: eventCount});
+    latestProgress = null;
+    warnings = [];
+    eventCount = 0;
+}
+
+function scheduleFlush() {
+    if (!flushTimer) {
+        flushTimer = setTimeout(flush, FLUSH_INTERVAL_MS);
+    }
+}
+
+function handleEvent(data) {
+    eventCount++;
+    
+    if (data.error || data.type === 'error') {
+        flush();
+        self.postMessage({type: 'error', data: data});
+        return true;
+    }
+    if (data.type === 'complete') {
+        // Expand the compact issue payload here so the page gets ready-to-render objects
+        if (data.issues_compact) {
+            data.issues = decodeAuditIssues(data.issues_compact);
+            delete data.issues_compact;
+        }
+        flush();
+        self.postMessage({type: 'complete', data: data});
+        return true;
+    }
+    if (data.type === 'warning') {
+        warnings.push(data);
+    } else if (data.type === 'progress') {
+        latestProgress = data;
+    }
+    scheduleFlush();
+    return false;
+}
+
+self.onmessage = async function(e) {
+    const {url, body} = e.data;
+    
+    try {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(body)
+        });
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const {done, value} = await reader.read();
+            
+            if (done) break;
+            
+            buffer += decoder.decode(value, {stream: true});
+            
+            // Process complete messages (separated by double newlines)
+            const messages = buffer.split('\n\n');
+            buffer = messages.pop(); // Keep the incomplete message in the buffer
+            
+            for (const message of messages) {
+                if (!message.startsWith('data: ')) continue;
+                
+                try {
+                    if (handleEvent(JSON.parse(message.substring(6)))) {
+                        return;
+                    }
+                } catch (parseError) {
+                    console.error('[SSE WORKER] Parse error:', parseError);
+                }
+            }
+        }
+        
+        flush();
+        self.postMessage({type: 'done'});
+        
+    } catch (error) {
+        flush();
+        self.postMessage({type: 'fetch_error', message: error.message});
+    }
+};
@@ -0,0 +1,53 @@
+// NagaCageur - compact wire format for audit issues
+// Shared by the page and sse_worker.js; must stay in sync with AUDIT_ISSUE_CODES in app.py.
+
+const AUDIT_ISSUE_CODES = ['TM_NOT_IN_TT', 'TM_DUPLICATE_IN_TT', 'TT_NOT_IN_TM', 'TT_DUPLICATE_IN_TM'];
+const COMPACT_FORMAT_VERSION = 1;
+
+const AUDIT_ISSUE_TEXT = {
+    'TM_NOT_IN_TT': () => '[TM→TT] Not found in tt_barang_saldo',
+    'TM_DUPLICATE_IN_TT': count => `[TM→TT] Duplicate in tt! Found ${count} records`,
+    'TT_NOT_IN_TM': () => '[TT→TM] Not found in tm_barang',
+    'TT_DUPLICATE_IN_TM': count => `[TT→TM] Duplicate in tm! Found ${count} records`
+};
+
+// Columnar payload -> array of issue objects
+function decodeAuditIssues(compact) {
+    if (compact.v !== COMPACT_FORMAT_VERSION) {
+        throw new Error('Unsupported compact format version: ' + compact.v);
+    }
+    
+    const issues = new Array(compact.kode_barang.length);
+    for (let i = 0; i < issues.length; i++) {
+        const issueType = AUDIT_ISSUE_CODES[compact.issue[i]];
+        const count = compact.count[i];
+        const issue = {
+            kode_barang: compact.kode_barang[i],
+            kode_lokasi: compact.lokasi[compact.kode_lokasi[i]],
+            issue: issueType,
+            issue_text: AUDIT_ISSUE_TEXT[issueType](count)
+        };
+        issue[issueType.startsWith('TM_') ? 'count_tt' : 'count_tm'] = count;
+        issues[i] = issue;
+    }
+    return issues;
+}
+
+// Array of issue objects -> columnar payload (issue_text is rebuilt by the receiver)
+function encodeAuditIssues(issues) {
+    const compact = {v: COMPACT_FORMAT_VERSION, lokasi: [], kode_barang: [], kode_lokasi: [], issue: [], count: []};
+    const lokasiIndex = new Map();
+    
+    for (const issue of issues) {
+        const kodeLokasi = issue.kode_lokasi || '';
+        if (!lokasiIndex.has(kodeLokasi)) {
+            lokasiIndex.set(kodeLokasi, compact.lokasi.length);
+            compact.lokasi.push(kodeLokasi);
+        }
+        compact.kode_barang.push(issue.kode_barang);
+        compact.kode_lokasi.push(lokasiIndex.get(kodeLokasi));
+        compact.issue.push(AUDIT_ISSUE_CODES.indexOf(issue.issue));
+        compact.count.push(issue.count_tt ?? issue.count_tm ?? 0);
+    }
+    return compact;
+}